@@ -0,0 +1,28 @@
+# Multi-worker deployment: gunicorn -c chat-bot/backend/gunicorn.conf.py app:app
+# (run from the repository root so data/index resolves)
+import os
+
+# Load app.py, and with it the model weights and memory-mapped indexes, once in
+# the master before forking. Workers then share those pages copy-on-write, and
+# each runs its own warm-up queries before it reports ready.
+preload_app = True
+os.environ.setdefault('STARTUP_MODE', 'preload')
+
+# Memory-map docs.index, the per-CDP sub-indexes and chunks.bin read-only
+os.environ.setdefault('INDEX_MMAP', '1')
+
+pythonpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = 60
+
+def post_fork(server, worker):
+    # Split the cores between workers so their encoder thread pools don't oversubscribe the CPU
+    from app import query_engine
+    threads = int(os.environ.get('ENCODER_THREADS', 0)) or max(1, (os.cpu_count() or 1) // workers)
+    if query_engine is not None:
+        query_engine.encoder.set_threads(threads)
+    else:
+        # STARTUP_MODE=background: the worker loads its own encoder after the fork
+        os.environ['ENCODER_THREADS'] = str(threads)
@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop surrounding punctuation"""
+    return ' '.join(query.lower().split()).strip(' ?!.,;:')
+
+class ExactCache:
+    """
+    LRU cache of answers with TTL expiry, keyed on the normalized query text
+    unless the caller passes a key of its own
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored_at, result)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, query: str, key: Optional[Hashable] = None) -> Optional[Dict[str, Any]]:
+        """Look up a query; pass key to look it up under that instead of the normalized text"""
+        key = key if key is not None else normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, query: str, result: Dict[str, Any], key: Optional[Hashable] = None) -> None:
+        """Store a query's answer; pass key to store it under that instead of the normalized text"""
+        key = key if key is not None else normalize_query(query)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+class SemanticCache:
+    """
+    Reuses an answer when a new query embedding is within a cosine-similarity
+    threshold of a cached one. Entries only match queries with the same
+    partition key (intent and target CDP), so "how do I X in Segment" never
+    answers "how do I X in Lytics" however close their embeddings are.
+    """
+
+    def __init__(self, dimension: int, max_size: int = 256, ttl: float = 3600.0, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        # Normalized embeddings in preallocated rows, so a lookup is one matrix-vector product
+        self.embeddings = np.zeros((max_size, dimension), dtype=np.float32)
+        self.slots = [None] * max_size  # slot -> (partition_key, stored_at, last_used, result)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, embedding: np.ndarray, partition_key: Hashable) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.lock:
+            similarities = self.embeddings @ embedding
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.threshold:
+                    break
+                entry = self.slots[slot]
+                if entry is None or entry[0] != partition_key:
+                    continue
+                if now - entry[1] > self.ttl:
+                    self._evict(slot)
+                    continue
+                self.slots[slot] = (entry[0], entry[1], now, entry[3])
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+            return None
+
+    def put(self, embedding: np.ndarray, partition_key: Hashable, result: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self.lock:
+            # Use an empty slot if there is one, otherwise replace the least recently used entry
+            free = [slot for slot, entry in enumerate(self.slots) if entry is None]
+            if free:
+                slot = free[0]
+            else:
+                slot = min(range(self.max_size), key=lambda s: self.slots[s][2])
+                self.evictions += 1
+            self.embeddings[slot] = embedding
+            self.slots[slot] = (partition_key, now, now, result)
+
+    def _evict(self, slot: int) -> None:
+        self.embeddings[slot] = 0.0
+        self.slots[slot] = None
+        self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.embeddings[:] = 0.0
+            self.slots = [None] * self.max_size
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'size': sum(entry is not None for entry in self.slots),
+                'max_size': self.max_size,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+class AnswerCache:
+    """
+    Two-tier cache in front of QueryEngine.answer_question. Entries belong to
+    one index generation and are dropped as soon as the engine loads another.
+    """
+
+    def __init__(self, exact: ExactCache, semantic: Optional[SemanticCache] = None):
+        self.exact = exact
+        self.semantic = semantic
+        self.generation = None
+
+    def set_generation(self, generation: Hashable) -> None:
+        """Clear both tiers if the index generation changed"""
+        if generation != self.generation:
+            if self.generation is not None:
+                logging.info("Index changed, clearing answer cache")
+            self.exact.clear()
+            if self.semantic is not None:
+                self.semantic.clear()
+            self.generation = generation
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {'exact': self.exact.stats()}
+        if self.semantic is not None:
+            stats['semantic'] = self.semantic.stats()
+        return stats
@@ -1,17 +1,35 @@
 import os
+import time
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from query_engine import QueryEngine
+from worker_pool import QueryWorkerPool, PoolSaturatedError
+from metrics import Metrics, SamplingProfiler, stats_samples
+from startup import STARTUP_MODES, StartupProgress
+# query_engine, and with it faiss, numpy and the encoder runtime, is imported by load_query_engine
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load or warm up the query engine in a background task, so the port is bound straight away"""
+    if query_engine is None:
+        app.state.loader = asyncio.create_task(load_in_background())
+    else:
+        app.state.loader = asyncio.create_task(warm_up_in_background())
+    yield
+    worker_pool.shutdown()
+    profiler.stop()
+
 # Initialize FastAPI app
-app = FastAPI(title="CDP Support Agent API")
+app = FastAPI(title="CDP Support Agent API", lifespan=lifespan)
 
 # Allow CORS
 app.add_middleware(
@@ -25,6 +43,7 @@ app.add_middleware(
 # Define request and response models
 class QueryRequest(BaseModel):
     query: str
+    timings: bool = False  # Include a per-stage timing breakdown in the response
 
 class SearchResult(BaseModel):
     score: float
@@ -37,33 +56,353 @@ class QueryResponse(BaseModel):
     answer: str
     context: List[SearchResult]
     query_type: str
+    timings: Optional[Dict[str, float]] = None  # Milliseconds per stage, when requested
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+
+# Startup phases and readiness, reported at /api/health/ready
+startup = StartupProgress()
+
+# Shared with the query engine once it is loaded, so request latencies are recorded from the start
+metrics = Metrics()
+
+# Set once loaded; until then, endpoints that need it answer 503
+query_engine = None
+
+def load_query_engine(warm_up: bool = True):
+    """
+    Import the search stack, load the encoder and index, attach the batcher
+    and answer cache, and unless warm_up is False run the warm-up queries
+    """
+    with startup.phase('imports'):
+        from query_engine import QueryEngine
+        from batcher import BatchScheduler
+        from answer_cache import AnswerCache, ExactCache, SemanticCache
+        from encoder import encoder_for_index
+
+    with startup.phase('encoder'):
+        # Without ENCODER_BACKEND, queries are encoded by the backend matching the index
+        encoder = encoder_for_index(
+            'data/index',
+            backend=os.environ.get('ENCODER_BACKEND') or None,
+            model_path=os.environ.get('ENCODER_MODEL_PATH', 'data/encoder/onnx'),
+            threads=int(os.environ.get('ENCODER_THREADS', 0)),
+            max_seq_length=int(os.environ.get('ENCODER_MAX_SEQ_LENGTH', 0)) or None
+        )
+
+    with startup.phase('index'):
+        engine = QueryEngine(use_mmap=os.environ.get('INDEX_MMAP', '0') == '1',
+                             retrieval_mode=os.environ.get('RETRIEVAL_MODE', 'dense'),
+                             encoder=encoder, metrics=metrics)
+
+    with startup.phase('components'):
+        # Coalesce searches from concurrent workers into one encoder call and one index search
+        batch_max_size = int(os.environ.get('BATCH_MAX_SIZE', 1))
+        if batch_max_size > 1:
+            engine.batcher = BatchScheduler(
+                engine,
+                max_batch_size=batch_max_size,
+                max_wait_ms=float(os.environ.get('BATCH_WAIT_MS', 5.0))
+            )
+            logger.info(f"Search batching enabled, up to {batch_max_size} queries per batch")
+
+        # Answer cache: exact matches on the normalized query, then near-duplicate embeddings
+        cache_size = int(os.environ.get('ANSWER_CACHE_SIZE', 1024))
+        if cache_size > 0:
+            cache_ttl = float(os.environ.get('ANSWER_CACHE_TTL', 3600))
+            semantic_cache_size = int(os.environ.get('SEMANTIC_CACHE_SIZE', 256))
+            semantic_cache = None
+            if semantic_cache_size > 0:
+                semantic_cache = SemanticCache(
+                    engine.index.d,
+                    max_size=semantic_cache_size,
+                    ttl=cache_ttl,
+                    threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.95))
+                )
+            engine.answer_cache = AnswerCache(ExactCache(max_size=cache_size, ttl=cache_ttl), semantic_cache)
+            engine.answer_cache.set_generation(engine.generation.fingerprint)
+
+    if warm_up:
+        warm_up_query_engine(engine)
+    return engine
 
-# Initialize the query engine
-try:
-    query_engine = QueryEngine()
+def warm_up_query_engine(engine) -> None:
+    if os.environ.get('STARTUP_WARMUP', '1') == '1':
+        with startup.phase('warmup'):
+            engine.warm_up()
+
+startup_mode = os.environ.get('STARTUP_MODE', 'background')
+if startup_mode not in STARTUP_MODES:
+    raise ValueError(f"Unknown startup mode '{startup_mode}', expected one of {STARTUP_MODES}")
+
+# Under gunicorn's preload_app the master loads everything once and workers share it copy-on-write.
+# Warm-up waits for each worker's startup: encoding in the master would start the encoder
+# runtime's thread pool there, and a thread pool inherited across fork can hang.
+if startup_mode == 'preload':
+    try:
+        query_engine = load_query_engine(warm_up=False)
+        logger.info("Query engine initialized successfully, warm-up runs in each worker")
+    except Exception as e:
+        logger.error(f"Error initializing query engine: {str(e)}")
+        startup.mark_failed(e)
+        raise
+
+# Encoding and FAISS search are CPU-bound, so they run on a bounded pool instead of the event loop
+worker_pool = QueryWorkerPool(
+    max_workers=int(os.environ.get('QUERY_WORKERS', 4)),
+    max_pending=int(os.environ.get('QUERY_MAX_PENDING', 32)),
+    timeout=float(os.environ.get('QUERY_TIMEOUT', 10.0))
+)
+
+# Samples query thread stacks while switched on through /api/admin/profiler
+profiler = SamplingProfiler()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the raw path, keeps the label set small
+    route = getattr(request.scope.get('route'), 'path', 'unmatched')
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                    route=route, method=request.method, status=str(response.status_code))
+    return response
+
+async def watch_index(interval: float):
+    """Hot-reload the index once a rebuilt one on disk has been stable for one polling interval"""
+    last_seen = None
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            fingerprint = query_engine.index_generation()
+        except OSError:
+            continue
+        if fingerprint != last_seen:
+            # Still changing, or just changed: wait for the indexer to finish writing
+            last_seen = fingerprint
+            continue
+        if fingerprint != query_engine.generation.fingerprint:
+            logger.info("Index on disk changed, reloading")
+            try:
+                await asyncio.to_thread(query_engine.reload_resources)
+            except Exception as e:
+                logger.error(f"Error reloading index: {str(e)}")
+
+def start_index_watcher():
+    interval = float(os.environ.get('INDEX_WATCH_INTERVAL', 0))
+    if interval > 0:
+        app.state.index_watcher = asyncio.create_task(watch_index(interval))
+        logger.info(f"Watching {query_engine.index_path} for index changes every {interval}s")
+
+async def load_in_background():
+    """Load the query engine off the event loop, so the port is bound and health checks answer meanwhile"""
+    global query_engine
+    try:
+        engine = await asyncio.to_thread(load_query_engine)
+    except Exception as e:
+        logger.error(f"Error initializing query engine: {str(e)}")
+        startup.mark_failed(e)
+        return
+    query_engine = engine
+    startup.mark_ready()
     logger.info("Query engine initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing query engine: {str(e)}")
-    raise
+    start_index_watcher()
+
+async def warm_up_in_background():
+    """Warm up a query engine preloaded before the fork, in this worker and off the event loop"""
+    try:
+        await asyncio.to_thread(warm_up_query_engine, query_engine)
+    except Exception as e:
+        logger.error(f"Error warming up query engine: {str(e)}")
+        startup.mark_failed(e)
+        return
+    startup.mark_ready()
+    start_index_watcher()
+
+def require_query_engine():
+    """The loaded and warmed-up query engine, or a 503 telling the client to retry while it is still starting"""
+    if not startup.ready:
+        if startup.failed:
+            detail = "The query engine failed to load"
+        else:
+            snapshot = startup.snapshot()
+            detail = f"Still starting up ({snapshot['phase'] or snapshot['state']})"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    return query_engine
 
 @app.get("/")
 async def root():
     return {"message": "CDP Support Agent API is running"}
 
-@app.post("/api/query", response_model=QueryResponse)
+def answer_with_timings(query: str) -> Dict[str, Any]:
+    """Answer a query on a pool thread, recording how long each stage took"""
+    with query_engine.metrics.trace() as timings:
+        result = query_engine.answer_question(query)
+    # Cached answers are shared, so the breakdown goes on a copy
+    return dict(result, timings=timings)
+
+@app.post("/api/query", response_model=QueryResponse, response_model_exclude_none=True)
 async def process_query(request: QueryRequest):
+    require_query_engine()
     try:
         logger.info(f"Received query: {request.query}")
-        result = query_engine.answer_question(request.query)
+        answer = answer_with_timings if request.timings else query_engine.answer_question
+        result = await worker_pool.run(answer, request.query)
         logger.info(f"Query processed successfully, type: {result['query_type']}")
         return result
+    except PoolSaturatedError as e:
+        logger.warning(f"Rejecting query, worker pool saturated: {str(e)}")
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        logger.error(f"Query timed out after {worker_pool.timeout}s")
+        raise HTTPException(status_code=504, detail="Query timed out")
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+batch_query_max_size = int(os.environ.get('BATCH_QUERY_MAX_SIZE', 256))
+batch_query_timeout = float(os.environ.get('BATCH_QUERY_TIMEOUT', 60.0))
+
+@app.post("/api/query/batch", response_model=BatchQueryResponse, response_model_exclude_none=True)
+async def process_query_batch(request: BatchQueryRequest):
+    if len(request.queries) > batch_query_max_size:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {batch_query_max_size} queries per batch, got {len(request.queries)}")
+    require_query_engine()
+    try:
+        logger.info(f"Received batch of {len(request.queries)} queries")
+        # The whole batch is one pool job: one encode call and one index search per partition
+        results = await worker_pool.run(query_engine.answer_questions, request.queries, timeout=batch_query_timeout)
+        logger.info(f"Batch of {len(results)} queries processed successfully")
+        return {"results": results}
+    except PoolSaturatedError as e:
+        logger.warning(f"Rejecting query batch, worker pool saturated: {str(e)}")
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        logger.error(f"Query batch timed out after {batch_query_timeout}s")
+        raise HTTPException(status_code=504, detail="Query batch timed out")
+    except Exception as e:
+        logger.error(f"Error processing query batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def check_admin_token(x_admin_token: Optional[str]) -> None:
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if admin_token and x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/reload")
+async def reload_index(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    require_query_engine()
+    try:
+        # Runs outside the query pool so loading and warm-up don't take query capacity
+        reloaded = await asyncio.to_thread(query_engine.reload_resources)
+    except Exception as e:
+        logger.error(f"Error reloading index: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not reloaded:
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    return {"status": "reloaded", "generation": query_engine.generation.number}
+
+# Under gunicorn each worker process has its own profiler; a request reaches whichever worker accepts it
+@app.post("/api/admin/profiler/start")
+async def start_profiler(interval_ms: float = 5.0, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    if not profiler.start(interval_ms):
+        raise HTTPException(status_code=409, detail="The profiler is already running")
+    return {"status": "started", "pid": os.getpid(), "interval_ms": interval_ms}
+
+@app.post("/api/admin/profiler/stop")
+async def stop_profiler(limit: int = 30, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    await asyncio.to_thread(profiler.stop)
+    return dict(profiler.report(limit), pid=os.getpid())
+
+@app.get("/api/admin/profiler")
+async def profiler_report(format: str = 'json', limit: int = 30, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    if format == 'collapsed':
+        return PlainTextResponse(profiler.collapsed())
+    return dict(profiler.report(limit), pid=os.getpid())
+
 @app.get("/api/health")
-async def health_check():
-    return {"status": "healthy"}
+@app.get("/api/health/live")
+async def liveness():
+    """Whether this process is up; only a failed load, which restarting may fix, makes it unhealthy"""
+    if startup.failed:
+        return JSONResponse(status_code=503, content=dict(startup.snapshot(), status="unhealthy"))
+    return dict(startup.snapshot(), status="healthy")
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Whether the query engine is loaded and warmed up, with the startup phases so far"""
+    if not startup.ready:
+        return JSONResponse(status_code=503, content=dict(startup.snapshot(), status="not ready"))
+    return dict(startup.snapshot(), status="ready")
+
+def process_memory() -> Dict[str, int]:
+    """Resident, proportional and shared memory of this worker in kB (Linux only)"""
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                if field in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    memory[field.lower() + '_kb'] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+@app.get("/api/stats")
+async def stats():
+    stats = {
+        "pid": os.getpid(),
+        "memory": process_memory(),
+        "startup": startup.snapshot(),
+        "worker_pool": worker_pool.stats()
+    }
+    if query_engine is None:
+        return stats
+    stats["index_generation"] = query_engine.generation.number
+    if query_engine.batcher is not None:
+        stats["batcher"] = query_engine.batcher.stats()
+    if query_engine.answer_cache is not None:
+        stats["answer_cache"] = query_engine.answer_cache.stats()
+    return stats
+
+@app.get("/api/metrics")
+async def export_metrics():
+    """Stage latencies, answer counts and component stats in the Prometheus text format"""
+    gauges = startup.samples()
+    if query_engine is not None:
+        generation = query_engine.acquire_generation()
+        try:
+            gauges += [
+                ('index_generation', (), generation.number),
+                ('index_vectors', (), generation.index.ntotal),
+                ('index_chunks', (), len(generation.chunks))
+            ]
+        finally:
+            generation.release()
+    gauges += [('process_memory_bytes', (('kind', field[:-len('_kb')]),), kb * 1024)
+               for field, kb in process_memory().items()]
+    counters = []
+    components = [('worker_pool', worker_pool.stats())]
+    if query_engine is not None and query_engine.batcher is not None:
+        components.append(('batcher', query_engine.batcher.stats()))
+    if query_engine is not None and query_engine.answer_cache is not None:
+        components.append(('answer_cache', query_engine.answer_cache.stats()))
+    for prefix, component_stats in components:
+        component_gauges, component_counters = stats_samples(prefix, component_stats)
+        gauges += component_gauges
+        counters += component_counters
+    return PlainTextResponse(metrics.render(gauges, counters),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Run with: uvicorn app:app --reload
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import os
+import time
+import queue
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class _PendingSearch:
+    """A single caller waiting for its share of a batched search, or only for its query's embedding"""
+
+    def __init__(self, query: str, top_k: Optional[int], query_embedding=None, analysis=None):
+        self.query = query
+        self.top_k = top_k  # None when only the embedding is wanted
+        self.query_embedding = query_embedding
+        self.analysis = analysis
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class BatchScheduler:
+    """
+    Collects searches that arrive within a short window and runs them as one
+    encode call and one multi-row index search on the query engine. Callers
+    that only need a query embedding, such as the semantic cache lookup, share
+    the batch's encode call.
+    """
+
+    def __init__(self, engine, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.batch_size_counts = {}
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.worker = None
+        self.worker_pid = None
+
+    def _ensure_worker(self) -> None:
+        # Started lazily and per process: a scheduler created before gunicorn
+        # forks its workers would otherwise have its thread only in the master
+        if self.worker_pid == os.getpid():
+            return
+        with self.lock:
+            if self.worker_pid != os.getpid():
+                self.queue = queue.Queue()
+                self.worker = threading.Thread(target=self._run, name='search-batcher', daemon=True)
+                self.worker.start()
+                self.worker_pid = os.getpid()
+
+    def submit(self, query: str, top_k: int, query_embedding=None, analysis=None) -> List[Dict[str, Any]]:
+        """Queue a search and block until its batch has been processed"""
+        return self._wait(_PendingSearch(query, top_k, query_embedding, analysis))
+
+    def encode(self, query: str):
+        """Queue a query to be embedded with the next batch and block until it is"""
+        return self._wait(_PendingSearch(query, None))
+
+    def _wait(self, pending: _PendingSearch) -> Any:
+        self._ensure_worker()
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect_batch(self) -> List[_PendingSearch]:
+        """Wait for the first search, then gather more until the window closes or the batch is full"""
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            self._record(batch, started)
+            try:
+                searches = [item for item in batch if item.top_k is not None]
+                # One encoder call for the embedding-only callers and the searches that need one
+                unencoded = [item for item in batch if item.top_k is None or
+                             (item.query_embedding is None and self.engine.retrieval_route(item.query) != 'lexical')]
+                if unencoded:
+                    embeddings = self.engine.encode_queries([item.query for item in unencoded])
+                    for item, embedding in zip(unencoded, embeddings):
+                        item.query_embedding = embedding
+                        if item.top_k is None:
+                            item.result = embedding
+                if searches:
+                    results = self.engine.search_batch(
+                        [item.query for item in searches],
+                        [item.top_k for item in searches],
+                        [item.query_embedding for item in searches],
+                        [item.analysis for item in searches]
+                    )
+                    for item, result in zip(searches, results):
+                        item.result = result
+            except Exception as e:
+                logging.error(f"Batched search of {len(batch)} queries failed: {str(e)}")
+                for item in batch:
+                    item.error = e
+            for item in batch:
+                item.done.set()
+
+    def _record(self, batch: List[_PendingSearch], started: float) -> None:
+        with self.lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+            for item in batch:
+                wait = started - item.enqueued_at
+                self.total_queue_wait += wait
+                self.max_queue_wait = max(self.max_queue_wait, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch-size distribution and queue-wait metrics"""
+        with self.lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self.batches,
+                'queries': self.queries,
+                'mean_batch_size': self.queries / self.batches if self.batches else 0.0,
+                'batch_size_counts': dict(sorted(self.batch_size_counts.items())),
+                'mean_queue_wait_ms': self.total_queue_wait / self.queries * 1000.0 if self.queries else 0.0,
+                'max_queue_wait_ms': self.max_queue_wait * 1000.0,
+                'queue_depth': self.queue.qsize()
+            }
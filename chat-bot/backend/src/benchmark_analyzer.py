@@ -0,0 +1,109 @@
+import re
+import json
+import time
+import logging
+import argparse
+from typing import List, Dict, Any, Callable
+from query_analyzer import QueryAnalyzer, CDP_PATTERNS, HOW_TO_PATTERNS, HOW_TO_INDICATORS, COMPARISON_KEYWORDS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Used when no --queries file is given: how-to, comparison, invalid and long queries
+SAMPLE_QUERIES = [
+    "How do I set up a new source in Segment?",
+    "How can I create a user profile in mParticle?",
+    "How do I build an audience segment in Lytics?",
+    "How can I integrate my data with Zeotap?",
+    "How does Segment's audience creation process compare to Lytics'?",
+    "What is the difference between mParticle and Zeotap identity resolution?",
+    "Segment vs mParticle for mobile apps",
+    "Steps to configure a webhook destination",
+    "Which movie is getting the most Oscars this year?",
+    "Tell me about pricing",
+    "How is the identity graph configured in mparticle.com for users who log in on several devices "
+    "and later switch between the web app and the mobile app, and what happens to their events?",
+    "guide for sending analytics.track events from segment.io to a data warehouse"
+]
+
+def linear_scan_analysis(query: str) -> Dict[str, Any]:
+    """The per-pattern classification the analyzer replaced, kept as the baseline"""
+    # The exact cache normalized the query on lookup and again on store
+    normalized = re.sub(r'\s+', ' ', query.lower()).strip(' ?!.,;:')
+    normalized = re.sub(r'\s+', ' ', query.lower()).strip(' ?!.,;:')
+    query_lower = query.lower()
+    is_how_to = any(re.search(pattern, query_lower) for pattern in HOW_TO_PATTERNS) or \
+        any(indicator in query_lower for indicator in HOW_TO_INDICATORS)
+    cdps = tuple(cdp for cdp, patterns in CDP_PATTERNS.items() if any(pattern in query_lower for pattern in patterns))
+    is_comparison = len(cdps) > 1 or any(keyword in query_lower for keyword in COMPARISON_KEYWORDS)
+    # The old pipeline also detected the CDP a second time inside search
+    target_cdp = next((cdp for cdp, patterns in CDP_PATTERNS.items()
+                       if any(pattern in query_lower for pattern in patterns)), None)
+    return {'normalized': normalized, 'is_how_to': is_how_to, 'is_comparison': is_comparison,
+            'cdps': cdps, 'cdp': target_cdp}
+
+def time_per_query(func: Callable[[str], Any], queries: List[str], repeat: int) -> float:
+    """Best of five runs of repeat passes over queries, in microseconds per query"""
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                func(query)
+        best = min(best, time.perf_counter() - started)
+    return best / (repeat * len(queries)) * 1e6
+
+def benchmark(queries: List[str], repeat: int) -> Dict[str, Any]:
+    """Time the baseline and the analyzer, and check that they agree on every query"""
+    started = time.perf_counter()
+    analyzer = QueryAnalyzer()
+    build_ms = (time.perf_counter() - started) * 1000.0
+
+    mismatches = []
+    for query in queries:
+        expected = linear_scan_analysis(query)
+        analysis = analyzer.analyze(query)
+        actual = {'normalized': analysis.normalized, 'is_how_to': analysis.is_how_to,
+                  'is_comparison': analysis.is_comparison, 'cdps': analysis.cdps, 'cdp': analysis.cdp}
+        if actual != expected:
+            mismatches.append({'query': query, 'expected': expected, 'actual': actual})
+
+    baseline_us = time_per_query(linear_scan_analysis, queries, repeat)
+    analyzer_us = time_per_query(analyzer.analyze, queries, repeat)
+    return {
+        'queries': len(queries),
+        'analyzer_build_ms': build_ms,
+        'baseline_us_per_query': baseline_us,
+        'analyzer_us_per_query': analyzer_us,
+        'speedup': baseline_us / analyzer_us if analyzer_us else 0.0,
+        'mismatches': mismatches
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark per-query classification cost of the query analyzer")
+    parser.add_argument('--queries', help="File with one question per line; defaults to a built-in sample")
+    parser.add_argument('--repeat', type=int, default=2000, help="Passes over the queries per timing run")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = SAMPLE_QUERIES
+
+    report = benchmark(queries, args.repeat)
+
+    print(f"\n{report['queries']} queries, analyzer built in {report['analyzer_build_ms']:.2f} ms")
+    print(f"{'classifier':<16}{'us/query':>10}")
+    print(f"{'linear scan':<16}{report['baseline_us_per_query']:>10.2f}")
+    print(f"{'analyzer':<16}{report['analyzer_us_per_query']:>10.2f}")
+    print(f"speedup {report['speedup']:.1f}x, {len(report['mismatches'])} mismatched classifications")
+    for mismatch in report['mismatches']:
+        logging.warning(f"Analyzer disagrees with the baseline on {mismatch['query']!r}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import logging
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Callable, Tuple
+from urllib.parse import urljoin, urldefrag
+from bs4 import BeautifulSoup
+from scraper import parse_page, extract_page
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FIXTURE_URL = 'https://docs.example.com/docs/page'
+
+def legacy_parse_page(html: str, page_url: str, parser: str = 'html.parser') -> Tuple[Dict[str, Any], List[str]]:
+    """The select-based extraction the single-walk extractor replaced, kept as the baseline"""
+    soup = BeautifulSoup(html, parser)
+    for element in soup.select('nav, footer, .sidebar, .menu, .navigation, script, style, header'):
+        element.extract()
+    title = soup.title.text if soup.title else "No Title"
+    main_content = soup.select_one('main, article, .content, .documentation, #content, .main-content')
+    if not main_content:
+        main_content = soup.body
+    content = ""
+    if main_content:
+        for element in main_content.select('p, h1, h2, h3, h4, h5, h6, ul, ol, li, pre, code'):
+            text = element.get_text(strip=True)
+            if text:
+                tag_name = element.name
+                if tag_name.startswith('h'):
+                    content += f"\n## {text}\n"
+                elif tag_name in ['ul', 'ol']:
+                    continue
+                elif tag_name == 'li':
+                    content += f"- {text}\n"
+                elif tag_name in ['pre', 'code']:
+                    content += f"\n```\n{text}\n```\n"
+                else:
+                    content += f"{text}\n"
+    links = [urldefrag(urljoin(page_url, a_tag['href'])).url for a_tag in soup.find_all('a', href=True)]
+    return {'title': title, 'content': content.strip()}, links
+
+def synthetic_page(number: int, sections: int = 12) -> str:
+    """A reference-style docs page: chrome, nested lists with paragraphs and inline code, code blocks"""
+    nav = ''.join(f'<li><a href="/docs/section-{i}">Section {i}</a></li>' for i in range(40))
+    body = []
+    for section in range(sections):
+        body.append(f'<h2 id="s{section}">Configure destination {section}</h2>')
+        body.append(f'<p>Send events to destination {section} with <code>analytics.track()</code> once the '
+                    f'<a href="/docs/sources/{section}#setup">source</a> is connected.</p>')
+        items = ''.join(
+            f'<li><p>Step {step}: open <strong>Settings</strong> and set <code>write_key_{step}</code>.</p>'
+            f'<ul><li>Option {step}.a for <em>web</em></li><li>Option {step}.b for mobile</li></ul></li>'
+            for step in range(1, 5))
+        body.append(f'<ol>{items}</ol>')
+        body.append(f'<pre><code>analytics.identify("user_{section}", {{\n  plan: "pro"\n}});</code></pre>')
+    return (
+        f'<!DOCTYPE html><html><head><title>Destination guide {number}</title>'
+        f'<style>body {{ margin: 0 }}</style><script>window.dataLayer = [];</script></head><body>'
+        f'<header><a href="/">Home</a></header><nav class="sidebar"><ul>{nav}</ul></nav>'
+        f'<main><article>{"".join(body)}</article></main>'
+        f'<!-- generated page {number} --><footer><p>Copyright</p></footer></body></html>'
+    )
+
+def load_fixtures(fixtures_dir: str) -> List[str]:
+    """Every .html file under fixtures_dir, e.g. pages saved with scraper.py --save-html"""
+    pages = []
+    for root, _, files in os.walk(fixtures_dir):
+        for filename in sorted(files):
+            if filename.endswith('.html'):
+                with open(os.path.join(root, filename), 'r', encoding='utf-8') as f:
+                    pages.append(f.read())
+    return pages
+
+def time_per_page(func: Callable[[str, str], Any], pages: List[str], repeat: int) -> float:
+    """Best of repeat passes over pages, in milliseconds per page"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html in pages:
+            func(html, FIXTURE_URL)
+        best = min(best, time.perf_counter() - started)
+    return best / len(pages) * 1000.0
+
+def pool_throughput(pages: List[str], workers: int) -> float:
+    """Pages per second when parse_page runs in a pool of workers processes, as in the crawler"""
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(parse_page, pages[:workers], [FIXTURE_URL] * workers))  # Start the workers first
+        started = time.perf_counter()
+        list(pool.map(parse_page, pages, [FIXTURE_URL] * len(pages), chunksize=1))
+        elapsed = time.perf_counter() - started
+    return len(pages) / elapsed if elapsed else 0.0
+
+def benchmark(pages: List[str], repeat: int, workers: List[int]) -> Dict[str, Any]:
+    """Time the legacy and the single-walk extractor per parser, and the process pool"""
+    parsers = ['html.parser'] + (['lxml'] if importlib.util.find_spec('lxml') else [])
+
+    link_mismatches = 0
+    legacy_chars = walk_chars = 0
+    for html in pages:
+        legacy_data, legacy_links = legacy_parse_page(html, FIXTURE_URL)
+        walk_data, walk_links = extract_page(BeautifulSoup(html, 'html.parser'))
+        walk_links = [urldefrag(urljoin(FIXTURE_URL, href)).url for href in walk_links]
+        link_mismatches += legacy_links != walk_links or legacy_data['title'] != walk_data['title']
+        legacy_chars += len(legacy_data['content'])
+        walk_chars += len(walk_data['content'])
+
+    timings = {}
+    for parser in parsers:
+        timings[f'legacy/{parser}'] = time_per_page(
+            lambda html, url: legacy_parse_page(html, url, parser), pages, repeat)
+        timings[f'walk/{parser}'] = time_per_page(
+            lambda html, url: extract_page(BeautifulSoup(html, parser)), pages, repeat)
+
+    return {
+        'pages': len(pages),
+        'html_kb_per_page': sum(len(html) for html in pages) / len(pages) / 1024.0,
+        'ms_per_page': timings,
+        'speedup': timings['legacy/html.parser'] / min(timings.values()),
+        'legacy_content_chars': legacy_chars,
+        'walk_content_chars': walk_chars,
+        'link_or_title_mismatches': link_mismatches,
+        'pool_pages_per_s': {count: pool_throughput(pages, count) for count in workers}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction of the scraper on saved or synthetic pages")
+    parser.add_argument('--fixtures', help="Directory of saved .html pages (scraper.py --save-html); defaults to synthetic pages")
+    parser.add_argument('--pages', type=int, default=50, help="Synthetic pages to generate")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing passes over the pages, the best one counts")
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4], help="Process pool sizes to measure")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.fixtures) if args.fixtures else [synthetic_page(n) for n in range(args.pages)]
+    if not pages:
+        logging.error(f"No .html fixtures found in {args.fixtures}")
+        return
+
+    report = benchmark(pages, args.repeat, args.workers)
+
+    print(f"\n{report['pages']} pages, {report['html_kb_per_page']:.1f} KB of HTML each")
+    print(f"{'extractor/parser':<22}{'ms/page':>10}")
+    for name, ms in report['ms_per_page'].items():
+        print(f"{name:<22}{ms:>10.2f}")
+    print(f"speedup {report['speedup']:.1f}x, content {report['legacy_content_chars']} -> "
+          f"{report['walk_content_chars']} chars without repeated nested text")
+    for count, rate in report['pool_pages_per_s'].items():
+        print(f"parse_page in {count} processes: {rate:.0f} pages/s")
+    if report['link_or_title_mismatches']:
+        logging.warning(f"Links or title differ from the baseline on {report['link_or_title_mismatches']} pages")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import List, Dict, Any, Optional
+import numpy as np
+import httpx
+from indexer import DocumentIndexer
+from index_factory import INDEX_TYPES, make_index_config
+from query_engine import QueryEngine, RETRIEVAL_MODES
+from metrics import Metrics
+from chunker import DEFAULT_CHUNK_TOKENS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ['index', 'search', 'api']
+
+CDPS = ['segment', 'mparticle', 'lytics', 'zeotap']
+
+# Paragraphs are longer than half a chunk of DEFAULT_CHUNK_TOKENS hash encoder tokens (words)
+# but fit in one, so the indexer makes exactly one chunk of each
+PARAGRAPHS_PER_DOC = 10
+PARAGRAPH_WORDS = (DEFAULT_CHUNK_TOKENS // 2 + 6, DEFAULT_CHUNK_TOKENS - 8)
+
+TOPICS = ['source', 'destination', 'audience', 'user profile', 'identity graph', 'webhook', 'warehouse sync',
+          'consent setting', 'tracking plan', 'computed trait', 'event stream', 'API key', 'data model', 'journey']
+VERBS = ['set up', 'configure', 'create', 'connect', 'delete', 'export', 'sync', 'debug', 'map', 'enable']
+IDENTIFIERS = ['analytics.track', 'analytics.identify', 'write_key', 'mParticle.logEvent', 'jstag.send',
+               'user_id', 'anonymous_id', 'batch_size', 'zeotap.setConsent', 'profile_id']
+WORDS = ['the', 'events', 'workspace', 'settings', 'page', 'select', 'field', 'value', 'users', 'data', 'when',
+         'each', 'property', 'integration', 'dashboard', 'attribute', 'segment', 'schema', 'rules', 'then',
+         'records', 'identity', 'mobile', 'web', 'server', 'request', 'payload', 'filter', 'team', 'access']
+
+# Tracked figures: (scenario, metric, True if higher is better)
+TRACKED_METRICS = [
+    ('index', 'chunks_per_s', True),
+    ('search', 'p50_ms', False),
+    ('search', 'p99_ms', False),
+    ('search', 'batch_qps', True),
+    ('api', 'qps', True),
+    ('api', 'p50_ms', False),
+    ('api', 'p99_ms', False),
+    ('api', 'ready_after_s', False)
+]
+
+def sentence(rng: random.Random, cdp: str, topic: str) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 14))
+    words.insert(rng.randrange(len(words)), topic)
+    if rng.random() < 0.5:
+        words.insert(rng.randrange(len(words)), rng.choice(IDENTIFIERS))
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), cdp.capitalize())
+    return ' '.join(words).capitalize() + '.'
+
+def paragraph(rng: random.Random, cdp: str, topic: str) -> str:
+    """A heading with prose, numbered steps or bullets, of between PARAGRAPH_WORDS words"""
+    target = rng.randint(*PARAGRAPH_WORDS)
+    verb = rng.choice(VERBS)
+    kind = rng.choice(['prose', 'steps', 'bullets'])
+    lines = [f"## {verb.capitalize()} a {topic}"]
+    words = len(lines[0].split())
+    while words < target:
+        if kind == 'steps':
+            line = f"{len(lines)}. {sentence(rng, cdp, topic)}"
+        elif kind == 'bullets':
+            line = f"- {sentence(rng, cdp, topic)}"
+        else:
+            line = sentence(rng, cdp, topic)
+        # The last line is cut short so the paragraph stays within PARAGRAPH_WORDS
+        line_words = line.split()[:PARAGRAPH_WORDS[1] - words]
+        lines.append(' '.join(line_words))
+        words += len(line_words)
+    return '\n'.join(lines)
+
+def synthetic_corpus(docs_dir: str, chunks: int, seed: int = 0) -> int:
+    """
+    Write about chunks chunks worth of documents to docs_dir/<cdp>/all_docs.json,
+    shaped like the scraper's output. Returns the number of documents.
+    """
+    rng = random.Random(seed)
+    documents = {cdp: [] for cdp in CDPS}
+    doc_count = max(1, chunks // PARAGRAPHS_PER_DOC)
+    for number in range(doc_count):
+        cdp = CDPS[number % len(CDPS)]
+        topic = rng.choice(TOPICS)
+        paragraphs = [paragraph(rng, cdp, topic) for _ in range(PARAGRAPHS_PER_DOC)]
+        documents[cdp].append({
+            'title': f"{topic.capitalize()} guide {number}",
+            'content': '\n\n'.join(paragraphs),
+            'url': f"https://docs.{cdp}.example.com/{topic.replace(' ', '-')}/{number}"
+        })
+    for cdp, docs in documents.items():
+        os.makedirs(os.path.join(docs_dir, cdp), exist_ok=True)
+        with open(os.path.join(docs_dir, cdp, 'all_docs.json'), 'w', encoding='utf-8') as f:
+            json.dump(docs, f)
+    return doc_count
+
+def synthetic_queries(count: int, seed: int = 0) -> List[str]:
+    """How-to, comparison, identifier and off-topic questions over the synthetic corpus vocabulary"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for number in range(count):
+        kind = rng.random()
+        cdp, other = rng.sample(CDPS, 2)
+        topic = rng.choice(TOPICS)
+        if kind < 0.7:
+            queries.append(f"How do I {rng.choice(VERBS)} a {topic} in {cdp.capitalize()}? ({number})")
+        elif kind < 0.85:
+            queries.append(f"How does the {topic} in {cdp.capitalize()} compare to {other.capitalize()}? ({number})")
+        elif kind < 0.95:
+            queries.append(f"How do I use {rng.choice(IDENTIFIERS)} with a {topic} in {cdp}? ({number})")
+        else:
+            queries.append(f"Which movie won the most awards in {1990 + number % 30}?")
+    return queries
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds from latencies in seconds"""
+    values = np.array(latencies) * 1000.0
+    return {
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max())
+    }
+
+def bench_index(docs_dir: str, index_path: str, index_config: Dict[str, Any], batch_size: int,
+                workers: int) -> Dict[str, Any]:
+    """Full build of the corpus with the hash encoder, timed end to end"""
+    shutil.rmtree(index_path, ignore_errors=True)
+    started = time.perf_counter()
+    indexer = DocumentIndexer(docs_dir, index_path, index_config, batch_size=batch_size, workers=workers,
+                              encoder_config={'backend': 'hash'})
+    indexer.process()
+    elapsed = time.perf_counter() - started
+    with open(os.path.join(index_path, 'manifest.json'), 'r', encoding='utf-8') as f:
+        chunks = len(json.load(f)['chunks'])
+    return {
+        'chunks': chunks,
+        'seconds': elapsed,
+        'chunks_per_s': chunks / elapsed if elapsed else 0.0,
+        'index_bytes': sum(os.path.getsize(os.path.join(index_path, name)) for name in os.listdir(index_path))
+    }
+
+def bench_search(index_path: str, queries: List[str], top_k: int, retrieval_mode: str, warmup: int,
+                 batch_size: int) -> Dict[str, Any]:
+    """
+    QueryEngine.search latency one query at a time, and throughput of
+    search_batch. The first warmup queries only warm up the engine.
+    """
+    engine = QueryEngine(index_path, retrieval_mode=retrieval_mode)
+    for query in queries[:warmup]:
+        engine.search(query, top_k)
+    queries = queries[warmup:]
+    engine.metrics = Metrics()  # Stage timings of the measured queries only
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        engine.search(query, top_k)
+        latencies.append(time.perf_counter() - started)
+    stages = engine.metrics.stage_summary()
+
+    started = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        engine.search_batch(batch, [top_k] * len(batch))
+    batch_elapsed = time.perf_counter() - started
+
+    return dict(
+        percentiles(latencies),
+        queries=len(queries),
+        qps=len(queries) / sum(latencies),
+        batch_size=batch_size,
+        batch_qps=len(queries) / batch_elapsed if batch_elapsed else 0.0,
+        stages=stages
+    )
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def drive_api(base_url: str, queries: List[str], clients: int, warmup: int) -> Dict[str, Any]:
+    """Send queries to /api/query from clients concurrent connections, measuring all but the first warmup"""
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        for query in queries[:warmup]:
+            await client.post('/api/query', json={'query': query})
+
+        queries = queries[warmup:]
+        pending = iter(queries)
+        latencies = []
+        statuses = {}
+
+        async def run_client():
+            for query in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.post('/api/query', json={'query': query})
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if status == '200':
+                    latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    report = percentiles(latencies) if latencies else {}
+    return dict(report, requests=len(queries), clients=clients, seconds=elapsed,
+                qps=len(latencies) / elapsed if elapsed else 0.0, statuses=statuses)
+
+def bench_api(run_dir: str, queries: List[str], clients: int, warmup: int, api_env: Dict[str, str],
+              startup_timeout: float = 120.0) -> Dict[str, Any]:
+    """
+    Serve run_dir/data/index with uvicorn in a child process, so the clients
+    don't share its interpreter, and measure end-to-end /api/query throughput
+    """
+    port = free_port()
+    env = dict(os.environ, **api_env)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, env.get('PYTHONPATH')]))
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1',
+                               '--port', str(port), '--log-level', 'warning'], cwd=run_dir, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"API server exited with code {server.returncode}")
+            try:
+                response = httpx.get(f"{base_url}/api/health/ready", timeout=1.0)
+                if response.status_code == 200:
+                    break
+                if response.json().get('state') == 'failed':
+                    raise RuntimeError(f"API server failed to load: {response.json().get('error')}")
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"API server was not ready within {startup_timeout}s")
+            time.sleep(0.2)
+        startup = response.json()
+        report = asyncio.run(drive_api(base_url, queries, clients, warmup))
+        report['server_env'] = api_env
+        report['startup_phases_s'] = startup['phases_s']
+        report['ready_after_s'] = startup['ready_after_s']
+        return report
+    finally:
+        server.terminate()
+        server.wait()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any], threshold: float) -> List[str]:
+    """Print tracked metrics next to a baseline report; returns the regressions beyond threshold percent"""
+    regressions = []
+    print(f"\n{'size':>8} {'metric':<22}{'baseline':>12}{'current':>12}{'change':>9}")
+    for size, results in report['results'].items():
+        for scenario, metric, higher_is_better in TRACKED_METRICS:
+            old = baseline.get('results', {}).get(size, {}).get(scenario, {}).get(metric)
+            new = results.get(scenario, {}).get(metric)
+            if old is None or new is None or not old:
+                continue
+            change = (new - old) / old * 100.0
+            worse = -change if higher_is_better else change
+            flag = '  <- regression' if worse > threshold else ''
+            print(f"{size:>8} {scenario + '.' + metric:<22}{old:>12.2f}{new:>12.2f}{change:>+8.1f}%{flag}")
+            if flag:
+                regressions.append(f"{size} chunks {scenario}.{metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of indexing, search and the API on synthetic corpora")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Corpus sizes in chunks")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the corpus and query generators")
+    parser.add_argument('--work-dir', help="Where corpora and indexes are written; a temporary directory by default")
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat')
+    parser.add_argument('--batch-size', type=int, default=256, help="Indexer chunks per step and search_batch size")
+    parser.add_argument('--workers', type=int, default=1, help="Indexer embedding processes")
+    parser.add_argument('--queries', type=int, default=1000, help="Queries per search and API run")
+    parser.add_argument('--warmup', type=int, default=50, help="Queries sent before measuring")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--retrieval-mode', choices=RETRIEVAL_MODES, default='dense')
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent API clients")
+    parser.add_argument('--api-env', action='append', default=[], metavar='NAME=VALUE',
+                        help="Environment of the API server, e.g. QUERY_WORKERS=8; the answer cache is off unless set")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    parser.add_argument('--compare', help="Earlier report to compare tracked metrics against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Percent change reported as a regression")
+    args = parser.parse_args()
+
+    # Every query is distinct, so the cache would only hide the cost of search
+    api_env = {'ANSWER_CACHE_SIZE': '0', 'RETRIEVAL_MODE': args.retrieval_mode}
+    api_env.update(item.split('=', 1) for item in args.api_env)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='cdp-benchmark-')
+    queries = synthetic_queries(args.warmup + args.queries, args.seed)
+    warmup_queries, measured_queries = queries[:args.warmup], queries[args.warmup:]
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'work_dir')},
+        'results': {}
+    }
+    try:
+        for size in args.sizes:
+            run_dir = os.path.join(work_dir, str(size))
+            docs_dir = os.path.join(run_dir, 'data', 'scraped_docs')
+            index_path = os.path.join(run_dir, 'data', 'index')
+            results = report['results'][str(size)] = {}
+
+            documents = synthetic_corpus(docs_dir, size, args.seed)
+            logging.info(f"Generated {documents} documents for about {size} chunks in {docs_dir}")
+
+            # Search and API runs need an index even when indexing isn't measured
+            if 'index' in args.scenarios or not os.path.exists(os.path.join(index_path, 'manifest.json')):
+                index_config = make_index_config(index_type=args.index_type)
+                index_report = bench_index(docs_dir, index_path, index_config, args.batch_size, args.workers)
+                if 'index' in args.scenarios:
+                    results['index'] = index_report
+                    logging.info(f"{size}: indexed {index_report['chunks']} chunks at "
+                                 f"{index_report['chunks_per_s']:.0f} chunks/s")
+            if 'search' in args.scenarios:
+                results['search'] = bench_search(index_path, warmup_queries + measured_queries, args.top_k,
+                                                 args.retrieval_mode, args.warmup, args.batch_size)
+                logging.info(f"{size}: search p50 {results['search']['p50_ms']:.2f} ms, "
+                             f"p99 {results['search']['p99_ms']:.2f} ms")
+            if 'api' in args.scenarios:
+                results['api'] = bench_api(run_dir, warmup_queries + measured_queries, args.clients, args.warmup, api_env)
+                logging.info(f"{size}: /api/query {results['api']['qps']:.0f} QPS with {args.clients} clients")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'chunks':>8}{'index/s':>10}{'search p50':>12}{'p99':>9}{'batch QPS':>11}{'API QPS':>9}{'API p99':>9}")
+    for size, results in report['results'].items():
+        index, search, api = results.get('index', {}), results.get('search', {}), results.get('api', {})
+        print(f"{size:>8}{index.get('chunks_per_s', 0):>10.0f}{search.get('p50_ms', 0):>12.2f}"
+              f"{search.get('p99_ms', 0):>9.2f}{search.get('batch_qps', 0):>11.0f}"
+              f"{api.get('qps', 0):>9.0f}{api.get('p99_ms', 0):>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for regression in compare(baseline, report, args.threshold):
+            logging.warning(f"Regression: {regression}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Iterator, List, Dict, Any, TextIO
+from query_engine import QueryEngine
+from encoder import ENCODER_BACKENDS, encoder_for_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def read_records(lines: TextIO, query_field: str) -> Iterator[Dict[str, Any]]:
+    """Yield JSONL records that carry a query, skipping blank and malformed lines"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            logging.error(f"Skipping line {line_number}: {str(e)}")
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get(query_field), str):
+            logging.error(f"Skipping line {line_number}: no '{query_field}' string")
+            continue
+        yield record
+
+def chunked(records: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def answer_stream(engine: QueryEngine, source: TextIO, sink: TextIO, query_field: str = 'query',
+                  chunk_size: int = 512, include_context: bool = True) -> int:
+    """
+    Answer JSONL questions from source and write one JSONL answer per question
+    to sink. Only chunk_size records are held at a time, so memory stays flat
+    however large the input is. Returns the number of answers written.
+    """
+    written = 0
+    started = time.perf_counter()
+    for chunk in chunked(read_records(source, query_field), chunk_size):
+        results = engine.answer_questions([record[query_field] for record in chunk])
+        for record, result in zip(chunk, results):
+            output = dict(record)
+            output.update(result)
+            if not include_context:
+                output.pop('context')
+            sink.write(json.dumps(output, ensure_ascii=False) + '\n')
+        sink.flush()
+        written += len(chunk)
+        elapsed = time.perf_counter() - started
+        logging.info(f"Answered {written} questions ({written / elapsed if elapsed else 0.0:.1f} questions/s)")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions offline, writing JSONL answers")
+    parser.add_argument('--input', default='-', help="JSONL file with one question per line, or - for stdin")
+    parser.add_argument('--output', default='-', help="JSONL file to write answers to, or - for stdout")
+    parser.add_argument('--index-path', default='data/index')
+    parser.add_argument('--query-field', default='query', help="Field holding the question in each input record")
+    parser.add_argument('--chunk-size', type=int, default=512, help="Questions encoded and searched per step")
+    parser.add_argument('--no-context', action='store_true', help="Leave the retrieved chunks out of the output")
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, help="Query encoder backend; defaults to one matching the index")
+    parser.add_argument('--onnx-model-path', default='data/encoder/onnx', help="Exported ONNX model or its directory")
+    parser.add_argument('--encoder-threads', type=int, default=0, help="Intra-op threads, 0 for the runtime's default")
+    args = parser.parse_args()
+
+    encoder = encoder_for_index(args.index_path, args.encoder, args.onnx_model_path, args.encoder_threads)
+    engine = QueryEngine(args.index_path, encoder=encoder)
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        answer_stream(engine, source, sink, args.query_field, args.chunk_size, not args.no_context)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import mmap
+import array
+import struct
+import logging
+from typing import List, Dict, Any, Iterator, Optional
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHUNK_STORE_FILE = 'chunks.bin'
+
+MAGIC = b'CDPCHNK1'
+VERSION = 2
+
+# Lines that start a numbered step or a bullet point
+STEP_PATTERN = re.compile(r'^\d+\.|\-|\*')
+# Characters of a chunk quoted in comparison answers
+SNIPPET_CHARS = 500
+
+# magic and version, shared by every version of the format
+PREFIX = struct.Struct('<8sI')
+
+SECTIONS_V1 = [
+    'chunk_ids',       # int64 [num_chunks]   FAISS ID of each row
+    'chunk_docs',      # uint32 [num_chunks]  document of each row
+    'text_offsets',    # uint64 [num_chunks + 1] into the text buffer
+    'id_to_row',       # int32 [id_table_len] row of each FAISS ID, -1 if unused
+    'doc_titles',      # uint32 [num_docs]    string table index
+    'doc_urls',        # uint32 [num_docs]    string table index
+    'doc_cdps',        # uint32 [num_docs]    CDP index
+    'cdp_names',       # uint32 [num_cdps]    string table index
+    'string_offsets',  # uint64 [num_strings + 1] into the string buffer
+    'strings',         # utf-8 titles, urls and CDP names
+    'texts'            # utf-8 chunk texts, back to back
+]
+
+# Version 2 adds the answer fields precomputed at index time
+SECTIONS = SECTIONS_V1[:-1] + [
+    'heading_paths',   # uint32 [num_chunks]  string table index of the newline-joined heading path
+    'snippet_ends',    # uint32 [num_chunks]  byte length of the snippet at the start of the chunk text
+    'step_offsets',    # uint64 [num_chunks + 1] into the step buffer
+    'steps',           # utf-8 newline-joined steps of each chunk, back to back
+    'texts'
+]
+
+# magic, version, chunk/doc/cdp/string counts, id table length, then the byte offset of each section
+HEADERS = {
+    1: (struct.Struct('<8s6I11Q'), SECTIONS_V1),
+    2: (struct.Struct('<8s6I15Q'), SECTIONS)
+}
+HEADER = HEADERS[VERSION][0]
+
+def extract_steps(text: str) -> List[str]:
+    """Numbered and bulleted lines of a chunk, stripped, in order"""
+    return [line.strip() for line in text.split('\n') if STEP_PATTERN.match(line.strip())]
+
+def summary_snippet(text: str) -> str:
+    return text[:SNIPPET_CHARS]
+
+def answer_fields(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Steps and snippet of a chunk, for chunks stored without them"""
+    return {
+        'steps': extract_steps(chunk['chunk_text']),
+        'snippet': summary_snippet(chunk['chunk_text']),
+        'heading_path': chunk.get('heading_path', [])
+    }
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class ChunkStoreWriter:
+    """
+    Streams chunks into the binary metadata format. Titles, URLs and CDP names
+    are stored once per document and chunk texts go to one contiguous buffer.
+    Steps and heading paths precomputed by the indexer are stored alongside,
+    and a chunk's snippet is recorded as the length of its text prefix. Only
+    fixed-size per-chunk integers and interned strings are kept in memory while writing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.text_path = path + '.text.tmp'
+        self.steps_path = path + '.steps.tmp'
+        self.text_file = None
+        self.steps_file = None
+        self.committed = False
+        self.chunk_ids = array.array('q')
+        self.chunk_docs = array.array('I')
+        self.text_offsets = array.array('Q', [0])
+        self.heading_paths = array.array('I')
+        self.snippet_ends = array.array('I')
+        self.step_offsets = array.array('Q', [0])
+        self.strings = {}
+        self.docs = {}
+        self.cdps = {}
+
+    def __enter__(self) -> 'ChunkStoreWriter':
+        self.text_file = open(self.text_path, 'wb')
+        self.steps_file = open(self.steps_path, 'wb')
+        return self
+
+    def _intern_string(self, value: str) -> int:
+        return self.strings.setdefault(value, len(self.strings))
+
+    def append(self, chunk: Dict[str, Any]) -> None:
+        """Add one chunk with its FAISS ID, text, document fields and precomputed answer fields"""
+        cdp_id = self.cdps.setdefault(chunk['cdp'], len(self.cdps))
+        self._intern_string(chunk['cdp'])
+        doc_key = (chunk['title'], chunk['url'], chunk['cdp'])
+        if doc_key not in self.docs:
+            self.docs[doc_key] = (len(self.docs), self._intern_string(chunk['title']),
+                                  self._intern_string(chunk['url']), cdp_id)
+
+        text = chunk['chunk_text'].encode('utf-8')
+        self.text_file.write(text)
+        self.text_offsets.append(self.text_offsets[-1] + len(text))
+        self.chunk_ids.append(chunk['id'])
+        self.chunk_docs.append(self.docs[doc_key][0])
+
+        self.heading_paths.append(self._intern_string('\n'.join(chunk.get('heading_path', []))))
+        snippet = chunk.get('snippet', summary_snippet(chunk['chunk_text']))
+        self.snippet_ends.append(len(snippet.encode('utf-8')))
+        steps = chunk['steps'] if 'steps' in chunk else extract_steps(chunk['chunk_text'])
+        encoded_steps = '\n'.join(steps).encode('utf-8')
+        self.steps_file.write(encoded_steps)
+        self.step_offsets.append(self.step_offsets[-1] + len(encoded_steps))
+
+    def commit(self) -> None:
+        """Assemble the final file and rename it over the target"""
+        self.text_file.close()
+        self.steps_file.close()
+
+        num_chunks = len(self.chunk_ids)
+        id_table_len = max(self.chunk_ids) + 1 if num_chunks else 0
+        id_to_row = np.full(id_table_len, -1, dtype=np.int32)
+        id_to_row[np.frombuffer(self.chunk_ids, dtype=np.int64)] = np.arange(num_chunks, dtype=np.int32)
+
+        docs = sorted(self.docs.values())
+        strings = sorted(self.strings, key=self.strings.get)
+        encoded_strings = [value.encode('utf-8') for value in strings]
+        string_offsets = np.zeros(len(strings) + 1, dtype=np.uint64)
+        np.cumsum([len(value) for value in encoded_strings], out=string_offsets[1:])
+        cdp_names = sorted(self.cdps, key=self.cdps.get)
+
+        sections = {
+            'chunk_ids': np.frombuffer(self.chunk_ids, dtype=np.int64).tobytes(),
+            'chunk_docs': np.frombuffer(self.chunk_docs, dtype=np.uint32).tobytes(),
+            'text_offsets': np.frombuffer(self.text_offsets, dtype=np.uint64).tobytes(),
+            'id_to_row': id_to_row.tobytes(),
+            'doc_titles': np.array([doc[1] for doc in docs], dtype=np.uint32).tobytes(),
+            'doc_urls': np.array([doc[2] for doc in docs], dtype=np.uint32).tobytes(),
+            'doc_cdps': np.array([doc[3] for doc in docs], dtype=np.uint32).tobytes(),
+            'cdp_names': np.array([self.strings[name] for name in cdp_names], dtype=np.uint32).tobytes(),
+            'string_offsets': string_offsets.tobytes(),
+            'strings': b''.join(encoded_strings),
+            'heading_paths': np.frombuffer(self.heading_paths, dtype=np.uint32).tobytes(),
+            'snippet_ends': np.frombuffer(self.snippet_ends, dtype=np.uint32).tobytes(),
+            'step_offsets': np.frombuffer(self.step_offsets, dtype=np.uint64).tobytes()
+        }
+        # Buffers spooled to disk while appending
+        spooled = {'steps': self.steps_path, 'texts': self.text_path}
+
+        offsets = []
+        position = HEADER.size
+        for name in SECTIONS:
+            position = _align(position)
+            offsets.append(position)
+            if name in spooled:
+                position += os.path.getsize(spooled[name])
+            else:
+                position += len(sections[name])
+
+        with open(self.tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, num_chunks, len(docs), len(cdp_names), len(strings),
+                                id_table_len, *offsets))
+            for name, offset in zip(SECTIONS, offsets):
+                f.write(b'\0' * (offset - f.tell()))
+                if name in spooled:
+                    with open(spooled[name], 'rb') as spool_file:
+                        while True:
+                            block = spool_file.read(1 << 20)
+                            if not block:
+                                break
+                            f.write(block)
+                else:
+                    f.write(sections[name])
+
+        for path in spooled.values():
+            os.remove(path)
+        os.replace(self.tmp_path, self.path)
+        self.committed = True
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self.committed:
+            for spool_file in (self.text_file, self.steps_file):
+                if not spool_file.closed:
+                    spool_file.close()
+            for path in (self.text_path, self.steps_path, self.tmp_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+class ChunkStore:
+    """
+    Read-only view of a chunks.bin file through mmap. Lookups by FAISS ID are
+    O(1) and read straight from the mapped pages, which the OS page cache
+    shares between every process that opens the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = PREFIX.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version not in HEADERS:
+            raise ValueError(f"{path} is not a version {VERSION} chunk store")
+        header_struct, sections = HEADERS[version]
+        header = header_struct.unpack_from(self.buffer, 0)
+        num_chunks, num_docs, num_cdps, num_strings, id_table_len = header[2:7]
+        offsets = dict(zip(sections, header[7:]))
+        self.version = version
+
+        def view(name: str, dtype: Any, count: int) -> np.ndarray:
+            return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offsets[name])
+
+        self.chunk_ids = view('chunk_ids', np.int64, num_chunks)
+        self.chunk_docs = view('chunk_docs', np.uint32, num_chunks)
+        self.text_offsets = view('text_offsets', np.uint64, num_chunks + 1)
+        self.id_to_row = view('id_to_row', np.int32, id_table_len)
+        self.doc_titles = view('doc_titles', np.uint32, num_docs)
+        self.doc_urls = view('doc_urls', np.uint32, num_docs)
+        self.doc_cdps = view('doc_cdps', np.uint32, num_docs)
+        self.cdp_names = view('cdp_names', np.uint32, num_cdps)
+        self.string_offsets = view('string_offsets', np.uint64, num_strings + 1)
+        self.strings_start = offsets['strings']
+        self.texts_start = offsets['texts']
+        if version >= 2:
+            self.heading_paths = view('heading_paths', np.uint32, num_chunks)
+            self.snippet_ends = view('snippet_ends', np.uint32, num_chunks)
+            self.step_offsets = view('step_offsets', np.uint64, num_chunks + 1)
+            self.steps_start = offsets['steps']
+        else:
+            logging.warning(f"{path} predates precomputed answer fields, extracting them per lookup; rebuild the index")
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def _string(self, index: int) -> str:
+        start = self.strings_start + int(self.string_offsets[index])
+        end = self.strings_start + int(self.string_offsets[index + 1])
+        return self.buffer[start:end].decode('utf-8')
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        start = self.texts_start + int(self.text_offsets[row])
+        end = self.texts_start + int(self.text_offsets[row + 1])
+        doc = self.chunk_docs[row]
+        chunk = {
+            'chunk_text': self.buffer[start:end].decode('utf-8'),
+            'title': self._string(self.doc_titles[doc]),
+            'url': self._string(self.doc_urls[doc]),
+            'cdp': self._string(self.cdp_names[self.doc_cdps[doc]]),
+            'id': int(self.chunk_ids[row])
+        }
+        if self.version < 2:
+            chunk.update(answer_fields(chunk))
+            return chunk
+
+        heading_path = self._string(self.heading_paths[row])
+        steps_start = self.steps_start + int(self.step_offsets[row])
+        steps_end = self.steps_start + int(self.step_offsets[row + 1])
+        steps = self.buffer[steps_start:steps_end].decode('utf-8')
+        chunk['heading_path'] = heading_path.split('\n') if heading_path else []
+        chunk['steps'] = steps.split('\n') if steps else []
+        chunk['snippet'] = self.buffer[start:start + int(self.snippet_ends[row])].decode('utf-8')
+        return chunk
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """Return the chunk with this FAISS ID, or None if there is none"""
+        if chunk_id < 0 or chunk_id >= len(self.id_to_row):
+            return None
+        row = self.id_to_row[chunk_id]
+        return self._row(row) if row >= 0 else None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self._row(row)
+
+class ListChunkStore:
+    """Same interface over a chunks.json list, for index directories built before chunks.bin"""
+
+    def __init__(self, chunks: List[Dict[str, Any]]):
+        self.chunks = chunks
+        for chunk in chunks:
+            if 'steps' not in chunk:
+                chunk.update(answer_fields(chunk))
+        # IDs are list positions for indexes built before chunk IDs
+        self.chunks_by_id = {chunk.get('id', position): chunk for position, chunk in enumerate(chunks)}
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        return self.chunks_by_id.get(chunk_id)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.chunks)
+
+def load_chunk_store(index_path: str):
+    """Open chunks.bin from an index directory, falling back to chunks.json"""
+    store_file = os.path.join(index_path, CHUNK_STORE_FILE)
+    if os.path.exists(store_file):
+        return ChunkStore(store_file)
+
+    logging.warning(f"No {CHUNK_STORE_FILE} found, parsing chunks.json")
+    with open(os.path.join(index_path, 'chunks.json'), 'r', encoding='utf-8') as f:
+        return ListChunkStore(json.load(f))
@@ -0,0 +1,256 @@
+import re
+import zlib
+import hashlib
+import logging
+from typing import List, Tuple, NamedTuple
+import numpy as np
+from encoder import TokenCounter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# About the 512 characters chunks used to hold, and the length all-MiniLM-L6-v2 was trained on
+DEFAULT_CHUNK_TOKENS = 128
+
+# Estimated Jaccard similarity of word shingles above which a chunk is a near-duplicate
+DEFAULT_DEDUP_THRESHOLD = 0.9
+
+# Most recent kept chunks a new chunk is compared against; each costs about 1 KB of memory
+DEFAULT_DEDUP_WINDOW = 100000
+
+# Markdown headings in scraped content, e.g. "## Set up a source"
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*$')
+
+# Line breaks and sentence ends inside a paragraph, captured so split text joins back unchanged
+SENTENCE_BREAK = re.compile(r'(\n+|(?<=[.!?])\s+)')
+
+# MinHash permutations are a*x + b modulo this prime, over 31-bit shingle hashes
+MINHASH_PRIME = (1 << 31) - 1
+
+class Piece(NamedTuple):
+    """A paragraph, or part of one too long for a chunk, with the separator before it"""
+    text: str
+    tokens: int
+    separator: str
+
+def update_headings(headings: List[Tuple[int, str]], lines: List[str]) -> None:
+    """Apply any Markdown headings in lines to the stack of enclosing headings"""
+    for line in lines:
+        match = HEADING_PATTERN.match(line.strip())
+        if match:
+            level = len(match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, match.group(2)))
+
+def join_pieces(pieces: List[Piece]) -> str:
+    return pieces[0].text + ''.join(piece.separator + piece.text for piece in pieces[1:])
+
+class Chunker:
+    """
+    Packs the paragraphs of a document into chunks of at most max_tokens
+    encoder tokens, so the encoder never truncates one. Paragraphs stay whole
+    unless they are longer than a chunk; those are split at line breaks and
+    sentence ends, and sentences still too long at token boundaries. Each
+    chunk can start with up to overlap_tokens of the sentences ending the
+    chunk before it.
+    """
+
+    def __init__(self, counter: TokenCounter, max_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = 0):
+        if max_tokens > counter.budget:
+            raise ValueError(f"Chunks of {max_tokens} tokens don't fit the encoder's {counter.budget}-token input")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"Chunk overlap must be at least 0 and below the chunk size of {max_tokens} tokens")
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def chunk(self, text: str) -> List[Tuple[str, List[str]]]:
+        """(chunk text, heading path) of each chunk of a document's content"""
+        chunks = []
+        headings = []  # (level, text) of the headings enclosing the current piece
+        heading_path = []
+        current = []
+        current_tokens = 0
+
+        for piece in self.pieces(text):
+            # A chunk opening with a heading sits under that heading
+            lines = piece.text.split('\n')
+            update_headings(headings, lines[:1])
+
+            if not current:
+                heading_path = [heading for _, heading in headings]
+            elif current_tokens + piece.tokens > self.max_tokens:
+                chunks.append((join_pieces(current), heading_path))
+                heading_path = [heading for _, heading in headings]
+                current = self.overlap(current, self.max_tokens - piece.tokens)
+                current_tokens = sum(overlap_piece.tokens for overlap_piece in current)
+            current.append(piece)
+            current_tokens += piece.tokens
+
+            update_headings(headings, lines[1:])
+
+        if current:
+            chunks.append((join_pieces(current), heading_path))
+        return chunks
+
+    def pieces(self, text: str) -> List[Piece]:
+        """The paragraphs of text, with any longer than a chunk split up"""
+        paragraphs = [paragraph.strip() for paragraph in text.split('\n\n') if paragraph.strip()]
+        pieces = []
+        for paragraph, tokens in zip(paragraphs, self.counter.count(paragraphs)):
+            if tokens <= self.max_tokens:
+                pieces.append(Piece(paragraph, tokens, '\n\n'))
+            else:
+                pieces.extend(self.split_sentences(paragraph, '\n\n'))
+        return pieces
+
+    def split_sentences(self, text: str, separator: str) -> List[Piece]:
+        """Split text at line breaks and sentence ends, and any sentence longer than a chunk at token boundaries"""
+        parts = SENTENCE_BREAK.split(text)
+        sentences, separators = parts[0::2], [separator] + parts[1::2]
+        pieces = []
+        for sentence, sentence_separator, tokens in zip(sentences, separators, self.counter.count(sentences)):
+            if not sentence:
+                continue
+            if tokens <= self.max_tokens:
+                pieces.append(Piece(sentence, tokens, sentence_separator))
+            else:
+                pieces.extend(self.split_tokens(sentence, sentence_separator))
+        return pieces
+
+    def split_tokens(self, text: str, separator: str) -> List[Piece]:
+        """Cut text into runs of at most max_tokens tokens, preferably where a word starts"""
+        offsets = self.counter.offsets(text)
+        pieces = []
+        start = 0
+        while start < len(offsets):
+            end = min(start + self.max_tokens, len(offsets))
+            if end < len(offsets):
+                for cut in range(end, start + 1, -1):
+                    if offsets[cut][0] > offsets[cut - 1][1]:
+                        end = cut
+                        break
+            piece_separator = separator if start == 0 else text[offsets[start - 1][1]:offsets[start][0]]
+            pieces.append(Piece(text[offsets[start][0]:offsets[end - 1][1]], end - start, piece_separator))
+            start = end
+        return pieces
+
+    def overlap(self, pieces: List[Piece], room: int) -> List[Piece]:
+        """The sentences ending pieces that fit in overlap_tokens and in room"""
+        limit = min(self.overlap_tokens, room)
+        tail = []
+        tokens = 0
+        for piece in reversed(pieces):
+            if tokens + piece.tokens <= limit:
+                tail.insert(0, piece)
+                tokens += piece.tokens
+                continue
+            # Only part of this piece fits: take its last sentences
+            for sentence in reversed(self.split_sentences(piece.text, piece.separator)):
+                if tokens + sentence.tokens > limit:
+                    break
+                tail.insert(0, sentence)
+                tokens += sentence.tokens
+            break
+        return tail
+
+class DuplicateFilter:
+    """
+    Recognizes chunks repeating an earlier chunk of the same CDP, such as the
+    navigation lists and "Get started" blocks many pages share. Exact repeats
+    are matched on their whitespace- and case-normalized text. Near-duplicates
+    are found with MinHash signatures of word shingles, bucketed by LSH bands:
+    a new chunk is only compared with the kept chunks sharing one of its bands,
+    and is a duplicate if their signatures agree on at least threshold of their
+    rows. Lookups therefore don't grow with the corpus.
+
+    Only the last window kept chunks are remembered, in a ring buffer whose
+    slots drop their digest and band entries when reused. Memory is bounded
+    at about 1 KB per slot, most of it dict entries, whatever the corpus size.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_DEDUP_THRESHOLD, num_perm: int = 64, bands: int = 8,
+                 shingle_size: int = 3, seed: int = 1, window: int = DEFAULT_DEDUP_WINDOW):
+        self.threshold = threshold  # 1.0 only drops exact repeats
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.window = window
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self.band_weights = rng.randint(1, MINHASH_PRIME, size=self.rows).astype(np.uint64)
+        self.exact = {}  # Digest of CDP and normalized text -> slot of the kept chunk
+        self.buckets = {}  # CDP -> band key -> slot of the latest kept chunk with that band
+        # Per slot: the kept chunk's signature, digest, band keys and CDP. np.empty only
+        # reserves address space, so pages are committed as slots are first used.
+        self.signatures = np.empty((window, num_perm), dtype=np.uint32)
+        self.slot_digests = np.empty(window, dtype=np.uint64)
+        self.slot_keys = np.empty((window, bands), dtype=np.uint64)
+        self.slot_cdps = [None] * window
+        self.kept = 0
+        self.exact_dropped = 0
+        self.near_dropped = 0
+
+    def is_duplicate(self, cdp: str, text: str) -> bool:
+        """Whether text repeats a remembered chunk of cdp; if not, it is remembered"""
+        words = text.lower().split()
+        digest = int.from_bytes(hashlib.blake2b(f"{cdp}\0{' '.join(words)}".encode('utf-8'), digest_size=8).digest(),
+                                'little')
+        if digest in self.exact:
+            self.exact_dropped += 1
+            return True
+
+        signature, keys = None, []
+        if self.threshold < 1.0:
+            signature = self.signature(words)
+            keys = self.band_keys(signature)
+            buckets = self.buckets.get(cdp, {})
+            for key in keys:
+                slot = buckets.get(key)
+                if slot is not None and np.mean(self.signatures[slot] == signature) >= self.threshold:
+                    self.near_dropped += 1
+                    return True
+
+        self.remember(cdp, digest, signature, keys)
+        return False
+
+    def remember(self, cdp: str, digest: int, signature: np.ndarray, keys: List[int]) -> None:
+        slot = self.kept % self.window
+        if self.kept >= self.window:
+            self.forget(slot)
+        self.slot_cdps[slot] = cdp
+        self.slot_digests[slot] = digest
+        self.exact[digest] = slot
+        if signature is not None:
+            self.signatures[slot] = signature
+            self.slot_keys[slot] = keys
+            buckets = self.buckets.setdefault(cdp, {})
+            for key in keys:
+                buckets[key] = slot
+        self.kept += 1
+
+    def forget(self, slot: int) -> None:
+        """Drop the entries of the chunk in slot, unless a later chunk has taken them over"""
+        digest = int(self.slot_digests[slot])
+        if self.exact.get(digest) == slot:
+            del self.exact[digest]
+        if self.threshold < 1.0:
+            buckets = self.buckets[self.slot_cdps[slot]]
+            for key in self.slot_keys[slot].tolist():
+                if buckets.get(key) == slot:
+                    del buckets[key]
+
+    def signature(self, words: List[str]) -> np.ndarray:
+        size = self.shingle_size
+        shingles = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) & MINHASH_PRIME for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> List[int]:
+        # Each band's rows are folded into 56 bits tagged with the band in the low byte, so keys
+        # fit a uint64 slot; colliding keys are harmless since candidates are checked against
+        # the full signature
+        folded = (signature.reshape(self.bands, self.rows).astype(np.uint64) * self.band_weights).sum(axis=1)
+        return [(key & 0xFFFFFFFFFFFFFF) << 8 | band for band, key in enumerate(folded.tolist())]
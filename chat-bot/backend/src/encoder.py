@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import argparse
+import time
+from typing import List, Dict, Any, Tuple
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# torch: sentence-transformers in PyTorch eager mode; onnx: ONNX Runtime over an exported
+# (optionally int8-quantized) model; hash: deterministic token hashing for tests, no model needed
+ENCODER_BACKENDS = ['torch', 'onnx', 'hash']
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+
+# Written next to docs.index: which encoder produced the vectors
+ENCODER_INFO_FILE = 'encoder.json'
+
+# Sequence length of all-MiniLM-L6-v2; longer inputs are truncated
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+# Dimension of the hashing stub, matching all-MiniLM-L6-v2 so index settings carry over
+HASH_DIMENSION = 384
+
+class Encoder:
+    """
+    Turns texts into L2-normalized float32 vectors. Vectors from two encoders
+    can only be compared if their spaces match: the torch and onnx backends of
+    one model share a space, the hashing stub has its own.
+    """
+    backend = None
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, threads: int = 0, max_seq_length: int = None,
+                 batch_size: int = 32):
+        self.model_name = model_name
+        self.threads = threads  # Intra-op threads, 0 for the runtime's default
+        self.max_seq_length = max_seq_length or DEFAULT_MAX_SEQ_LENGTH
+        self.batch_size = batch_size
+
+    @property
+    def space(self) -> str:
+        return encoder_space(self.backend, self.model_name)
+
+    @property
+    def dimension(self) -> int:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def set_threads(self, threads: int) -> None:
+        """Change the intra-op thread count, e.g. after forking a worker"""
+        self.threads = threads
+
+    def info(self) -> Dict[str, Any]:
+        return encoder_info(self.backend, self.model_name, self.dimension, self.max_seq_length)
+
+    def token_counter(self) -> 'TokenCounter':
+        return TokenCounter(None, self.max_seq_length)
+
+class TokenCounter:
+    """
+    Counts tokens the way an encoder's tokenizer does. The special tokens the
+    model adds to every input are not counted but come out of the budget.
+    """
+
+    def __init__(self, tokenizer=None, max_seq_length: int = None):
+        self.tokenizer = tokenizer  # Hugging Face tokenizer, or None for the whitespace tokens of HashEncoder
+        self.max_seq_length = max_seq_length or DEFAULT_MAX_SEQ_LENGTH
+        self.special_tokens = tokenizer.num_special_tokens_to_add() if tokenizer is not None else 0
+
+    @property
+    def budget(self) -> int:
+        """Tokens of text that fit in one encoder input without truncation"""
+        return self.max_seq_length - self.special_tokens
+
+    def count(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [len(text.split()) for text in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """Character span of each token in text"""
+        if self.tokenizer is None:
+            return [match.span() for match in re.finditer(r'\S+', text)]
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [tuple(span) for span in encoded['offset_mapping']]
+
+class TorchEncoder(Encoder):
+    """The sentence-transformers model in PyTorch eager mode"""
+    backend = 'torch'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, threads: int = 0, max_seq_length: int = None,
+                 batch_size: int = 32):
+        super().__init__(model_name, threads, max_seq_length, batch_size)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.model.max_seq_length = self.max_seq_length
+        self.set_threads(threads)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def set_threads(self, threads: int) -> None:
+        super().set_threads(threads)
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def token_counter(self) -> TokenCounter:
+        return TokenCounter(self.model.tokenizer, self.max_seq_length)
+
+class OnnxEncoder(Encoder):
+    """
+    The same model exported to ONNX (see export_onnx) and run by ONNX Runtime
+    with all graph optimizations. Mean pooling and normalization are done in
+    numpy, exactly as the sentence-transformers pipeline does them. Texts are
+    encoded in batches of similar length so little time goes into padding.
+    The session is created in the process that first encodes, so it is safe to
+    load the encoder before gunicorn forks its workers.
+    """
+    backend = 'onnx'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, threads: int = 0, max_seq_length: int = None,
+                 batch_size: int = 32, model_path: str = None):
+        super().__init__(model_name, threads, max_seq_length, batch_size)
+        if not model_path or not os.path.exists(model_path):
+            raise ValueError(f"ONNX model not found at {model_path!r}, create one with: python encoder.py export")
+        from transformers import AutoTokenizer
+        # A directory from export_onnx holds the int8 model if it was quantized, the float one otherwise
+        if os.path.isdir(model_path):
+            quantized = os.path.join(model_path, 'model_int8.onnx')
+            model_path = quantized if os.path.exists(quantized) else os.path.join(model_path, 'model.onnx')
+        self.model_path = model_path
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+        with open(os.path.join(os.path.dirname(model_path), 'config.json'), 'r', encoding='utf-8') as f:
+            self.hidden_size = json.load(f)['hidden_size']
+        self.session = None
+        self.session_pid = None  # Process the session was created in
+
+    @property
+    def dimension(self) -> int:
+        return self.hidden_size
+
+    def set_threads(self, threads: int) -> None:
+        super().set_threads(threads)
+        self.session = None  # Recreated with the new thread count on the next call
+
+    def get_session(self):
+        if self.session is None or self.session_pid != os.getpid():
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+            self.session_pid = os.getpid()
+            self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        return self.session
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        session = self.get_session()
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            inputs = self.tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: inputs[name].astype(np.int64) for name in self.input_names if name in inputs}
+            token_embeddings = session.run(None, feed)[0]
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            embeddings[rows] = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def token_counter(self) -> TokenCounter:
+        return TokenCounter(self.tokenizer, self.max_seq_length)
+
+class HashEncoder(Encoder):
+    """
+    Deterministic stand-in for tests and benchmarks: each token adds a signed
+    unit to one hashed dimension. Needs no model download and gives the same
+    vectors on every machine, but its vectors only match each other.
+    """
+    backend = 'hash'
+
+    @property
+    def dimension(self) -> int:
+        return HASH_DIMENSION
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), HASH_DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split()[:self.max_seq_length]:
+                digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+                embeddings[row, digest % HASH_DIMENSION] += 1.0 if digest >> 63 else -1.0
+            # Texts without tokens still get a unit vector
+            embeddings[row, 0] += 1e-3
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+def encoder_space(backend: str, model_name: str = None) -> str:
+    """Name of the vector space an encoder produces; vectors can only be compared within one"""
+    return f"hash-{HASH_DIMENSION}" if backend == 'hash' else model_name or DEFAULT_MODEL
+
+def encoder_info(backend: str, model_name: str, dimension: int, max_seq_length: int = None) -> Dict[str, Any]:
+    """What encoder.json records about the encoder that built an index"""
+    return {
+        'backend': backend,
+        'model': model_name or DEFAULT_MODEL,
+        'space': encoder_space(backend, model_name),
+        'dimension': dimension,
+        'max_seq_length': max_seq_length or DEFAULT_MAX_SEQ_LENGTH
+    }
+
+def make_encoder(backend: str = 'torch', model_name: str = None, threads: int = 0, max_seq_length: int = None,
+                 model_path: str = None) -> Encoder:
+    """Create an encoder; model_path is the exported ONNX model for the onnx backend"""
+    model_name = model_name or DEFAULT_MODEL
+    if backend == 'torch':
+        encoder = TorchEncoder(model_name, threads, max_seq_length)
+    elif backend == 'onnx':
+        encoder = OnnxEncoder(model_name, threads, max_seq_length, model_path=model_path)
+    elif backend == 'hash':
+        encoder = HashEncoder(model_name, threads, max_seq_length)
+    else:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {ENCODER_BACKENDS}")
+    logging.info(f"Loaded {backend} encoder for {encoder.space} ({encoder.dimension} dims, "
+                 f"max {encoder.max_seq_length} tokens, {threads or 'default'} threads)")
+    return encoder
+
+def make_token_counter(backend: str = 'torch', model_name: str = None, max_seq_length: int = None,
+                       model_path: str = None, **_: Any) -> TokenCounter:
+    """
+    Token counter of the encoder make_encoder would create from the same
+    arguments, loading only its tokenizer
+    """
+    if backend == 'hash':
+        return TokenCounter(None, max_seq_length)
+    from transformers import AutoTokenizer
+    if backend == 'onnx':
+        if not model_path or not os.path.exists(model_path):
+            raise ValueError(f"ONNX model not found at {model_path!r}, create one with: python encoder.py export")
+        tokenizer_dir = model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+    else:
+        tokenizer_dir = hub_model_name(model_name or DEFAULT_MODEL)
+    return TokenCounter(AutoTokenizer.from_pretrained(tokenizer_dir), max_seq_length)
+
+def hub_model_name(model_name: str) -> str:
+    """Hugging Face Hub ID of a sentence-transformers model, which may be given by its short name"""
+    return model_name if '/' in model_name else f'sentence-transformers/{model_name}'
+
+def save_encoder_info(index_path: str, info: Dict[str, Any]) -> None:
+    """Record the encoder that built an index next to docs.index"""
+    tmp_path = os.path.join(index_path, ENCODER_INFO_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_path, os.path.join(index_path, ENCODER_INFO_FILE))
+
+def load_encoder_info(index_path: str) -> Dict[str, Any]:
+    """The encoder an index was built with; indexes from before encoder.json used the torch model"""
+    info_file = os.path.join(index_path, ENCODER_INFO_FILE)
+    if not os.path.exists(info_file):
+        return encoder_info('torch', DEFAULT_MODEL, 384)
+    with open(info_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def check_compatible(encoder: Encoder, index_info: Dict[str, Any]) -> None:
+    """Raise ValueError if encoder's vectors can't be searched against an index built from index_info"""
+    if encoder.space != index_info['space'] or encoder.dimension != index_info['dimension']:
+        raise ValueError(f"{encoder.backend} encoder for {encoder.space} ({encoder.dimension} dims) can't search an "
+                         f"index built by the {index_info['backend']} encoder for {index_info['space']} "
+                         f"({index_info['dimension']} dims); rebuild the index or switch encoders")
+    if encoder.max_seq_length != index_info['max_seq_length']:
+        logging.warning(f"Encoder truncates at {encoder.max_seq_length} tokens, the index was built "
+                        f"with {index_info['max_seq_length']}")
+
+def encoder_for_index(index_path: str, backend: str = None, model_path: str = None, threads: int = 0,
+                      max_seq_length: int = None) -> Encoder:
+    """
+    Create an encoder for querying the index in index_path. The backend defaults
+    to one producing the index's vectors (torch for torch- or onnx-built indexes)
+    and is checked against the index either way.
+    """
+    info = load_encoder_info(index_path)
+    if backend is None:
+        backend = 'hash' if info['backend'] == 'hash' else 'torch'
+    encoder = make_encoder(backend, info['model'], threads, max_seq_length or info['max_seq_length'], model_path)
+    check_compatible(encoder, info)
+    return encoder
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> str:
+    """
+    Export the transformer of a sentence-transformers model to ONNX, with its
+    tokenizer and config, and optionally an int8 dynamically quantized copy.
+    Returns the path OnnxEncoder should load.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = hub_model_name(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name).eval()
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    sample = tokenizer(["How do I set up a source?"], return_tensors='pt')
+    # Positional order of the model's forward()
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    model_path = os.path.join(output_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    logging.info(f"Exported {hub_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.join(output_dir, 'model_int8.onnx')
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logging.info(f"Quantized weights to int8 in {quantized_path}")
+        return quantized_path
+    return model_path
+
+def compare_encoders(reference: Encoder, candidate: Encoder, texts: List[str], repeat: int = 3) -> Dict[str, Any]:
+    """Latency of two encoders on texts, and how closely the candidate's vectors match the reference's"""
+    report = {}
+    for name, encoder in (('reference', reference), ('candidate', candidate)):
+        encoder.encode(texts[:1])  # Load lazily created sessions before timing
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for text in texts:
+                encoder.encode([text])  # One query per call, the way the API encodes
+            best = min(best, time.perf_counter() - started)
+        report[f'{name}_ms_per_query'] = best / len(texts) * 1000.0
+    similarity = np.sum(reference.encode(texts) * candidate.encode(texts), axis=1)
+    report['mean_cosine'] = float(similarity.mean())
+    report['min_cosine'] = float(similarity.min())
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and compare encoder backends")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help="Export the model, optionally with int8 weights")
+    export.add_argument('--model', default=DEFAULT_MODEL)
+    export.add_argument('--output-dir', default='data/encoder/onnx')
+    export.add_argument('--no-quantize', action='store_true', help="Only write the float32 model")
+    export.add_argument('--opset', type=int, default=14)
+    compare = subparsers.add_parser('compare', help="Time a backend against torch and check their vectors agree")
+    compare.add_argument('--backend', choices=ENCODER_BACKENDS, default='onnx')
+    compare.add_argument('--model', default=DEFAULT_MODEL)
+    compare.add_argument('--model-path', default='data/encoder/onnx', help="Exported ONNX model or its directory")
+    compare.add_argument('--threads', type=int, default=0, help="Intra-op threads, 0 for the runtime's default")
+    compare.add_argument('--queries', help="File with one question per line; defaults to a few sample questions")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.model, args.output_dir, not args.no_quantize, args.opset)
+    elif args.command == 'compare':
+        if args.queries:
+            with open(args.queries, 'r', encoding='utf-8') as f:
+                texts = [line.strip() for line in f if line.strip()]
+        else:
+            texts = [
+                "How do I set up a new source in Segment?",
+                "How can I create a user profile in mParticle?",
+                "How do I build an audience segment in Lytics?",
+                "How can I integrate my data with Zeotap?",
+                "How does Segment's audience creation process compare to Lytics'?"
+            ]
+        reference = make_encoder('torch', args.model, args.threads)
+        candidate = make_encoder(args.backend, args.model, args.threads, model_path=args.model_path)
+        report = compare_encoders(reference, candidate, texts)
+        print(f"torch: {report['reference_ms_per_query']:.2f} ms/query, {args.backend}: "
+              f"{report['candidate_ms_per_query']:.2f} ms/query")
+        print(f"cosine to torch vectors: mean {report['mean_cosine']:.4f}, min {report['min_cosine']:.4f}")
+        if candidate.space != reference.space:
+            logging.warning(f"{args.backend} vectors are in another space and can't search torch-built indexes")
+
+if __name__ == "__main__":
+    main()
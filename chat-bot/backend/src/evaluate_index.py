@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+from typing import List, Dict, Any
+import numpy as np
+import faiss
+from chunk_store import load_chunk_store
+from index_factory import make_index_config, build_index, factory_string
+from encoder import ENCODER_BACKENDS, Encoder, encoder_for_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Settings compared when no --config is given
+DEFAULT_CONFIGS = [
+    'flat',
+    'ivf_flat:nprobe=1',
+    'ivf_flat:nprobe=4',
+    'ivf_flat:nprobe=16',
+    'ivf_pq:nprobe=4',
+    'ivf_pq:nprobe=16',
+    'hnsw:ef_search=16',
+    'hnsw:ef_search=64',
+    'hnsw:ef_search=128',
+    'flat:storage=fp16',
+    'flat:storage=int8',
+    'flat:storage=int8,rerank=4',
+    'flat:storage=pq',
+    'flat:storage=pq,rerank=4',
+    'flat:storage=pq,rerank=16',
+    'ivf_flat:storage=int8,nprobe=16',
+    'hnsw:storage=int8,ef_search=64'
+]
+
+def parse_config(spec: str) -> Dict[str, Any]:
+    """Parse 'index_type:key=value,key=value' into an index config"""
+    index_type, _, params = spec.partition(':')
+    overrides = {}
+    for param in filter(None, params.split(',')):
+        key, _, value = param.partition('=')
+        value = value.strip()
+        overrides[key.strip()] = int(value) if value.isdigit() else value
+    return make_index_config(index_type=index_type, **overrides)
+
+def load_corpus_embeddings(index_path: str, chunks: List[Dict[str, Any]], encoder: Encoder) -> np.ndarray:
+    """Reuse the float32 vectors stored in docs.index (flat or re-ranked), or re-encode the chunks otherwise"""
+    # A wrapper owns the index it wraps, so it must stay referenced while the inner index is read
+    outer = faiss.read_index(os.path.join(index_path, 'docs.index'))
+    index = outer
+    if isinstance(outer, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(outer.index)
+    refine = index
+    if isinstance(refine, faiss.IndexRefineFlat):
+        index = faiss.downcast_index(refine.refine_index)
+    if isinstance(index, faiss.IndexFlat) and index.ntotal == len(chunks):
+        logging.info("Reusing vectors from flat docs.index")
+        return index.reconstruct_n(0, index.ntotal)
+
+    logging.info(f"Encoding {len(chunks)} chunks...")
+    return encoder.encode([chunk['chunk_text'] for chunk in chunks])
+
+def sample_queries(chunks: List[Dict[str, Any]], num_queries: int, seed: int) -> List[str]:
+    """Use the leading line of random chunks (usually a heading) as stand-in questions"""
+    rng = random.Random(seed)
+    sampled = rng.sample(chunks, min(num_queries, len(chunks)))
+    return [chunk['chunk_text'].split('\n')[0].lstrip('#').strip() for chunk in sampled]
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k neighbours that were also returned"""
+    hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def describe(config: Dict[str, Any], num_vectors: int) -> str:
+    """Label a config by its factory string plus the query-time parameter that applies"""
+    description = factory_string(config, num_vectors)
+    if description.startswith('IVF'):
+        description += f" nprobe={config['nprobe']}"
+    elif description.startswith('HNSW'):
+        description += f" ef={config['ef_search']}"
+    if description.endswith('RFlat'):
+        description += f" x{config['rerank']}"
+    return description
+
+def evaluate(embeddings: np.ndarray, query_embeddings: np.ndarray, configs: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """Build each config and measure recall@k against exact search, QPS and memory"""
+    baseline = faiss.IndexFlatIP(embeddings.shape[1])
+    baseline.add(embeddings)
+    _, truth = baseline.search(query_embeddings, k)
+
+    report = []
+    for config in configs:
+        started = time.perf_counter()
+        index = build_index(embeddings, config)
+        build_seconds = time.perf_counter() - started
+
+        # One query per call, the way the API searches
+        started = time.perf_counter()
+        found = np.vstack([index.search(query_embeddings[i:i + 1], k)[1] for i in range(len(query_embeddings))])
+        search_seconds = time.perf_counter() - started
+
+        report.append({
+            'config': config,
+            'label': describe(config, len(embeddings)),
+            f'recall@{k}': round(recall_at_k(found, truth), 4),
+            'qps': round(len(query_embeddings) / search_seconds, 1),
+            'mean_latency_ms': round(search_seconds / len(query_embeddings) * 1000.0, 3),
+            'memory_bytes': int(faiss.serialize_index(index).size),
+            # Float32 copies kept for re-ranking; memory-mapped, only re-ranked rows are read
+            'rerank_bytes': int(faiss.serialize_index(index.refine_index).size) if isinstance(index, faiss.IndexRefine) else 0,
+            'build_seconds': round(build_seconds, 3)
+        })
+        logging.info(f"Evaluated {report[-1]['label']}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index settings by recall@k against the flat baseline, QPS and memory")
+    parser.add_argument('--index-path', default='data/index')
+    parser.add_argument('--config', action='append', dest='configs',
+                        help="Setting to evaluate as index_type:key=value,... (repeatable), e.g. ivf_flat:nlist=64,nprobe=8")
+    parser.add_argument('--queries', help="File with one question per line; defaults to headings sampled from the corpus")
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, help="Query encoder backend; defaults to one matching the index")
+    parser.add_argument('--onnx-model-path', default='data/encoder/onnx', help="Exported ONNX model or its directory")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    chunks = list(load_chunk_store(args.index_path))
+
+    encoder = encoder_for_index(args.index_path, args.encoder, args.onnx_model_path)
+    embeddings = load_corpus_embeddings(args.index_path, chunks, encoder)
+
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(chunks, args.num_queries, args.seed)
+    query_embeddings = encoder.encode(queries)
+
+    configs = [parse_config(spec) for spec in (args.configs or DEFAULT_CONFIGS)]
+    report = evaluate(embeddings, query_embeddings, configs, args.k)
+
+    print(f"\n{len(embeddings)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<32}{'recall@' + str(args.k):>10}{'qps':>10}{'ms/query':>10}{'memory MB':>12}"
+          f"{'re-rank MB':>12}{'build s':>10}")
+    for row in report:
+        print(f"{row['label']:<32}{row[f'recall@{args.k}']:>10.4f}{row['qps']:>10.1f}"
+              f"{row['mean_latency_ms']:>10.3f}{row['memory_bytes'] / 1e6:>12.2f}{row['rerank_bytes'] / 1e6:>12.2f}"
+              f"{row['build_seconds']:>10.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
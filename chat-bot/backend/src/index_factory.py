@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import logging
+import tempfile
+from typing import Dict, Any, Optional
+import numpy as np
+import faiss
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDEX_TYPES = ['flat', 'ivf_flat', 'ivf_pq', 'hnsw']
+
+# How vectors are encoded: as is, as 16-bit floats, as 8-bit scalar codes or as PQ codes
+STORAGE_TYPES = ['float32', 'fp16', 'int8', 'pq']
+
+INDEX_CONFIG_FILE = 'index_config.json'
+
+DEFAULT_INDEX_CONFIG = {
+    'index_type': 'flat',
+    # IVF: number of coarse clusters at build time, clusters probed per query
+    'nlist': 100,
+    'nprobe': 10,
+    # PQ: sub-quantizers (must divide the embedding dimension) and bits per code
+    'pq_m': 16,
+    'pq_nbits': 8,
+    # HNSW: graph degree, build-time and query-time beam widths
+    'hnsw_m': 32,
+    'ef_construction': 40,
+    'ef_search': 64,
+    # Vector encoding of flat, ivf_flat and hnsw indexes, one of STORAGE_TYPES (ivf_pq always stores PQ codes)
+    'storage': 'float32',
+    # Re-rank rerank * k candidates of a quantized index against float32 copies of the vectors; 0 disables
+    'rerank': 0
+}
+
+# FAISS recommends at least this many training points per IVF cluster
+MIN_POINTS_PER_CENTROID = 39
+
+# Vectors used to find the per-dimension value ranges of int8 codes
+SQ_TRAINING_POINTS = 1000
+
+# Rows read back at a time when adding spilled vectors to a freshly trained index
+SPILL_READ_ROWS = 8192
+
+def make_index_config(**overrides: Any) -> Dict[str, Any]:
+    """Return the default index config with the given overrides applied"""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    for key, value in overrides.items():
+        if key not in config:
+            raise ValueError(f"Unknown index config option: {key}")
+        if value is not None:
+            config[key] = value
+    if config['index_type'] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{config['index_type']}', expected one of {INDEX_TYPES}")
+    if config['storage'] not in STORAGE_TYPES:
+        raise ValueError(f"Unknown storage '{config['storage']}', expected one of {STORAGE_TYPES}")
+    if config['index_type'] == 'ivf_pq' and config['storage'] not in ('float32', 'pq'):
+        raise ValueError(f"ivf_pq stores PQ codes, use ivf_flat for {config['storage']} storage")
+    return config
+
+def vector_encoding(config: Dict[str, Any], num_vectors: int) -> str:
+    """Factory code of the storage encoding; PQ falls back to int8 when there are too few vectors to train it"""
+    storage = config['storage']
+    if storage == 'pq' and num_vectors < 2 ** config['pq_nbits']:
+        storage = 'int8'
+    if storage == 'pq':
+        return f"PQ{config['pq_m']}x{config['pq_nbits']}"
+    return {'float32': 'Flat', 'fp16': 'SQfp16', 'int8': 'SQ8'}[storage]
+
+def factory_string(config: Dict[str, Any], num_vectors: int) -> str:
+    """
+    Build the faiss.index_factory description for a config, shrinking or
+    downgrading IVF/PQ settings when there are too few vectors to train them
+    """
+    description = _base_factory_string(config, num_vectors)
+    # Re-ranking only recovers precision that quantization lost
+    if config['rerank'] > 0 and not description.endswith(('Flat', f"HNSW{config['hnsw_m']}")):
+        description += ",RFlat"
+    return description
+
+def _base_factory_string(config: Dict[str, Any], num_vectors: int) -> str:
+    index_type = config['index_type']
+    encoding = vector_encoding(config, num_vectors)
+    if index_type == 'hnsw':
+        return f"HNSW{config['hnsw_m']}" if encoding == 'Flat' else f"HNSW{config['hnsw_m']},{encoding}"
+    if index_type == 'flat':
+        return encoding
+
+    nlist = min(config['nlist'], num_vectors // MIN_POINTS_PER_CENTROID)
+    if nlist < 1:
+        return encoding
+    if index_type == 'ivf_pq':
+        # PQ codebooks need at least one training point per centroid
+        if num_vectors >= 2 ** config['pq_nbits']:
+            return f"IVF{nlist},PQ{config['pq_m']}x{config['pq_nbits']}"
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},{encoding}"
+
+def train_index(sample: np.ndarray, config: Dict[str, Any]) -> faiss.Index:
+    """Create an empty inner-product index sized for the sample and train it on the sample"""
+    description = factory_string(config, len(sample))
+    requested = factory_string(config, sys.maxsize)
+    if description != requested:
+        logging.warning(f"Only {len(sample)} vectors, building {description} instead of {requested}")
+
+    index = faiss.index_factory(sample.shape[1], description, faiss.METRIC_INNER_PRODUCT)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = config['ef_construction']
+    if not index.is_trained:
+        index.train(sample)
+    return index
+
+def build_index(embeddings: np.ndarray, config: Dict[str, Any], ids: Optional[np.ndarray] = None) -> faiss.Index:
+    """Create, train and fill an inner-product index; wrap it in an ID map when ids are given"""
+    index = train_index(embeddings, config)
+
+    if ids is not None:
+        index = faiss.IndexIDMap(index)
+        index.add_with_ids(embeddings, ids)
+    else:
+        index.add(embeddings)
+
+    apply_search_params(index, config)
+    return index
+
+def training_sample_size(config: Dict[str, Any]) -> int:
+    """Number of vectors needed before an index of this config can be trained at full size"""
+    required = 1
+    if config['index_type'] in ('ivf_flat', 'ivf_pq'):
+        required = config['nlist'] * MIN_POINTS_PER_CENTROID
+    if config['index_type'] == 'ivf_pq' or config['storage'] == 'pq':
+        # Each sub-quantizer is its own k-means over 2 ** pq_nbits centroids
+        required = max(required, 2 ** config['pq_nbits'] * MIN_POINTS_PER_CENTROID)
+    elif config['storage'] == 'int8':
+        required = max(required, SQ_TRAINING_POINTS)
+    return required
+
+class StreamingIndexBuilder:
+    """
+    Builds an ID-mapped index from batches of vectors. Indexes that need no
+    training take each batch as it comes. IVF, PQ and int8 indexes are trained
+    on a uniform reservoir sample of the whole stream, so the sample covers
+    every CDP even though the indexer sends them one after another. Until the
+    stream ends their vectors are spilled to a temporary file, which keeps
+    memory bounded by the size of the training sample.
+    """
+
+    def __init__(self, config: Dict[str, Any], index: Optional[faiss.Index] = None, seed: int = 0):
+        self.config = config
+        self.index = index  # Pass an existing, trained index to keep adding to it
+        self.required = training_sample_size(config)
+        self.rng = np.random.default_rng(seed)  # Seeded so rebuilds of the same corpus are identical
+        self.reservoir = None  # Up to required vectors sampled uniformly from everything added so far
+        self.reservoir_ids = None
+        self.seen = 0
+        self.spill_vectors = None  # Temporary files holding every vector and ID added before training
+        self.spill_ids = None
+
+    def add(self, embeddings: np.ndarray, ids: np.ndarray) -> None:
+        """Add a batch of normalized vectors with their chunk IDs"""
+        if self.index is None and self.required <= 1:
+            self.index = build_index(embeddings, self.config, ids=ids)
+            return
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+            return
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if self.reservoir is None:
+            self.reservoir = np.empty((self.required, embeddings.shape[1]), dtype=np.float32)
+            self.reservoir_ids = np.empty(self.required, dtype=np.int64)
+            self.spill_vectors = tempfile.TemporaryFile()
+            self.spill_ids = tempfile.TemporaryFile()
+        self.spill_vectors.write(embeddings.tobytes())
+        self.spill_ids.write(ids.tobytes())
+
+        # Algorithm R: the first required vectors fill the reservoir, and the t-th
+        # (0-based) after that replaces a random slot with probability required / (t + 1)
+        fill = max(0, min(len(embeddings), self.required - self.seen))
+        self.reservoir[self.seen:self.seen + fill] = embeddings[:fill]
+        self.reservoir_ids[self.seen:self.seen + fill] = ids[:fill]
+        if fill < len(embeddings):
+            slots = self.rng.integers(0, np.arange(self.seen + fill, self.seen + len(embeddings)) + 1)
+            for row in np.flatnonzero(slots < self.required):
+                self.reservoir[slots[row]] = embeddings[fill + row]
+                self.reservoir_ids[slots[row]] = ids[fill + row]
+        self.seen += len(embeddings)
+
+    def finish(self) -> Optional[faiss.Index]:
+        """Return the finished index, or None if no vectors were ever added"""
+        if self.index is None and self.seen:
+            if self.seen <= self.required:
+                # The reservoir holds every vector: build_index shrinks the config to fit them
+                self.index = build_index(self.reservoir[:self.seen], self.config, ids=self.reservoir_ids[:self.seen])
+            else:
+                self.index = faiss.IndexIDMap(train_index(self.reservoir, self.config))
+                self._add_spilled()
+                apply_search_params(self.index, self.config)
+            self._close_spill()
+        return self.index
+
+    def _add_spilled(self) -> None:
+        """Add every spilled vector, in arrival order, to the trained index"""
+        dimension = self.reservoir.shape[1]
+        self.spill_vectors.seek(0)
+        self.spill_ids.seek(0)
+        while True:
+            ids = np.frombuffer(self.spill_ids.read(SPILL_READ_ROWS * 8), dtype=np.int64)
+            if not len(ids):
+                break
+            vectors = np.frombuffer(self.spill_vectors.read(len(ids) * dimension * 4), dtype=np.float32)
+            self.index.add_with_ids(vectors.reshape(len(ids), dimension), ids)
+
+    def _close_spill(self) -> None:
+        for spill in (self.spill_vectors, self.spill_ids):
+            if spill is not None:
+                spill.close()
+        self.spill_vectors = self.spill_ids = None
+        self.reservoir = self.reservoir_ids = None
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index doing the candidate search, without its ID map and re-rank wrappers"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.base_index)
+    return index
+
+def apply_search_params(index: faiss.Index, config: Dict[str, Any]) -> None:
+    """Set query-time tuning parameters (nprobe, efSearch, re-rank depth) on an index"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexRefine):
+        index.k_factor = max(config['rerank'], 1)
+    index = base_index(index)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config['nprobe'], ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config['ef_search']
+
+def read_index(path: str, use_mmap: bool = False) -> faiss.Index:
+    """
+    Read an index from disk. With use_mmap the vector storage is memory-mapped
+    read-only, so processes opening the same file share its pages through the
+    OS page cache instead of each holding a private copy. For re-ranked indexes
+    that includes the float32 vectors, of which only the rows re-ranked are read.
+    """
+    if not use_mmap:
+        return faiss.read_index(path)
+
+    # IO_FLAG_MMAP_IFC maps flat vector storage; older FAISS versions only map IVF lists
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError as e:
+        logging.warning(f"Can't memory-map {path}, loading it into memory instead: {str(e).strip()}")
+        return faiss.read_index(path)
+
+def save_index_config(index_path: str, config: Dict[str, Any]) -> None:
+    """Save the index config next to docs.index; written to a temporary file and renamed, like the index"""
+    tmp_path = os.path.join(index_path, INDEX_CONFIG_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, os.path.join(index_path, INDEX_CONFIG_FILE))
+
+def load_index_config(index_path: str) -> Dict[str, Any]:
+    """Load the saved index config, defaulting to flat for indexes built before it existed"""
+    config_file = os.path.join(index_path, INDEX_CONFIG_FILE)
+    if not os.path.exists(config_file):
+        return make_index_config()
+    with open(config_file, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    return make_index_config(**{key: value for key, value in saved.items() if key in DEFAULT_INDEX_CONFIG})
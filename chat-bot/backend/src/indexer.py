@@ -1,29 +1,64 @@
 import os
 import json
 import logging
-from typing import List, Dict, Any
+import argparse
+import hashlib
+import time
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
+from encoder import (ENCODER_BACKENDS, DEFAULT_MODEL, DEFAULT_MAX_SEQ_LENGTH, make_encoder, make_token_counter,
+                     encoder_space, encoder_info, save_encoder_info)
+from chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_DEDUP_THRESHOLD, DEFAULT_DEDUP_WINDOW, Chunker, DuplicateFilter
+from chunk_store import CHUNK_STORE_FILE, ChunkStore, ChunkStoreWriter, extract_steps, summary_snippet
+from lexical_index import LEXICAL_INDEX_FILE, build_lexical_index
+from index_factory import INDEX_TYPES, STORAGE_TYPES, make_index_config, save_index_config, StreamingIndexBuilder
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Maps chunk content hashes to the FAISS IDs of their embedded vectors
+MANIFEST_FILE = 'manifest.json'
+
+# Written by scraper.py next to each CDP's pages: what its last crawl added, changed and removed
+CRAWL_CHANGES_FILE = 'changes.json'
+
 class DocumentIndexer:
-    def __init__(self, docs_dir: str, index_save_path: str = 'data/index'):
+    def __init__(self, docs_dir: str, index_save_path: str = 'data/index', index_config: Dict[str, Any] = None,
+                 batch_size: int = 256, workers: int = 1, encoder_config: Dict[str, Any] = None,
+                 chunk_tokens: int = None, chunk_overlap: int = 0,
+                 dedup_threshold: Optional[float] = DEFAULT_DEDUP_THRESHOLD, dedup_window: int = DEFAULT_DEDUP_WINDOW):
         self.docs_dir = docs_dir
         self.index_save_path = index_save_path
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.documents = []
-        self.document_chunks = []
-        self.chunk_size = 512  # Characters per chunk
+        self.index_config = index_config or make_index_config()
+        self.batch_size = batch_size  # Chunks embedded and added per step; bounds peak memory
+        self.workers = workers  # Embedding processes; 1 encodes in this process
+        # make_encoder arguments: backend, model_name, threads, max_seq_length, model_path
+        self.encoder_config = dict(encoder_config or {})
+        self.encoder_config.setdefault('backend', 'torch')
+        self.encoder_config.setdefault('model_name', DEFAULT_MODEL)
+        self.encoder_config['max_seq_length'] = self.encoder_config.get('max_seq_length') or DEFAULT_MAX_SEQ_LENGTH
+        # Worker processes load their own encoder, so the parent only needs one in serial mode
+        self.encoder = make_encoder(**self.encoder_config) if workers <= 1 else None
+        # Chunks are measured with the encoder's own tokenizer so none gets truncated
+        token_counter = self.encoder.token_counter() if self.encoder else make_token_counter(**self.encoder_config)
+        self.chunker = Chunker(token_counter, chunk_tokens or min(DEFAULT_CHUNK_TOKENS, token_counter.budget),
+                               chunk_overlap)
+        self.dedup_threshold = dedup_threshold  # None keeps duplicate chunks, 1.0 only drops exact repeats
+        self.dedup_window = dedup_window  # Kept chunks each new one is checked against
         self.cdp_names = ['segment', 'mparticle', 'lytics', 'zeotap']
+        self.crawl_changes = {}  # CDP -> crawl changes manifest, read when indexing starts
         
         # Create index directory
         if not os.path.exists(self.index_save_path):
             os.makedirs(self.index_save_path)
     
-    def load_documents(self) -> None:
-        """Load all documents from scraped docs directory"""
+    def load_documents(self) -> Iterator[Dict[str, Any]]:
+        """Yield documents from the scraped docs directory one at a time"""
+        document_count = 0
         for cdp_name in self.cdp_names:
             cdp_path = os.path.join(self.docs_dir, cdp_name)
             if not os.path.exists(cdp_path):
@@ -37,102 +72,469 @@ class DocumentIndexer:
                 try:
                     with open(all_docs_file, 'r', encoding='utf-8') as f:
                         docs = json.load(f)
-                        for doc in docs:
-                            doc['cdp'] = cdp_name
-                            self.documents.append(doc)
                 except Exception as e:
                     logging.error(f"Error loading {all_docs_file}: {str(e)}")
+                    docs = []
+                # Only one CDP's file is held at a time
+                for doc in docs:
+                    doc['cdp'] = cdp_name
+                    document_count += 1
+                    yield doc
+                del docs
             else:
                 # Fall back to individual files
-                for filename in os.listdir(cdp_path):
+                for filename in sorted(os.listdir(cdp_path)):
                     if filename.endswith('.json') and filename != 'all_docs.json':
                         try:
                             with open(os.path.join(cdp_path, filename), 'r', encoding='utf-8') as f:
                                 doc = json.load(f)
-                                doc['cdp'] = cdp_name
-                                self.documents.append(doc)
                         except Exception as e:
                             logging.error(f"Error loading {filename}: {str(e)}")
+                            continue
+                        doc['cdp'] = cdp_name
+                        document_count += 1
+                        yield doc
         
-        logging.info(f"Loaded {len(self.documents)} documents in total")
+        logging.info(f"Loaded {document_count} documents in total")
     
-    def chunk_documents(self) -> None:
-        """Split documents into smaller chunks for indexing"""
-        logging.info("Chunking documents...")
-        for doc in self.documents:
-            text = doc['content']
-            title = doc['title']
-            url = doc['url']
-            cdp = doc['cdp']
-            
-            # Simple chunking strategy: split by paragraphs then combine until chunk_size
-            paragraphs = text.split('\n\n')
-            current_chunk = ""
-            
-            for paragraph in paragraphs:
-                if not paragraph.strip():
+    def chunk_documents(self, documents: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Split documents into chunks that fit the encoder, yielding them as they are made.
+        Chunks repeating an earlier one of the same CDP, exactly or nearly, are dropped
+        before they cost an embedding. Each chunk carries its heading path, steps and
+        summary snippet so answers can be assembled without scanning text at query time.
+        """
+        duplicates = DuplicateFilter(self.dedup_threshold, window=self.dedup_window) if self.dedup_threshold is not None else None
+        chunk_count = 0
+        for doc in documents:
+            chunks = []
+            for chunk_text, heading_path in self.chunker.chunk(doc['content']):
+                chunk_count += 1
+                if duplicates is not None and duplicates.is_duplicate(doc['cdp'], chunk_text):
                     continue
-                    
-                if len(current_chunk) + len(paragraph) <= self.chunk_size:
-                    current_chunk += paragraph + "\n\n"
-                else:
-                    if current_chunk:
-                        self.document_chunks.append({
-                            'chunk_text': current_chunk.strip(),
-                            'title': title,
-                            'url': url,
-                            'cdp': cdp
-                        })
-                    current_chunk = paragraph + "\n\n"
+                chunks.append(self.make_chunk(chunk_text, doc['title'], doc['url'], doc['cdp'], heading_path))
             
-            # Add the last chunk
-            if current_chunk:
-                self.document_chunks.append({
-                    'chunk_text': current_chunk.strip(),
-                    'title': title,
-                    'url': url,
-                    'cdp': cdp
-                })
+            self.hash_chunks(chunks)
+            yield from chunks
         
-        logging.info(f"Created {len(self.document_chunks)} chunks")
+        if duplicates is not None:
+            logging.info(f"Dropped {duplicates.exact_dropped} exact and {duplicates.near_dropped} near-duplicate "
+                         f"chunks of {chunk_count}")
+    
+    def make_chunk(self, chunk_text: str, title: str, url: str, cdp: str, heading_path: List[str]) -> Dict[str, Any]:
+        return {
+            'chunk_text': chunk_text,
+            'title': title,
+            'url': url,
+            'cdp': cdp,
+            'heading_path': heading_path,
+            'steps': extract_steps(chunk_text),
+            'snippet': summary_snippet(chunk_text)
+        }
+    
+    def hash_chunks(self, chunks: List[Dict[str, Any]]) -> None:
+        """Give every chunk of a document a content hash that identifies it across re-scrapes"""
+        seen = {}
+        for chunk in chunks:
+            digest = hashlib.sha1(json.dumps(
+                [chunk['cdp'], chunk['url'], chunk['title'], chunk['chunk_text']],
+                ensure_ascii=False
+            ).encode('utf-8')).hexdigest()
+            # Identical chunks on the same page still need distinct keys
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            chunk['hash'] = digest if occurrence == 0 else f"{digest}:{occurrence}"
+    
+    def batch_chunks(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Group the chunk stream into lists of at most batch_size"""
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def encode_chunks(self, chunks: List[Dict[str, Any]]) -> np.ndarray:
+        """Embed chunk texts, normalized for cosine similarity"""
+        return self.encoder.encode([chunk['chunk_text'] for chunk in chunks])
+    
+    def index_chunks(self, index_builder: StreamingIndexBuilder, cdp_builders: Dict[str, StreamingIndexBuilder],
+                     known: Dict[str, int], next_id: int) -> Tuple[Dict[str, int], int]:
+        """
+        Stream load -> chunk -> embed -> add. Chunks whose hash is in known keep
+        their ID and are not re-embedded; everything else gets a new ID and a
+        vector in the global and per-CDP indexes. Chunk metadata is appended to
+        the chunks.bin store as each batch completes.
+        Returns the hash -> ID map of all current chunks and the next free ID.
+        """
+        chunk_ids = {}
+        processed = 0
+        embedded = 0
+        started = time.perf_counter()
+        
+        def assign_ids() -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+            nonlocal next_id
+            for batch in self.batch_chunks(self.chunk_documents(self.load_documents())):
+                new_chunks = []
+                for chunk in batch:
+                    if chunk['hash'] in known:
+                        chunk['id'] = known[chunk['hash']]
+                    else:
+                        chunk['id'] = next_id
+                        next_id += 1
+                        new_chunks.append(chunk)
+                    chunk_ids[chunk['hash']] = chunk['id']
+                yield batch, new_chunks
+        
+        with ChunkStoreWriter(os.path.join(self.index_save_path, CHUNK_STORE_FILE)) as writer:
+            for batch, new_chunks, embeddings in self.embed_batches(assign_ids()):
+                if new_chunks:
+                    ids = np.array([chunk['id'] for chunk in new_chunks], dtype=np.int64)
+                    cdps = np.array([chunk['cdp'] for chunk in new_chunks])
+                    index_builder.add(embeddings, ids)
+                    for cdp_name in np.unique(cdps):
+                        mask = cdps == cdp_name
+                        if cdp_name not in cdp_builders:
+                            cdp_builders[cdp_name] = StreamingIndexBuilder(self.index_config)
+                        cdp_builders[cdp_name].add(embeddings[mask], ids[mask])
+                
+                for chunk in batch:
+                    writer.append(chunk)
+                
+                processed += len(batch)
+                embedded += len(new_chunks)
+                elapsed = time.perf_counter() - started
+                logging.info(f"Processed {processed} chunks, embedded {embedded} "
+                             f"({embedded / elapsed if elapsed else 0.0:.1f} chunks/s)")
+            
+            writer.commit()
+        
+        # chunks.bin replaces chunks.json; a leftover JSON file would describe an older build
+        legacy_chunks_file = os.path.join(self.index_save_path, 'chunks.json')
+        if os.path.exists(legacy_chunks_file):
+            os.remove(legacy_chunks_file)
+        
+        logging.info(f"Created {processed} chunks")
+        return chunk_ids, next_id
+    
+    def embed_batches(self, batches: Iterable[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+                      ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]], np.ndarray]]:
+        """
+        Embed the new chunks of each (batch, new_chunks) pair, yielding results in
+        input order. With several workers, batches are encoded in parallel by
+        separate processes, each holding its own encoder; at most two batches per
+        worker are in flight so memory stays bounded. A worker that dies or can't
+        load its encoder fails the build instead of being respawned forever.
+        """
+        if self.workers <= 1:
+            for batch, new_chunks in batches:
+                yield batch, new_chunks, self.encode_chunks(new_chunks) if new_chunks else None
+            return
+        
+        # Split the cores between workers so they don't oversubscribe each other
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+        context = multiprocessing.get_context('spawn')  # Forking after torch starts its thread pools can hang
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_embedding_worker,
+                                 initargs=(self.encoder_config, threads_per_worker)) as pool:
+            in_flight = collections.deque()
+            
+            def next_result():
+                batch, new_chunks, pending = in_flight.popleft()
+                try:
+                    return batch, new_chunks, pending.result() if pending is not None else None
+                except BrokenProcessPool as e:
+                    # The worker's own traceback, e.g. from loading the model, is logged by the worker
+                    raise RuntimeError(f"Embedding worker failed, see its error above: {str(e)}") from e
+            
+            for batch, new_chunks in batches:
+                # Each worker encodes exactly the batch a serial build would, so results merge back identically
+                texts = [chunk['chunk_text'] for chunk in new_chunks]
+                pending = pool.submit(_embed_texts, texts) if texts else None
+                in_flight.append((batch, new_chunks, pending))
+                if len(in_flight) >= self.workers * 2:
+                    yield next_result()
+            while in_flight:
+                yield next_result()
     
     def create_index(self) -> None:
         """Create FAISS index from document chunks"""
         logging.info("Creating embeddings and index...")
         
-        # Create embeddings for all chunks
-        texts = [chunk['chunk_text'] for chunk in self.document_chunks]
-        embeddings = self.model.encode(texts)
+        # Chunk IDs are the FAISS IDs, so they must stay stable across incremental updates
+        index_builder = StreamingIndexBuilder(self.index_config)
+        cdp_builders = {}
+        chunk_ids, next_id = self.index_chunks(index_builder, cdp_builders, {}, 0)
         
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(embeddings)
+        index = index_builder.finish()
+        if index is None:
+            raise ValueError(f"No documents found in {self.docs_dir}")
         
-        # Create and train index
-        vector_dimension = embeddings.shape[1]
-        index = faiss.IndexFlatIP(vector_dimension)
-        index.add(embeddings)
+        # Save index along with the parameters QueryEngine needs to search it
+        atomic_write_index(index, os.path.join(self.index_save_path, 'docs.index'))
+        save_index_config(self.index_save_path, self.index_config)
+        save_encoder_info(self.index_save_path, self.encoder_info(index.d))
         
-        # Save index
-        faiss.write_index(index, os.path.join(self.index_save_path, 'docs.index'))
-        
-        # Save metadata
-        with open(os.path.join(self.index_save_path, 'chunks.json'), 'w', encoding='utf-8') as f:
-            json.dump(self.document_chunks, f, ensure_ascii=False, indent=2)
+        # One sub-index per CDP so filtered queries only scan that CDP's vectors
+        self.save_cdp_indexes(cdp_builders)
         
+        self.save_lexical_index()
+        self.save_manifest(chunk_ids, next_id)
         logging.info("Index created and saved successfully")
     
-    def process(self) -> None:
-        """Run the full indexing process"""
-        self.load_documents()
-        self.chunk_documents()
+    def save_cdp_indexes(self, cdp_builders: Dict[str, StreamingIndexBuilder]) -> None:
+        """Write one ID-mapped FAISS index per CDP, removing partitions of CDPs that have no chunks"""
+        for cdp_name in self.cdp_names:
+            index_file = os.path.join(self.index_save_path, f'docs_{cdp_name}.index')
+            cdp_index = cdp_builders[cdp_name].finish() if cdp_name in cdp_builders else None
+            if cdp_index is None or cdp_index.ntotal == 0:
+                # Drop partitions left over from an earlier build
+                if os.path.exists(index_file):
+                    os.remove(index_file)
+                continue
+            
+            atomic_write_index(cdp_index, index_file)
+            logging.info(f"Saved {cdp_name} sub-index with {cdp_index.ntotal} vectors")
+    
+    def save_lexical_index(self) -> None:
+        """Rebuild the BM25 postings from the chunk store just written; much cheaper than embedding"""
+        chunk_store = ChunkStore(os.path.join(self.index_save_path, CHUNK_STORE_FILE))
+        build_lexical_index(chunk_store, os.path.join(self.index_save_path, LEXICAL_INDEX_FILE))
+    
+    def encoder_info(self, dimension: int) -> Dict[str, Any]:
+        """encoder.json contents for vectors of the given dimension from this indexer's encoder"""
+        return encoder_info(self.encoder_config['backend'], self.encoder_config['model_name'], dimension,
+                            self.encoder_config['max_seq_length'])
+    
+    def encoder_space(self) -> str:
+        """Vector space of the embeddings; the torch and onnx backends of one model share one"""
+        return encoder_space(self.encoder_config['backend'], self.encoder_config['model_name'])
+    
+    def chunking_config(self) -> Dict[str, Any]:
+        """Settings that decide which chunks a corpus turns into"""
+        return {
+            'chunk_tokens': self.chunker.max_tokens,
+            'chunk_overlap': self.chunker.overlap_tokens,
+            'dedup_threshold': self.dedup_threshold,
+            'dedup_window': self.dedup_window
+        }
+    
+    def save_manifest(self, chunk_ids: Dict[str, int], next_id: int) -> None:
+        """Write the manifest; it goes last because it only describes vectors already on disk"""
+        manifest = {
+            'model': self.encoder_space(),
+            'max_seq_length': self.encoder_config['max_seq_length'],
+            'index_config': self.index_config,
+            'chunking': self.chunking_config(),
+            'next_id': next_id,
+            # Crawl run of each CDP's pages this build indexed
+            'crawl_runs': {cdp: changes['run'] for cdp, changes in self.crawl_changes.items()},
+            'chunks': chunk_ids
+        }
+        atomic_write_json(manifest, os.path.join(self.index_save_path, MANIFEST_FILE))
+    
+    def load_manifest(self) -> Dict[str, Any]:
+        """Load the manifest of embedded chunks, or None if it can't be used for an incremental update"""
+        manifest_file = os.path.join(self.index_save_path, MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            logging.info("No manifest found, running a full build")
+            return None
+        
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        # Manifests from before max_seq_length was recorded used the default
+        if (manifest.get('model') != self.encoder_space() or
+                manifest.get('max_seq_length', DEFAULT_MAX_SEQ_LENGTH) != self.encoder_config['max_seq_length'] or
+                manifest.get('index_config') != self.index_config):
+            logging.info("Encoder or index settings changed since the last build, running a full build")
+            return None
+        # Manifests without chunking settings were built from fixed-size character chunks
+        if manifest.get('chunking') != self.chunking_config():
+            logging.info("Chunking settings changed since the last build, running a full build")
+            return None
+        if self.index_config['index_type'] == 'hnsw':
+            logging.info("HNSW indexes can't remove vectors, running a full build")
+            return None
+        if self.index_config['rerank'] > 0:
+            logging.info("Re-ranked indexes can't remove vectors, running a full build")
+            return None
+        return manifest
+    
+    def load_crawl_changes(self) -> Dict[str, Dict[str, Any]]:
+        """Read the changes manifest of each CDP's last crawl, for CDPs crawled with one"""
+        crawl_changes = {}
+        for cdp_name in self.cdp_names:
+            changes_file = os.path.join(self.docs_dir, cdp_name, CRAWL_CHANGES_FILE)
+            if os.path.exists(changes_file):
+                with open(changes_file, 'r', encoding='utf-8') as f:
+                    crawl_changes[cdp_name] = json.load(f)
+        return crawl_changes
+    
+    def docs_changed_since(self, manifest: Dict[str, Any]) -> bool:
+        """
+        Whether any crawl added, changed or removed pages since the build that wrote
+        manifest. Docs not written by a tracked crawl always count as changed.
+        """
+        indexed_runs = manifest.get('crawl_runs', {})
+        changed = False
+        for cdp_name in self.cdp_names:
+            if not os.path.exists(os.path.join(self.docs_dir, cdp_name)):
+                continue
+            changes = self.crawl_changes.get(cdp_name)
+            if changes is None or cdp_name not in indexed_runs:
+                return True
+            if changes['last_change_run'] > indexed_runs[cdp_name]:
+                logging.info(f"{cdp_name}: crawl {changes['run']} added {len(changes['added'])}, "
+                             f"changed {len(changes['changed'])} and removed {len(changes['removed'])} pages")
+                changed = True
+        return changed
+    
+    def update_index(self) -> bool:
+        """
+        Re-embed only new or changed chunks and patch the existing indexes in place.
+        Returns False when the existing index can't be updated and a full build is needed.
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            return False
+        
+        if not self.docs_changed_since(manifest):
+            logging.info("No pages changed since the last build, index is up to date")
+            return True
+        
+        index_file = os.path.join(self.index_save_path, 'docs.index')
+        index = faiss.read_index(index_file)
+        if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            logging.info("Existing index is not ID-mapped, running a full build")
+            return False
+        
+        # A CDP without a partition had no chunks before, so all of its chunks are new
+        # and get a fresh partition from StreamingIndexBuilder
+        cdp_builders = {}
+        for cdp_name in self.cdp_names:
+            cdp_index_file = os.path.join(self.index_save_path, f'docs_{cdp_name}.index')
+            if os.path.exists(cdp_index_file):
+                cdp_builders[cdp_name] = StreamingIndexBuilder(self.index_config, faiss.read_index(cdp_index_file))
+        
+        known = manifest['chunks']
+        chunk_ids, next_id = self.index_chunks(StreamingIndexBuilder(self.index_config, index), cdp_builders,
+                                               known, manifest['next_id'])
+        stale_ids = np.array([chunk_id for chunk_hash, chunk_id in known.items() if chunk_hash not in chunk_ids],
+                             dtype=np.int64)
+        logging.info(f"{len(chunk_ids) - (next_id - manifest['next_id'])} chunks unchanged, "
+                     f"{next_id - manifest['next_id']} new or changed, {len(stale_ids)} stale")
+        
+        if len(stale_ids):
+            index.remove_ids(stale_ids)
+            for cdp_builder in cdp_builders.values():
+                if cdp_builder.index is not None:
+                    cdp_builder.index.remove_ids(stale_ids)
+        
+        atomic_write_index(index, index_file)
+        save_encoder_info(self.index_save_path, self.encoder_info(index.d))
+        self.save_cdp_indexes(cdp_builders)
+        self.save_lexical_index()
+        self.save_manifest(chunk_ids, next_id)
+        logging.info(f"Index updated incrementally, {index.ntotal} vectors")
+        return True
+    
+    def process(self, incremental: bool = False) -> None:
+        """Run the indexing process, patching the existing index when incremental is set"""
+        # Read before indexing, so a crawl finishing meanwhile isn't recorded as indexed
+        self.crawl_changes = self.load_crawl_changes()
+        if incremental and self.update_index():
+            return
         self.create_index()
 
+# Encoder held by each embedding worker process
+_worker_encoder = None
+
+def _init_embedding_worker(encoder_config: Dict[str, Any], num_threads: int) -> None:
+    """Load the encoder once per worker process"""
+    global _worker_encoder
+    _worker_encoder = make_encoder(**dict(encoder_config, threads=encoder_config.get('threads') or num_threads))
+
+def _embed_texts(texts: List[str]) -> np.ndarray:
+    """Encode one batch in a worker process"""
+    return _worker_encoder.encode(texts)
+
+def atomic_write_index(index: faiss.Index, path: str) -> None:
+    """Write a FAISS index to a temporary file and rename it over the target"""
+    tmp_path = path + '.tmp'
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+def atomic_write_json(data: Any, path: str, **kwargs: Any) -> None:
+    """Write JSON to a temporary file and rename it over the target"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
 def main():
-    docs_dir = 'data/scraped_docs'
-    index_save_path = 'data/index'
+    parser = argparse.ArgumentParser(description="Build the FAISS index over scraped CDP documentation")
+    parser.add_argument('--docs-dir', default='data/scraped_docs')
+    parser.add_argument('--index-path', default='data/index')
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat')
+    parser.add_argument('--nlist', type=int, help="IVF clusters")
+    parser.add_argument('--nprobe', type=int, help="IVF clusters probed per query")
+    parser.add_argument('--pq-m', type=int, help="PQ sub-quantizers")
+    parser.add_argument('--pq-nbits', type=int, help="PQ bits per sub-quantizer code")
+    parser.add_argument('--hnsw-m', type=int, help="HNSW graph degree")
+    parser.add_argument('--ef-construction', type=int, help="HNSW build-time beam width")
+    parser.add_argument('--ef-search', type=int, help="HNSW query-time beam width")
+    parser.add_argument('--storage', choices=STORAGE_TYPES, help="Vector encoding: float32, fp16, int8 or pq (PQ codes)")
+    parser.add_argument('--rerank', type=int, help="Re-rank this many times k quantized candidates with float32 vectors")
+    parser.add_argument('--batch-size', type=int, default=256, help="Chunks embedded and added per step")
+    parser.add_argument('--workers', type=int, default=1, help="Processes encoding chunks in parallel")
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, default='torch',
+                        help="Embedding backend: torch, onnx (exported with encoder.py export) or hash (tests only)")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="sentence-transformers model the vectors come from")
+    parser.add_argument('--onnx-model-path', default='data/encoder/onnx', help="Exported ONNX model or its directory")
+    parser.add_argument('--encoder-threads', type=int, default=0,
+                        help="Intra-op threads per encoder, 0 for the default (cores split between --workers)")
+    parser.add_argument('--max-seq-length', type=int, help="Tokens per chunk the encoder reads, default 256")
+    parser.add_argument('--chunk-tokens', type=int,
+                        help=f"Encoder tokens per chunk, default {DEFAULT_CHUNK_TOKENS} or the encoder's limit if lower")
+    parser.add_argument('--chunk-overlap', type=int, default=0,
+                        help="Tokens of trailing sentences a chunk repeats from the one before")
+    parser.add_argument('--dedup-threshold', type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help="Shingle similarity above which a chunk counts as a near-duplicate; 1.0 drops exact repeats only")
+    parser.add_argument('--dedup-window', type=int, default=DEFAULT_DEDUP_WINDOW,
+                        help="Most recent kept chunks each chunk is checked against, about 1 KB of memory each")
+    parser.add_argument('--keep-duplicates', action='store_true', help="Embed repeated chunks too")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only embed new or changed chunks and patch the existing index")
+    args = parser.parse_args()
+    
+    index_config = make_index_config(
+        index_type=args.index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        ef_search=args.ef_search,
+        storage=args.storage,
+        rerank=args.rerank
+    )
     
-    indexer = DocumentIndexer(docs_dir, index_save_path)
-    indexer.process()
+    encoder_config = {
+        'backend': args.encoder,
+        'model_name': args.model,
+        'threads': args.encoder_threads,
+        'max_seq_length': args.max_seq_length,
+        'model_path': args.onnx_model_path
+    }
+    indexer = DocumentIndexer(args.docs_dir, args.index_path, index_config, batch_size=args.batch_size,
+                              workers=args.workers, encoder_config=encoder_config, chunk_tokens=args.chunk_tokens,
+                              chunk_overlap=args.chunk_overlap,
+                              dedup_threshold=None if args.keep_duplicates else args.dedup_threshold,
+                              dedup_window=args.dedup_window)
+    indexer.process(incremental=args.incremental)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
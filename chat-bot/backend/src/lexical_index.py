@@ -0,0 +1,212 @@
+import os
+import re
+import mmap
+import array
+import struct
+import logging
+from typing import List, Dict, Any, Iterable, Tuple, Optional
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LEXICAL_INDEX_FILE = 'lexical.bin'
+
+MAGIC = b'CDPBM25\x01'
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# magic, rows, terms, postings, cdps, average row length, then the byte offset of each section
+HEADER = struct.Struct('<8sIIQId10Q')
+SECTIONS = [
+    'term_offsets',      # uint64 [num_terms + 1] into the term buffer
+    'terms',             # utf-8 terms, sorted, back to back
+    'idf',               # float32 [num_terms]
+    'posting_offsets',   # uint64 [num_terms + 1] into the posting arrays
+    'posting_rows',      # uint32 [num_postings] row of each posting
+    'posting_tfs',       # uint16 [num_postings] term frequency in that row
+    'row_ids',           # int64 [num_rows] FAISS ID of each row
+    'row_lengths',       # uint32 [num_rows] tokens per row
+    'row_cdps',          # uint8 [num_rows] CDP of each row
+    'cdp_names'          # utf-8 CDP names joined by newlines
+]
+
+# Words, plus identifiers joined by dots, dashes or underscores ("analytics.track", "user_id", "$set")
+TOKEN_PATTERN = re.compile(r'[a-z0-9_$]+(?:[.\-][a-z0-9_$]+)*')
+# Tokens that look like code rather than prose: dotted, snake_case, $-prefixed or camelCase
+IDENTIFIER_PATTERN = re.compile(r'`[^`]+`|\$\w+|\b\w+[._]\w+|\b[a-z]+[A-Z]\w*')
+
+DOMAIN_PATTERN = re.compile(r'\.(?:com|io|org|net)$', re.IGNORECASE)
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'what', 'when', 'with', 'you', 'your'
+])
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; compound identifiers are kept whole and also split into their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.strip('_')
+        if not token or token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = [part for part in re.split(r'[._\-]', token) if part and part != token]
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+def identifier_terms(query: str) -> List[str]:
+    """Tokens of the code-like terms in a query (API names, event names, config keys)"""
+    matches = [match.strip('`') for match in IDENTIFIER_PATTERN.findall(query)]
+    # Domains like segment.com name a platform, not an API
+    return [token for match in matches if not DOMAIN_PATTERN.search(match) for token in tokenize(match)]
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def build_lexical_index(chunks: Iterable[Dict[str, Any]], path: str) -> None:
+    """
+    Build a BM25 inverted index over chunks (in chunk store row order) and write
+    it atomically to path. Postings are held in memory while building.
+    """
+    postings = {}
+    row_ids = array.array('q')
+    row_lengths = array.array('I')
+    row_cdps = array.array('B')
+    cdps = {}
+
+    for row, chunk in enumerate(chunks):
+        tokens = tokenize(chunk['title'] + '\n' + chunk['chunk_text'])
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((row, min(count, 65535)))
+        row_ids.append(chunk['id'])
+        row_lengths.append(len(tokens))
+        row_cdps.append(cdps.setdefault(chunk['cdp'], len(cdps)))
+
+    num_rows = len(row_ids)
+    terms = sorted(postings)
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    np.cumsum([len(term) for term in encoded_terms], out=term_offsets[1:])
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    np.cumsum([len(postings[term]) for term in terms], out=posting_offsets[1:])
+    flat_postings = [posting for term in terms for posting in postings[term]]
+    document_frequency = np.diff(posting_offsets).astype(np.float64)
+    # BM25+ style idf that stays positive for very common terms
+    idf = np.log(1.0 + (num_rows - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+    average_length = float(np.mean(row_lengths)) if num_rows else 0.0
+
+    sections = {
+        'term_offsets': term_offsets.tobytes(),
+        'terms': b''.join(encoded_terms),
+        'idf': idf.tobytes(),
+        'posting_offsets': posting_offsets.tobytes(),
+        'posting_rows': np.array([row for row, _ in flat_postings], dtype=np.uint32).tobytes(),
+        'posting_tfs': np.array([tf for _, tf in flat_postings], dtype=np.uint16).tobytes(),
+        'row_ids': np.frombuffer(row_ids, dtype=np.int64).tobytes(),
+        'row_lengths': np.frombuffer(row_lengths, dtype=np.uint32).tobytes(),
+        'row_cdps': np.frombuffer(row_cdps, dtype=np.uint8).tobytes(),
+        'cdp_names': '\n'.join(sorted(cdps, key=cdps.get)).encode('utf-8')
+    }
+
+    offsets = []
+    position = HEADER.size
+    for name in SECTIONS:
+        position = _align(position)
+        offsets.append(position)
+        position += len(sections[name])
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, num_rows, len(terms), len(flat_postings), len(cdps), average_length, *offsets))
+        for name, offset in zip(SECTIONS, offsets):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, path)
+    logging.info(f"Built lexical index with {len(terms)} terms and {len(flat_postings)} postings over {num_rows} chunks")
+
+class LexicalIndex:
+    """Memory-mapped BM25 index; postings are read straight from the mapped file"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = HEADER.unpack_from(self.buffer, 0)
+        magic, num_rows, num_terms, num_postings, num_cdps, self.average_length = header[:6]
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lexical index")
+        offsets = dict(zip(SECTIONS, header[6:]))
+
+        def view(name: str, dtype: Any, count: int) -> np.ndarray:
+            return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offsets[name])
+
+        self.idf = view('idf', np.float32, num_terms)
+        self.posting_offsets = view('posting_offsets', np.uint64, num_terms + 1)
+        self.posting_rows = view('posting_rows', np.uint32, num_postings)
+        self.posting_tfs = view('posting_tfs', np.uint16, num_postings)
+        self.row_ids = view('row_ids', np.int64, num_rows)
+        self.row_cdps = view('row_cdps', np.uint8, num_rows)
+
+        # Length normalization is the same for every query, so precompute it per row
+        row_lengths = view('row_lengths', np.uint32, num_rows).astype(np.float32)
+        self.length_norm = K1 * (1 - B + B * row_lengths / max(self.average_length, 1e-9))
+
+        # The vocabulary is small next to the postings; a dict gives O(1) term lookup
+        term_offsets = view('term_offsets', np.uint64, num_terms + 1)
+        terms_start = offsets['terms']
+        self.vocabulary = {
+            self.buffer[terms_start + int(term_offsets[i]):terms_start + int(term_offsets[i + 1])].decode('utf-8'): i
+            for i in range(num_terms)
+        }
+        # cdp_names is the last section and runs to the end of the file
+        cdp_names = self.buffer[offsets['cdp_names']:].decode('utf-8')
+        self.cdp_codes = {name: code for code, name in enumerate(cdp_names.split('\n')) if name}
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def has_terms(self, terms: List[str]) -> bool:
+        return any(term in self.vocabulary for term in terms)
+
+    def search(self, query: str, top_k: int, cdp: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Return up to top_k (chunk ID, BM25 score) pairs, best first, optionally limited to one CDP"""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or top_k <= 0:
+            return []
+
+        scores = np.zeros(len(self.row_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = int(self.posting_offsets[term_id]), int(self.posting_offsets[term_id + 1])
+            rows = self.posting_rows[start:end]
+            tfs = self.posting_tfs[start:end].astype(np.float32)
+            scores[rows] += self.idf[term_id] * tfs * (K1 + 1) / (tfs + self.length_norm[rows])
+
+        if cdp is not None:
+            code = self.cdp_codes.get(cdp)
+            if code is None:
+                return []
+            scores[self.row_cdps != code] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.row_ids[row]), float(scores[row])) for row in candidates]
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked ID lists by summing 1 / (k + rank); returns (ID, fused score) best first"""
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def load_lexical_index(index_path: str) -> Optional[LexicalIndex]:
+    """Open lexical.bin from an index directory, or return None if it hasn't been built"""
+    path = os.path.join(index_path, LEXICAL_INDEX_FILE)
+    return LexicalIndex(path) if os.path.exists(path) else None
@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Prefix of every exported metric name
+NAMESPACE = 'cdp'
+
+# Upper bounds in seconds, from sub-millisecond classification up to slow encoder batches
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'stage_duration_seconds': "Time spent in each query engine stage, per call",
+    'http_request_duration_seconds': "Time to serve an HTTP request, by route and status",
+    'queries_total': "Answered queries by query type",
+    'startup_phase_seconds': "Time each phase of this worker's cold start took"
+}
+
+# Fields of the component stats() dicts that only ever grow, exported as counters
+COUNTER_FIELDS = {'hits', 'misses', 'evictions', 'completed', 'rejected', 'timed_out', 'batches', 'queries'}
+
+# Stack endings of query threads waiting for work, left out of profiles
+IDLE_STACK_ENDINGS = (
+    'thread.py:_worker',
+    'batcher.py:_collect_batch;queue.py:get;threading.py:wait'
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(buckets) + 1)  # The last slot counts values above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Cumulative count per bucket bound, sum and count"""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bucket_count in counts[:-1]:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+class Metrics:
+    """
+    Latency histograms and counters for the query hot path. Stages timed while
+    a trace is open on the current thread are also added to that trace, which
+    gives the per-request breakdown.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+        self.local = threading.local()
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Record a stage duration, and add it to the current thread's trace if one is open"""
+        self.observe('stage_duration_seconds', seconds, stage=stage)
+        timings = getattr(self.local, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds * 1000.0
+
+    @contextmanager
+    def stage(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    @contextmanager
+    def trace(self):
+        """Collect milliseconds per stage for the work done on this thread inside the block"""
+        timings = {}
+        self.local.timings = timings
+        started = time.perf_counter()
+        try:
+            yield timings
+        finally:
+            self.local.timings = None
+            timings['total'] = (time.perf_counter() - started) * 1000.0
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Calls and mean milliseconds per stage recorded so far"""
+        with self.lock:
+            histograms = [(dict(labels)['stage'], histogram) for (name, labels), histogram in self.histograms.items()
+                          if name == 'stage_duration_seconds']
+        summary = {}
+        for stage, histogram in sorted(histograms):
+            _, total, count = histogram.snapshot()
+            summary[stage] = {'calls': count, 'mean_ms': total / count * 1000.0 if count else 0.0}
+        return summary
+
+    def render(self, gauges: List[Tuple[str, Labels, float]] = None, counters: List[Tuple[str, Labels, float]] = None) -> str:
+        """
+        Everything recorded so far, plus the given snapshot gauges and counters,
+        in the Prometheus text exposition format
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            own_counters = sorted(self.counters.items())
+        families = {}  # name -> (type, lines)
+
+        for (name, labels), histogram in histograms:
+            cumulative, total, count = histogram.snapshot()
+            lines = families.setdefault(name, ('histogram', []))[1]
+            for bound, bucket_count in zip(self.buckets, cumulative):
+                lines.append(f"{metric_name(name)}_bucket{format_labels(labels + (('le', repr(bound)),))} {bucket_count}")
+            lines.append(f"{metric_name(name)}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric_name(name)}_sum{format_labels(labels)} {total!r}")
+            lines.append(f"{metric_name(name)}_count{format_labels(labels)} {count}")
+
+        for kind, samples in (('counter', [(name, labels, value) for (name, labels), value in own_counters]
+                                          + (counters or [])),
+                              ('gauge', gauges or [])):
+            for name, labels, value in samples:
+                families.setdefault(name, (kind, []))[1].append(f"{metric_name(name)}{format_labels(labels)} {value}")
+
+        output = []
+        for name, (kind, lines) in families.items():
+            if name in METRIC_HELP:
+                output.append(f"# HELP {metric_name(name)} {METRIC_HELP[name]}")
+            output.append(f"# TYPE {metric_name(name)} {kind}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+def metric_name(name: str) -> str:
+    return f"{NAMESPACE}_{name}"
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def stats_samples(prefix: str, stats: Dict[str, Any],
+                  labels: Labels = ()) -> Tuple[List[Tuple[str, Labels, float]], List[Tuple[str, Labels, float]]]:
+    """
+    Split a component's stats() dict into (gauges, counters) samples. Nested
+    dicts extend the name, except ones keyed by numbers like batch_size_counts,
+    whose keys become a label.
+    """
+    gauges, counters = [], []
+    for field, value in stats.items():
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, dict):
+            if value and all(isinstance(key, int) for key in value):
+                for key, count in value.items():
+                    gauges.append((f"{prefix}_{field}", labels + (('value', str(key)),), count))
+            else:
+                nested_gauges, nested_counters = stats_samples(f"{prefix}_{field}", value, labels)
+                gauges.extend(nested_gauges)
+                counters.extend(nested_counters)
+        elif isinstance(value, (int, float)):
+            if field in COUNTER_FIELDS:
+                counters.append((f"{prefix}_{field}_total", labels, value))
+            else:
+                gauges.append((f"{prefix}_{field}", labels, value))
+    return gauges, counters
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of the query threads at a fixed interval while
+    running. Low enough overhead to switch on in production for a few seconds
+    to see where slow queries spend their time.
+    """
+
+    def __init__(self, thread_prefixes: Tuple[str, ...] = ('query-worker', 'search-batcher')):
+        self.thread_prefixes = thread_prefixes
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.interval = 0.005
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval_ms: float = 5.0) -> bool:
+        """Clear earlier samples and start sampling; False if already running"""
+        with self.lock:
+            if self.running:
+                return False
+            self.interval = interval_ms / 1000.0
+            self.stacks = Counter()
+            self.samples = 0
+            self.idle = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+        logging.info(f"Sampling profiler started in process {os.getpid()}, every {interval_ms} ms")
+        return True
+
+    def stop(self) -> None:
+        with self.lock:
+            thread = self.thread
+            self.stopping.set()
+        if thread is not None:
+            thread.join()
+            self.stopped_at = time.time()
+
+    def _run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            sampled, idle = [], 0
+            for ident, frame in frames.items():
+                if names.get(ident, '').startswith(self.thread_prefixes):
+                    stack = collapse_stack(frame)
+                    if stack.endswith(IDLE_STACK_ENDINGS):
+                        idle += 1
+                    else:
+                        sampled.append(stack)
+            with self.lock:
+                self.samples += 1
+                self.idle += idle
+                self.stacks.update(sampled)
+
+    def report(self, limit: int = 30) -> Dict[str, Any]:
+        """Most frequent stacks and the functions most often on top of them"""
+        with self.lock:
+            stacks = Counter(self.stacks)
+            samples = self.samples
+            idle = self.idle
+        on_top = Counter()
+        for stack, count in stacks.items():
+            on_top[stack.rsplit(';', 1)[-1]] += count
+        end = self.stopped_at or time.time()
+        return {
+            'running': self.running,
+            'interval_ms': self.interval * 1000.0,
+            'duration_s': end - self.started_at if self.started_at else 0.0,
+            'samples': samples,
+            'busy_thread_samples': sum(stacks.values()),
+            'idle_thread_samples': idle,
+            'top_functions': [{'function': name, 'count': count} for name, count in on_top.most_common(limit)],
+            'top_stacks': [{'stack': stack, 'count': count} for stack, count in stacks.most_common(limit)]
+        }
+
+    def collapsed(self) -> str:
+        """All sampled stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        with self.lock:
+            stacks = Counter(self.stacks)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def collapse_stack(frame) -> str:
+    """Outermost-first 'file:function' frames joined by ';'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
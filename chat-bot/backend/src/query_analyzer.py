@@ -0,0 +1,131 @@
+import re
+import logging
+from typing import Any, List, Dict, NamedTuple, Optional, Tuple
+from answer_cache import normalize_query
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Aliases that name each CDP; a query mentions a CDP if it contains any of them
+CDP_PATTERNS = {
+    'segment': ['segment', 'segment.com', 'segment.io'],
+    'mparticle': ['mparticle', 'mparticle.com'],
+    'lytics': ['lytics', 'lytics.com', 'lytics.io'],
+    'zeotap': ['zeotap', 'zeotap.com']
+}
+
+# Common how-to patterns
+HOW_TO_PATTERNS = [
+    r'how (?:do|can|to) .+\?',
+    r'how (?:do|can|would) i .+\?',
+    r'how (?:is|are) .+ (?:set up|configured|created|implemented)',
+    r'steps (?:to|for) .+',
+    r'guide (?:to|for) .+',
+    r'process (?:of|for) .+',
+    r'instructions (?:for|to) .+'
+]
+
+HOW_TO_INDICATORS = [
+    'how to', 'how do i', 'how can i', 'steps to', 'guide for',
+    'instructions for', 'process for', 'method to', 'procedure for'
+]
+
+COMPARISON_KEYWORDS = [
+    'compare', 'comparison', 'versus', 'vs', 'difference',
+    'differences', 'similar', 'better', 'best', 'prefer'
+]
+
+HOW_TO = 'how_to'
+COMPARISON = 'comparison'
+
+class QueryAnalysis(NamedTuple):
+    """Everything the answer pipeline needs to know about a query, computed once"""
+    query: str
+    normalized: str  # See normalize_query
+    is_how_to: bool
+    is_comparison: bool
+    cdps: Tuple[str, ...]  # CDPs mentioned, in CDP_PATTERNS order
+
+    @property
+    def cdp(self) -> Optional[str]:
+        """CDP the query targets, or None if it names none"""
+        return self.cdps[0] if self.cdps else None
+
+    @property
+    def is_valid(self) -> bool:
+        return self.is_how_to or self.is_comparison
+
+    @property
+    def cache_key(self) -> Tuple[str, bool, bool, Optional[str]]:
+        """
+        Exact-cache key. Normalizing drops the case, spacing and trailing '?' the
+        classifiers look at, so queries sharing a normalized text may still differ
+        in intent or target CDP and get different answers.
+        """
+        return (self.normalized, self.is_how_to, self.is_comparison, self.cdp)
+
+def keyword_regex(keywords: List[str]) -> str:
+    """
+    Regex matching any of keywords, shaped as a trie so shared prefixes are only
+    tested once per position. Longer keywords win over their own prefixes.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+class QueryAnalyzer:
+    """
+    Classifies a query with one scan of the lowercased text. All CDP aliases,
+    how-to indicators and comparison keywords are folded into one compiled
+    trie regex inside a lookahead, so every keyword occurrence is found even
+    where keywords overlap, exactly like separate substring tests. The how-to
+    regexes are combined into one pattern that only runs when no keyword
+    already settled the intent.
+    """
+
+    def __init__(self, cdp_patterns: Dict[str, List[str]] = None, how_to_patterns: List[str] = None,
+                 how_to_indicators: List[str] = None, comparison_keywords: List[str] = None):
+        cdp_patterns = cdp_patterns or CDP_PATTERNS
+        self.cdps = list(cdp_patterns)
+
+        labels = {}  # keyword -> labels it stands for (CDP names, HOW_TO, COMPARISON)
+        for cdp, aliases in cdp_patterns.items():
+            for alias in aliases:
+                labels.setdefault(alias, set()).add(cdp)
+        for indicator in how_to_indicators or HOW_TO_INDICATORS:
+            labels.setdefault(indicator, set()).add(HOW_TO)
+        for keyword in comparison_keywords or COMPARISON_KEYWORDS:
+            labels.setdefault(keyword, set()).add(COMPARISON)
+
+        # At each position the regex reports the longest keyword. Any shorter keyword
+        # matching there is a prefix of it, so its labels are merged in and no
+        # occurrence is lost.
+        self.labels = {
+            keyword: frozenset().union(*(labels[other] for other in labels if keyword.startswith(other)))
+            for keyword in labels
+        }
+        self.keyword_pattern = re.compile('(?=(' + keyword_regex(list(labels)) + '))')
+        self.how_to_pattern = re.compile('|'.join(f'(?:{pattern})' for pattern in how_to_patterns or HOW_TO_PATTERNS))
+
+    def analyze(self, query: str) -> QueryAnalysis:
+        query_lower = query.lower()
+
+        found = set()
+        for keyword in self.keyword_pattern.findall(query_lower):
+            found |= self.labels[keyword]
+
+        cdps = tuple(cdp for cdp in self.cdps if cdp in found)
+        is_how_to = HOW_TO in found or self.how_to_pattern.search(query_lower) is not None
+        is_comparison = len(cdps) > 1 or COMPARISON in found
+        return QueryAnalysis(query, normalize_query(query), is_how_to, is_comparison, cdps)
@@ -1,168 +1,460 @@
 import os
-import json
 import logging
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Tuple
-import re
+from typing import List, Dict, Any, Tuple, Optional
+import threading
+from contextlib import contextmanager
+from answer_cache import AnswerCache
+from chunk_store import load_chunk_store
+from query_analyzer import QueryAnalyzer, QueryAnalysis, CDP_PATTERNS, HOW_TO_PATTERNS
+from lexical_index import load_lexical_index, identifier_terms, reciprocal_rank_fusion
+from index_factory import load_index_config, apply_search_params, read_index
+from encoder import Encoder, encoder_for_index, load_encoder_info, check_compatible
+from metrics import Metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# dense: vectors only; hybrid: dense and BM25 fused; auto: hybrid, but identifier-heavy queries use BM25 alone
+RETRIEVAL_MODES = ['dense', 'hybrid', 'auto']
+
+# Fields of each search result included in an answer's context
+CONTEXT_FIELDS = ['score', 'chunk_text', 'title', 'url', 'cdp']
+
+# Run against a freshly loaded index before it serves traffic, one per CDP sub-index
+WARMUP_QUERIES = [
+    "How do I set up a new source in Segment?",
+    "How can I create a user profile in mParticle?",
+    "How do I build an audience segment in Lytics?",
+    "How do I integrate my data with Zeotap?"
+]
+
 class QueryEngine:
-    def __init__(self, index_path: str = 'data/index'):
+    def __init__(self, index_path: str = 'data/index', use_mmap: bool = False, retrieval_mode: str = 'dense',
+                 encoder: Encoder = None, metrics: Metrics = None):
         self.index_path = index_path
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index = None
-        self.chunks = []
+        self.use_mmap = use_mmap  # Memory-map indexes read-only so forked workers share their pages
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        self.fusion_depth = 20  # Candidates taken from each retriever before rank fusion
+        self.encoder = encoder  # Defaults to one matching the index, created when it is first loaded
+        self.generation = None  # IndexGeneration currently serving queries
+        self.generation_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.batcher = None  # Optional BatchScheduler that coalesces concurrent searches
+        self.answer_cache = None  # Optional AnswerCache consulted by answer_question
+        self.metrics = metrics or Metrics()  # Stage latencies and answer counts, exported at /api/metrics
+        
+        self.cdp_patterns = CDP_PATTERNS
+        self.how_to_patterns = HOW_TO_PATTERNS
+        # Built once; classifies a query in a single scan instead of one test per pattern
+        self.analyzer = QueryAnalyzer(self.cdp_patterns, self.how_to_patterns)
+        
         self.load_resources()
+    
+    @property
+    def index(self) -> faiss.Index:
+        return self.generation.index
+    
+    @property
+    def index_config(self) -> Dict[str, Any]:
+        return self.generation.index_config
+    
+    @property
+    def chunks(self):
+        return self.generation.chunks
+    
+    @property
+    def cdp_indexes(self) -> Dict[str, faiss.Index]:
+        return self.generation.cdp_indexes
+    
+    def load_generation(self, number: int) -> 'IndexGeneration':
+        """Load index and chunks metadata from index_path into a new generation"""
+        fingerprint = self.index_generation()
+        index_file = os.path.join(self.index_path, 'docs.index')
         
-        # Define CDP-specific patterns
-        self.cdp_patterns = {
-            'segment': ['segment', 'segment.com', 'segment.io'],
-            'mparticle': ['mparticle', 'mparticle.com'],
-            'lytics': ['lytics', 'lytics.com', 'lytics.io'],
-            'zeotap': ['zeotap', 'zeotap.com']
-        }
+        # Query vectors must come from the space the index was built in, also after a rebuild
+        if self.encoder is None:
+            self.encoder = encoder_for_index(self.index_path)
+        else:
+            check_compatible(self.encoder, load_encoder_info(self.index_path))
+        
+        index = read_index(index_file, self.use_mmap)
+        index_config = load_index_config(self.index_path)
+        apply_search_params(index, index_config)
         
-        # Common how-to patterns
-        self.how_to_patterns = [
-            r'how (?:do|can|to) .+\?',
-            r'how (?:do|can|would) i .+\?',
-            r'how (?:is|are) .+ (?:set up|configured|created|implemented)',
-            r'steps (?:to|for) .+',
-            r'guide (?:to|for) .+',
-            r'process (?:of|for) .+',
-            r'instructions (?:for|to) .+'
-        ]
+        chunks = load_chunk_store(self.index_path)
+        
+        cdp_indexes = {}
+        for cdp in self.cdp_patterns:
+            cdp_index_file = os.path.join(self.index_path, f'docs_{cdp}.index')
+            if os.path.exists(cdp_index_file):
+                cdp_indexes[cdp] = read_index(cdp_index_file, self.use_mmap)
+                apply_search_params(cdp_indexes[cdp], index_config)
+        if not cdp_indexes:
+            logging.warning("No per-CDP sub-indexes found, CDP-filtered queries will scan the global index")
+        
+        lexical = load_lexical_index(self.index_path)
+        if lexical is None and self.retrieval_mode != 'dense':
+            logging.warning(f"No lexical index found, '{self.retrieval_mode}' retrieval falls back to dense search")
+        
+        logging.info(f"Loaded {index_config['index_type']} index with {index.ntotal} vectors and {len(chunks)} chunks")
+        return IndexGeneration(number, fingerprint, index, index_config, chunks, cdp_indexes, lexical)
     
     def load_resources(self) -> None:
         """Load index and chunks metadata"""
         try:
-            index_file = os.path.join(self.index_path, 'docs.index')
-            chunks_file = os.path.join(self.index_path, 'chunks.json')
-            
-            self.index = faiss.read_index(index_file)
-            
-            with open(chunks_file, 'r', encoding='utf-8') as f:
-                self.chunks = json.load(f)
-                
-            logging.info(f"Loaded index with {self.index.ntotal} vectors and {len(self.chunks)} chunks")
+            self._swap_generation(self.load_generation(1))
         except Exception as e:
             logging.error(f"Error loading resources: {str(e)}")
             raise
     
+    def reload_resources(self, warmup_queries: List[str] = None) -> bool:
+        """
+        Load the index on disk as a new generation, warm it up and swap it in.
+        Searches already running finish on the old generation, which is released
+        once the last of them completes. Returns False if a reload is already running.
+        """
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+        try:
+            generation = self.load_generation(self.generation.number + 1)
+            self.warm_up(generation, warmup_queries)
+            self._swap_generation(generation)
+            return True
+        finally:
+            self.reload_lock.release()
+    
+    def warm_up(self, generation: 'IndexGeneration' = None, queries: List[str] = None) -> None:
+        """
+        Encode and search a few queries against generation, the current one by
+        default, so the encoder session, index and any mmap pages are touched
+        before live traffic is
+        """
+        queries = queries or WARMUP_QUERIES
+        generation = generation or self.generation
+        with generation.lease():
+            routes = [self.retrieval_route(query, generation) for query in queries]
+            self._search_generation(generation, queries, [5] * len(queries), self.encode_queries(queries), routes)
+            # A lone query is padded to a different input shape than a batch
+            self.encode_queries(queries[:1])
+    
+    def _swap_generation(self, generation: 'IndexGeneration') -> None:
+        with self.generation_lock:
+            old, self.generation = self.generation, generation
+        if self.answer_cache is not None:
+            self.answer_cache.set_generation(generation.fingerprint)
+        if old is not None:
+            logging.info(f"Swapped in index generation {generation.number}, retiring generation {old.number}")
+            old.retire()
+    
+    def acquire_generation(self) -> 'IndexGeneration':
+        """Lease the current generation; pair with generation.release()"""
+        with self.generation_lock:
+            generation = self.generation
+            generation.acquire()
+            return generation
+    
+    def analyze(self, query: str) -> QueryAnalysis:
+        """Classify intent, find mentioned CDPs and normalize the query in one pass"""
+        with self.metrics.stage('classify'):
+            return self.analyzer.analyze(query)
+    
     def detect_cdp(self, query: str) -> str:
         """Detect which CDP the query is referring to"""
-        query_lower = query.lower()
-        
-        for cdp, patterns in self.cdp_patterns.items():
-            for pattern in patterns:
-                if pattern in query_lower:
-                    return cdp
-        
-        return None  # No specific CDP detected
+        return self.analyze(query).cdp
     
     def is_how_to_question(self, query: str) -> bool:
         """Determine if a query is a how-to question"""
-        query_lower = query.lower()
-        
-        # Check for explicit patterns
-        for pattern in self.how_to_patterns:
-            if re.search(pattern, query_lower):
-                return True
-        
-        # Check for specific how-to indicators
-        how_to_indicators = [
-            'how to', 'how do i', 'how can i', 'steps to', 'guide for',
-            'instructions for', 'process for', 'method to', 'procedure for'
-        ]
-        
-        for indicator in how_to_indicators:
-            if indicator in query_lower:
-                return True
-        
-        return False
+        return self.analyze(query).is_how_to
     
     def is_comparison_question(self, query: str) -> bool:
         """Determine if a query is asking for a comparison between CDPs"""
-        query_lower = query.lower()
+        return self.analyze(query).is_comparison
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries, normalized for cosine similarity"""
+        with self.metrics.stage('encode'):
+            return self.encoder.encode(queries)
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed one query, in the batcher's next encode call when there is a batcher"""
+        if self.batcher is not None:
+            with self.metrics.stage('batched_encode'):
+                return self.batcher.encode(query)
+        return self.encode_queries([query])[0]
+    
+    def search(self, query: str, top_k: int = 5, query_embedding: np.ndarray = None,
+               analysis: QueryAnalysis = None) -> List[Dict[str, Any]]:
+        """Search for relevant document chunks, reusing query_embedding and analysis if already computed"""
+        if self.batcher is not None:
+            # Encoding and index search run on the batcher thread; the caller sees their total here
+            with self.metrics.stage('batched_search'):
+                return self.batcher.submit(query, top_k, query_embedding, analysis)
+        return self.search_batch([query], [top_k], [query_embedding], [analysis])[0]
+    
+    def search_batch(self, queries: List[str], top_ks: List[int],
+                     query_embeddings: List[Optional[np.ndarray]] = None,
+                     analyses: List[Optional[QueryAnalysis]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries with one encode call and one multi-row index
+        search per partition. Rows with a precomputed embedding or analysis reuse it,
+        and queries routed to lexical-only search are never encoded.
+        """
+        analyses = [analysis or self.analyze(query) for query, analysis in zip(queries, analyses or [None] * len(queries))]
+        generation = self.acquire_generation()
+        try:
+            routes = [self.retrieval_route(query, generation) for query in queries]
+            
+            if query_embeddings is None:
+                query_embeddings = [None] * len(queries)
+            missing = [row for row, embedding in enumerate(query_embeddings)
+                       if embedding is None and routes[row] != 'lexical']
+            if len(missing) == len(queries):
+                query_embeddings = self.encode_queries(queries)
+            else:
+                query_embeddings = list(query_embeddings)
+                if missing:
+                    encoded = self.encode_queries([queries[row] for row in missing])
+                    for row, embedding in zip(missing, encoded):
+                        query_embeddings[row] = embedding
+                # Lexical-only rows get a placeholder so the matrix keeps one row per query
+                placeholder = np.zeros(generation.index.d, dtype=np.float32)
+                query_embeddings = np.vstack([placeholder if embedding is None else embedding
+                                              for embedding in query_embeddings]).astype(np.float32)
+            
+            return self._search_generation(generation, queries, top_ks, query_embeddings, routes, analyses)
+        finally:
+            generation.release()
+    
+    def retrieval_route(self, query: str, generation: 'IndexGeneration' = None) -> str:
+        """
+        Pick how a query is retrieved: 'dense', 'hybrid' (dense and BM25 fused) or
+        'lexical' (BM25 only, no encoder call) for identifier-heavy queries in auto mode
+        """
+        generation = generation or self.generation
+        if self.retrieval_mode == 'dense' or generation.lexical is None:
+            return 'dense'
+        if self.retrieval_mode == 'auto':
+            terms = identifier_terms(query)
+            if terms and generation.lexical.has_terms(terms):
+                return 'lexical'
+        return 'hybrid'
+    
+    def _search_generation(self, generation: 'IndexGeneration', queries: List[str], top_ks: List[int],
+                           query_embeddings: np.ndarray, routes: List[str] = None,
+                           analyses: List[QueryAnalysis] = None) -> List[List[Dict[str, Any]]]:
+        """Run queries against one index generation along their retrieval routes"""
+        routes = routes or ['dense'] * len(queries)
+        analyses = analyses or [self.analyze(query) for query in queries]
+        target_cdps = [analysis.cdp for analysis in analyses]
+        # Fused routes draw a deeper candidate list from each retriever
+        depths = [top_k if route == 'dense' else max(top_k, self.fusion_depth)
+                  for top_k, route in zip(top_ks, routes)]
         
-        # Count mentioned CDPs
-        mentioned_cdps = 0
-        for cdp_patterns in self.cdp_patterns.values():
-            for pattern in cdp_patterns:
-                if pattern in query_lower:
-                    mentioned_cdps += 1
-                    break
+        # Route each embedded query to its CDP's sub-index, or to the global index when
+        # no CDP was detected or no sub-index exists for it
+        groups = {}
+        for row, target_cdp in enumerate(target_cdps):
+            if routes[row] == 'lexical':
+                continue
+            key = target_cdp if target_cdp in generation.cdp_indexes else None
+            groups.setdefault(key, []).append(row)
         
-        # Check for comparison keywords
-        comparison_keywords = [
-            'compare', 'comparison', 'versus', 'vs', 'difference', 
-            'differences', 'similar', 'better', 'best', 'prefer'
-        ]
+        dense_hits = [[] for _ in queries]
+        for partition, rows in groups.items():
+            if partition is not None:
+                index = generation.cdp_indexes[partition]
+                limits = [depths[row] for row in rows]
+            else:
+                # Global index: get more results than needed for CDP filtering
+                index = generation.index
+                limits = [depths[row] * 2 for row in rows]
+            
+            with self.metrics.stage('index_search'):
+                scores, indices = index.search(query_embeddings[rows], k=max(limits))
+            
+            # Each row only looks at its own candidates, so results match an unbatched search
+            with self.metrics.stage('metadata'):
+                for i, row in enumerate(rows):
+                    limit = limits[i]
+                    dense_hits[row] = self._collect_results(generation.chunks, scores[i][:limit], indices[i][:limit],
+                                                            target_cdps[row], depths[row])
         
-        has_comparison_keyword = any(keyword in query_lower for keyword in comparison_keywords)
+        results = []
+        for row, query in enumerate(queries):
+            if routes[row] == 'dense':
+                results.append([result for _, result in dense_hits[row]])
+                continue
+            
+            with self.metrics.stage('lexical_search'):
+                ranking = generation.lexical.search(query, depths[row], target_cdps[row])
+            lexical_hits = []
+            with self.metrics.stage('metadata'):
+                for chunk_id, score in ranking:
+                    chunk = generation.chunks.get(chunk_id)
+                    if chunk is not None:
+                        lexical_hits.append((chunk_id, self._result(chunk, score)))
+            if routes[row] == 'lexical':
+                results.append([result for _, result in lexical_hits[:top_ks[row]]])
+                continue
+            
+            # Hybrid: reciprocal-rank fusion of the dense and lexical rankings
+            by_id = dict(lexical_hits)
+            by_id.update(dense_hits[row])
+            fused = reciprocal_rank_fusion([[chunk_id for chunk_id, _ in dense_hits[row]],
+                                            [chunk_id for chunk_id, _ in lexical_hits]])
+            results.append([dict(by_id[chunk_id], score=score) for chunk_id, score in fused[:top_ks[row]]])
         
-        return mentioned_cdps > 1 or has_comparison_keyword
+        return results
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant document chunks"""
-        # Create query embedding
-        query_embedding = self.model.encode([query])
-        faiss.normalize_L2(query_embedding)
-        
-        # Detect specific CDP
-        target_cdp = self.detect_cdp(query)
-        
-        # Search index
-        scores, indices = self.index.search(query_embedding, k=top_k * 2)  # Get more results for filtering
-        
-        # Get results with metadata
+    def _result(self, chunk: Dict[str, Any], score: float) -> Dict[str, Any]:
+        return {
+            'score': float(score),
+            'chunk_text': chunk['chunk_text'],
+            'title': chunk['title'],
+            'url': chunk['url'],
+            'cdp': chunk['cdp'],
+            'heading_path': chunk['heading_path'],
+            'steps': chunk['steps'],
+            'snippet': chunk['snippet']
+        }
+    
+    def _collect_results(self, chunks, scores: np.ndarray, indices: np.ndarray, target_cdp: str,
+                         top_k: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Turn one row of index search output into (chunk ID, result dict) pairs"""
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < 0 or idx >= len(self.chunks):
+        for i, idx in enumerate(indices):
+            chunk = chunks.get(int(idx))
+            if chunk is None:
                 continue
                 
-            chunk = self.chunks[idx]
-            score = scores[0][i]
+            score = scores[i]
             
             # If we detected a specific CDP, prioritize chunks from that CDP
             if target_cdp and chunk['cdp'] != target_cdp:
                 continue
                 
-            results.append({
-                'score': float(score),
-                'chunk_text': chunk['chunk_text'],
-                'title': chunk['title'],
-                'url': chunk['url'],
-                'cdp': chunk['cdp']
-            })
+            results.append((int(idx), self._result(chunk, score)))
         
         # Sort by relevance score and take top_k
-        results = sorted(results, key=lambda x: x['score'], reverse=True)[:top_k]
+        results = sorted(results, key=lambda x: x[1]['score'], reverse=True)[:top_k]
         return results
     
+    def index_generation(self) -> Tuple[int, int, int]:
+        """
+        Fingerprint the index on disk, which changes whenever it is rebuilt. The
+        indexer writes manifest.json last, so it is used when present.
+        """
+        manifest_file = os.path.join(self.index_path, 'manifest.json')
+        if not os.path.exists(manifest_file):
+            manifest_file = os.path.join(self.index_path, 'docs.index')
+        stat = os.stat(manifest_file)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
     def answer_question(self, query: str) -> Dict[str, Any]:
         """
         Process a query and generate an answer based on relevant documentation
         Returns a dictionary with answer and context information
         """
-        # Check if it's a how-to question
-        is_how_to = self.is_how_to_question(query)
-        is_comparison = self.is_comparison_question(query)
+        analysis = self.analyze(query)
+        cache = self.answer_cache
+        if cache is None:
+            return self._count(self._answer_question(analysis))
+        
+        generation = cache.generation
+        with self.metrics.stage('cache_lookup'):
+            result = cache.exact.get(query, analysis.cache_key)
+        if result is not None:
+            return self._count(result)
+        result = self._answer_question(analysis, cache)
+        # Don't store answers computed against an index that was swapped out meanwhile
+        if cache.generation == generation:
+            cache.exact.put(query, result, analysis.cache_key)
+        return self._count(result)
+    
+    def _count(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        self.metrics.increment('queries_total', query_type=result['query_type'])
+        return result
+    
+    def answer_questions(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """
+        Answer many queries at once: classify them all, embed the searchable ones
+        in one encode call and run one multi-row index search per partition.
+        Exact-match cache hits are reused; the semantic cache is not consulted.
+        """
+        analyses = [self.analyze(query) for query in queries]
+        cache = self.answer_cache
+        generation = cache.generation if cache is not None else None
+        with self.metrics.stage('cache_lookup'):
+            results = [cache.exact.get(analysis.query, analysis.cache_key) if cache is not None else None
+                       for analysis in analyses]
+        
+        pending = []  # Rows of queries that need a search
+        for row, analysis in enumerate(analyses):
+            if results[row] is not None:
+                continue
+            if not analysis.is_valid:
+                results[row] = self._invalid_answer()
+            else:
+                pending.append(row)
+        
+        if pending:
+            search_results = self.search_batch(
+                [queries[row] for row in pending],
+                [5 if analyses[row].is_comparison else 3 for row in pending],
+                analyses=[analyses[row] for row in pending]
+            )
+            for row, found in zip(pending, search_results):
+                with self.metrics.stage('format'):
+                    results[row] = self._format_answer(analyses[row].is_how_to, analyses[row].is_comparison, found)
         
+        if cache is not None and cache.generation == generation:
+            for analysis, result in zip(analyses, results):
+                cache.exact.put(analysis.query, result, analysis.cache_key)
+        return [self._count(result) for result in results]
+    
+    def _invalid_answer(self) -> Dict[str, Any]:
+        return {
+            'answer': "I'm a CDP support assistant designed to answer how-to questions about Segment, mParticle, Lytics, and Zeotap. Could you please rephrase your question as a 'how to' question related to these platforms?",
+            'context': [],
+            'query_type': 'invalid'
+        }
+    
+    def _answer_question(self, analysis: QueryAnalysis, cache: AnswerCache = None) -> Dict[str, Any]:
+        """Search and format an answer for an analyzed query, consulting the semantic cache once it is embedded"""
         # If it's neither a how-to question nor a comparison, return an appropriate response
-        if not is_how_to and not is_comparison:
-            return {
-                'answer': "I'm a CDP support assistant designed to answer how-to questions about Segment, mParticle, Lytics, and Zeotap. Could you please rephrase your question as a 'how to' question related to these platforms?",
-                'context': [],
-                'query_type': 'invalid'
-            }
+        if not analysis.is_valid:
+            return self._invalid_answer()
         
-        # Search for relevant information
-        search_results = self.search(query, top_k=5 if is_comparison else 3)
+        # Near-duplicates only share an answer if they also share intent and target CDP
+        query_embedding = None
+        if cache is not None and cache.semantic is not None and self.retrieval_route(analysis.query) != 'lexical':
+            generation = cache.generation
+            query_embedding = self.embed_query(analysis.query)
+            partition_key = (analysis.is_how_to, analysis.is_comparison, analysis.cdp)
+            with self.metrics.stage('cache_lookup'):
+                result = cache.semantic.get(query_embedding, partition_key)
+            if result is not None:
+                return result
+            result = self._answer_from_search(analysis, query_embedding)
+            if cache.generation == generation:
+                cache.semantic.put(query_embedding, partition_key, result)
+            return result
         
+        return self._answer_from_search(analysis, query_embedding)
+    
+    def _answer_from_search(self, analysis: QueryAnalysis, query_embedding: np.ndarray = None) -> Dict[str, Any]:
+        """Retrieve relevant chunks and format them as a how-to or comparison answer"""
+        # Search for relevant information
+        search_results = self.search(analysis.query, top_k=5 if analysis.is_comparison else 3,
+                                     query_embedding=query_embedding, analysis=analysis)
+        with self.metrics.stage('format'):
+            return self._format_answer(analysis.is_how_to, analysis.is_comparison, search_results)
+    
+    def _format_answer(self, is_how_to: bool, is_comparison: bool, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the answer for a classified query from its search results"""
         if not search_results:
             return {
                 'answer': "I couldn't find specific information to answer your question. Please try rephrasing or ask about a different aspect of the CDP platforms.",
@@ -175,18 +467,11 @@ class QueryEngine:
             # Extract the CDP from the results
             cdp = search_results[0]['cdp']
             
-            # Prepare context with the most relevant information
-            context_text = "\n\n".join([result['chunk_text'] for result in search_results])
-            
             # Create an answer that incorporates the found information
             answer = f"To answer your question about {cdp.capitalize()}, here's how you can do this:\n\n"
             
-            # Extract steps from the context if available
-            steps = []
-            for line in context_text.split('\n'):
-                # Look for numbered steps or bullet points
-                if re.match(r'^\d+\.|\-|\*', line.strip()):
-                    steps.append(line.strip())
+            # Numbered steps and bullet points were extracted from each chunk at index time
+            steps = [step for result in search_results for step in result['steps']]
             
             if steps:
                 answer += "\n".join(steps)
@@ -199,7 +484,7 @@ class QueryEngine:
             
             return {
                 'answer': answer,
-                'context': search_results,
+                'context': self._context(search_results),
                 'query_type': 'how_to'
             }
             
@@ -218,7 +503,7 @@ class QueryEngine:
             # Create comparison sections
             for cdp, results in cdp_info.items():
                 comparison_answer += f"**{cdp.capitalize()}**:\n"
-                comparison_answer += results[0]['chunk_text'][:500] + "...\n\n"
+                comparison_answer += results[0]['snippet'] + "...\n\n"
             
             # Add summary
             comparison_answer += "\n**Summary**: The CDPs differ in their approaches. "
@@ -227,10 +512,69 @@ class QueryEngine:
             
             return {
                 'answer': comparison_answer,
-                'context': search_results,
+                'context': self._context(search_results),
                 'query_type': 'comparison'
             }
 
+    def _context(self, search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Search results as returned to clients, without the precomputed answer fields"""
+        return [{field: result[field] for field in CONTEXT_FIELDS} for result in search_results]
+
+class IndexGeneration:
+    """
+    One loaded copy of the index, sub-indexes and chunk metadata. Searches
+    lease the generation they run on; a retired generation drops its
+    resources once the last lease is returned.
+    """
+    
+    def __init__(self, number: int, fingerprint: Tuple[int, int, int], index: faiss.Index,
+                 index_config: Dict[str, Any], chunks, cdp_indexes: Dict[str, faiss.Index], lexical=None):
+        self.number = number
+        self.fingerprint = fingerprint
+        self.index = index
+        self.index_config = index_config
+        self.chunks = chunks
+        self.cdp_indexes = cdp_indexes
+        self.lexical = lexical  # LexicalIndex, or None if the index directory has no lexical.bin
+        self.lock = threading.Lock()
+        self.active = 0
+        self.retired = False
+    
+    def acquire(self) -> None:
+        with self.lock:
+            self.active += 1
+    
+    def release(self) -> None:
+        with self.lock:
+            self.active -= 1
+            drained = self.retired and self.active == 0
+        if drained:
+            self._drop()
+    
+    @contextmanager
+    def lease(self):
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+    
+    def retire(self) -> None:
+        """Mark the generation as replaced; it is released now or when its last search ends"""
+        with self.lock:
+            self.retired = True
+            drained = self.active == 0
+        if drained:
+            self._drop()
+    
+    def _drop(self) -> None:
+        # Dropping the references lets FAISS free its memory and the chunk store unmap
+        self.index = None
+        self.cdp_indexes = {}
+        self.chunks = None
+        self.lexical = None
+        logging.info(f"Released index generation {self.number}")
+
 def main():
     # Test the query engine
     engine = QueryEngine()
@@ -1,18 +1,204 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import asyncio
+import random
+import argparse
+import httpx
+import importlib.util
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from urllib.parse import urljoin, urlparse, urldefrag
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import re
 import json
 import time
+import hashlib
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# httpx logs every request at INFO; scrape_page already logs each page
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Per-URL validators, content hashes and links, plus the progress of an unfinished crawl
+CRAWL_STATE_FILE = 'crawl_state.json'
+# Pages added, changed and removed by the last completed crawl
+CHANGES_FILE = 'changes.json'
+
+PAGE_FILE_PATTERN = re.compile(r'^(\d+)\.json$')
+
+# lxml builds the tree several times faster than the pure-Python parser; used when installed
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# Page chrome left out of both the content and the links
+EXCLUDED_TAGS = {'nav', 'footer', 'script', 'style', 'header'}
+EXCLUDED_CLASSES = {'sidebar', 'menu', 'navigation'}
+# The first element like these holds the documentation; without one the whole body does
+MAIN_TAGS = {'main', 'article'}
+MAIN_CLASSES = {'content', 'documentation', 'main-content'}
+MAIN_IDS = {'content'}
+# Content elements and how each is written out; ul and ol only contribute their items
+BLOCK_FORMATS = {
+    'h1': "\n## {}\n", 'h2': "\n## {}\n", 'h3': "\n## {}\n",
+    'h4': "\n## {}\n", 'h5': "\n## {}\n", 'h6': "\n## {}\n",
+    'li': "- {}\n",
+    'pre': "\n```\n{}\n```\n",
+    'code': "\n```\n{}\n```\n",
+    'p': "{}\n"
+}
+# Strings get_text() counts as text; comments, doctypes and the like are skipped
+TEXT_TYPES = (NavigableString, CData)
+
+def atomic_write_json(data, path):
+    """Write JSON to a temporary file and rename it over the target"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def extract_page(soup):
+    """
+    Title, content and raw link targets of a parsed page, from one pre-order walk.
+    Chrome is skipped as the walk reaches it instead of being removed up front.
+    Every string is written once, by the innermost content element holding it:
+    a <code> or <p> inside a paragraph or list item is part of that block, and
+    only a nested <li> starts a line of its own. The walk keeps an explicit
+    stack so deeply nested pages can't hit the recursion limit.
+    """
+    title = None
+    body_parts = []  # Output when the page has no main content element
+    main_parts = None  # Output of the first main content element, once found
+    links = []
+    target = None  # Parts list the walk is writing to, None outside the content
+    blocks = []  # Open content elements as [format, text pieces, target, slot in target]
+    stack = [(iter(soup.contents), None)]
+    
+    while stack:
+        children, entered = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            if entered in ('main', 'body'):
+                target = None
+            elif entered is not None and blocks and blocks[-1] is entered:
+                blocks.pop()
+                text = ''.join(entered[1])
+                if text:
+                    # Nested blocks close first; the reserved slot keeps document order
+                    entered[2][entered[3]] = entered[0].format(text)
+            continue
+        
+        if type(node) in TEXT_TYPES:
+            if blocks:
+                piece = node.strip()
+                if piece:
+                    blocks[-1][1].append(piece)
+            continue
+        if not isinstance(node, Tag):
+            continue
+        
+        name = node.name
+        classes = node.get('class') or ()
+        if name in EXCLUDED_TAGS or not EXCLUDED_CLASSES.isdisjoint(classes):
+            continue
+        if name == 'title' and title is None:
+            title = node.get_text()
+        if name == 'a' and node.get('href') is not None:
+            links.append(node['href'])
+        
+        entered = None
+        if main_parts is None and (name in MAIN_TAGS or node.get('id') in MAIN_IDS or
+                                   not MAIN_CLASSES.isdisjoint(classes)):
+            # Only the main content's descendants are emitted, and the body output is dropped
+            main_parts = target = []
+            blocks = []
+            entered = 'main'
+        elif name == 'body' and target is None and main_parts is None:
+            target = body_parts
+            entered = 'body'
+        elif name in BLOCK_FORMATS and target is not None and (not blocks or name == 'li'):
+            target.append('')
+            entered = [BLOCK_FORMATS[name], [], target, len(target) - 1]
+            blocks.append(entered)
+        stack.append((iter(node.contents), entered))
+    
+    parts = main_parts if main_parts is not None else body_parts
+    return {
+        'title': title if title is not None else "No Title",
+        'content': ''.join(parts).strip(),
+    }, links
+
+def parse_page(html, page_url):
+    """
+    Parse a fetched page into its title and content, and the absolute URLs it
+    links to without fragments. Module level so a process pool can run it.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    page_data, hrefs = extract_page(soup)
+    return page_data, [urldefrag(urljoin(page_url, href)).url for href in hrefs]
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class CrawlLimits:
+    """
+    Global and per-host concurrency and rate limits, shared by every scraper in
+    a crawl. A rate of 0 means unlimited.
+    """
+    
+    def __init__(self, concurrency=8, per_host_concurrency=2, rate=0.0, per_host_rate=2.0, burst=1):
+        self.global_slots = asyncio.Semaphore(concurrency)
+        self.global_bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.burst = burst
+        self.host_slots = {}
+        self.host_buckets = {}
+    
+    @asynccontextmanager
+    async def slot(self, url):
+        """Hold a global and a per-host request slot, waiting for both rate limits"""
+        host = urlparse(url).netloc
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.per_host_concurrency)
+            self.host_buckets[host] = TokenBucket(self.per_host_rate, self.burst) if self.per_host_rate > 0 else None
+        
+        async with self.global_slots, self.host_slots[host]:
+            if self.global_bucket is not None:
+                await self.global_bucket.acquire()
+            if self.host_buckets[host] is not None:
+                await self.host_buckets[host].acquire()
+            yield
 
 class DocumentationScraper:
-    def __init__(self, base_url, output_dir, cdp_name):
+    def __init__(self, base_url, output_dir, cdp_name, max_retries=3, backoff=1.0, checkpoint_every=20, html_dir=None):
         self.base_url = base_url
         self.output_dir = os.path.join(output_dir, cdp_name)
         self.cdp_name = cdp_name
+        self.max_retries = max_retries  # Extra attempts after a transient failure
+        self.backoff = backoff  # Seconds before the first retry, doubled for each further one
+        self.checkpoint_every = checkpoint_every  # Pages between crawl state checkpoints
+        self.html_dir = os.path.join(html_dir, cdp_name) if html_dir else None  # Where raw pages are kept, if anywhere
         self.visited_urls = set()
         self.doc_data = []
         self.headers = {
@@ -22,6 +208,47 @@ class DocumentationScraper:
         # Create output directory
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
+        if self.html_dir:
+            os.makedirs(self.html_dir, exist_ok=True)
+        
+        self.state_path = os.path.join(self.output_dir, CRAWL_STATE_FILE)
+        self.state = self.load_state()
+    
+    def load_state(self):
+        """Load the crawl state of earlier runs, or start an empty one"""
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('base_url') == self.base_url:
+                    return state
+                logging.info(f"Base URL changed, discarding {self.state_path}")
+            except Exception as e:
+                logging.error(f"Error loading {self.state_path}: {str(e)}")
+        return {
+            'base_url': self.base_url,
+            'run': 0,
+            'last_change_run': 0,
+            'next_file': 1,
+            'pages': {},  # url -> file, etag, last_modified, content_hash, links, changed_run
+            'progress': None  # frontier, queued and finished pages of an unfinished run
+        }
+    
+    def save_state(self, frontier=None, queued=None, done=None, released=0):
+        """Checkpoint the crawl state; pass the run's progress while the crawl is unfinished"""
+        if done is not None:
+            self.state['progress'] = {
+                'frontier': [list(item) for item in frontier],
+                'queued': sorted(queued),
+                'done': done,
+                'released': released
+            }
+        else:
+            self.state['progress'] = None
+        atomic_write_json(self.state, self.state_path)
+    
+    def page_path(self, number):
+        return os.path.join(self.output_dir, str(number).zfill(4) + '.json')
     
     def url_belongs_to_docs(self, url):
         """Check if URL belongs to documentation section"""
@@ -31,100 +258,255 @@ class DocumentationScraper:
     
     def extract_content(self, soup):
         """Extract relevant content from page"""
-        # Remove navigation, sidebar, footer, etc.
-        for element in soup.select('nav, footer, .sidebar, .menu, .navigation, script, style, header'):
-            element.extract()
-        
-        # Get title
-        title = soup.title.text if soup.title else "No Title"
-        
-        # Get main content
-        main_content = soup.select_one('main, article, .content, .documentation, #content, .main-content')
-        if not main_content:
-            main_content = soup.body
-        
-        # Extract text content
-        content = ""
-        if main_content:
-            # Get all paragraphs, headings, lists, and code blocks
-            for element in main_content.select('p, h1, h2, h3, h4, h5, h6, ul, ol, li, pre, code'):
-                text = element.get_text(strip=True)
-                if text:
-                    tag_name = element.name
-                    if tag_name.startswith('h'):
-                        content += f"\n## {text}\n"
-                    elif tag_name in ['ul', 'ol']:
-                        continue  # We'll get the list items individually
-                    elif tag_name == 'li':
-                        content += f"- {text}\n"
-                    elif tag_name in ['pre', 'code']:
-                        content += f"\n```\n{text}\n```\n"
-                    else:
-                        content += f"{text}\n"
-        
-        return {
-            'title': title,
-            'content': content.strip(),
-        }
+        return extract_page(soup)[0]
     
-    def scrape_page(self, url):
-        """Scrape a single page and extract links to other documentation pages"""
-        if url in self.visited_urls or not self.url_belongs_to_docs(url):
-            return []
-        
+    async def fetch(self, client, limits, url, headers=None):
+        """GET a page within the crawl limits, retrying transient failures with exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            try:
+                async with limits.slot(url):
+                    response = await client.get(url, headers=headers)
+                if response.status_code == 304:
+                    return response
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                # Servers that are shedding load say when to come back
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            
+            if attempt < self.max_retries:
+                logging.warning(f"Retrying {url} in {delay:.1f}s after {error}")
+                await asyncio.sleep(delay)
+        raise RuntimeError(f"giving up after {self.max_retries + 1} attempts, last error {error}")
+    
+    async def scrape_page(self, client, limits, url, parse_pool=None):
+        """
+        Scrape a single page and extract links to other documentation pages.
+        Known pages are fetched conditionally; a 304 or an unchanged content hash
+        leaves their file untouched. Returns the page's links and whether it was
+        'added', 'changed', 'unchanged' or 'failed'. Pages are parsed in
+        parse_pool when one is given.
+        """
         self.visited_urls.add(url)
         logging.info(f"Scraping: {url}")
+        known = self.state['pages'].get(url)
+        
+        headers = {}
+        if known and known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known and known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
         
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = await self.fetch(client, limits, url, headers)
+            if response.status_code == 304:
+                return known['links'], 'unchanged'
             
-            # Extract content
-            page_data = self.extract_content(soup)
+            # Parsing is CPU-bound; in a worker process it doesn't stall the other fetches
+            if parse_pool is not None:
+                page_data, links = await asyncio.get_running_loop().run_in_executor(
+                    parse_pool, parse_page, response.text, str(response.url))
+            else:
+                page_data, links = parse_page(response.text, str(response.url))
             page_data['url'] = url
-            self.doc_data.append(page_data)
-            
-            # Save individual page
-            filename = str(len(self.doc_data)).zfill(4) + '.json'
-            with open(os.path.join(self.output_dir, filename), 'w', encoding='utf-8') as f:
-                json.dump(page_data, f, indent=2)
-            
-            # Find all links
-            links = []
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                absolute_url = urljoin(url, href)
-                if self.url_belongs_to_docs(absolute_url) and absolute_url not in self.visited_urls:
-                    links.append(absolute_url)
-            
-            # Avoid rate limiting
-            time.sleep(1)
-            return links
+            # Links come without fragments, so anchors on one page are one URL
+            links = [link for link in links if self.url_belongs_to_docs(link)]
             
+            # Servers without validators still resend identical pages; the hash catches those
+            content_hash = hashlib.sha1(json.dumps(page_data, ensure_ascii=False).encode('utf-8')).hexdigest()
+            page = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': content_hash,
+                'links': links
+            }
+            if known and known['content_hash'] == content_hash and os.path.exists(self.page_path(known['file'])):
+                status = 'unchanged'
+                page.update(file=known['file'], changed_run=known['changed_run'])
+            else:
+                status = 'changed' if known else 'added'
+                page.update(file=known['file'] if known else self.state['next_file'], changed_run=self.state['run'])
+                if not known:
+                    self.state['next_file'] += 1
+                # Save individual page; a page keeps its file number across crawls
+                with open(self.page_path(page['file']), 'w', encoding='utf-8') as f:
+                    json.dump(page_data, f, indent=2)
+            if self.html_dir:
+                # Raw pages double as fixtures for benchmark_extractor.py
+                with open(os.path.join(self.html_dir, str(page['file']).zfill(4) + '.html'), 'w', encoding='utf-8') as f:
+                    f.write(response.text)
+            self.state['pages'][url] = page
+            return links, status
+        
         except Exception as e:
             logging.error(f"Error scraping {url}: {str(e)}")
-            return []
+            # Keep the last good copy of a page that fails transiently
+            if known and os.path.exists(self.page_path(known['file'])):
+                return known['links'], 'failed'
+            return [], 'failed'
     
-    def scrape(self, max_pages=100):
-        """Scrape documentation pages starting from the base URL"""
-        logging.info(f"Starting scrape of {self.cdp_name} documentation")
+    async def crawl(self, client, limits, max_pages=100, workers=4, parse_pool=None):
+        """
+        Crawl breadth-first from the base URL with workers concurrent fetches.
+        The frontier is a deque plus the set of every URL ever queued, so each
+        page is fetched at most once however often it is linked. Links are queued
+        in the order their pages were discovered, not the order responses arrive,
+        so the crawl visits the same pages in the same order as a serial one.
+        Progress is checkpointed every checkpoint_every pages, and a crawl that
+        was cut short resumes from its last checkpoint.
+        """
+        progress = self.state.get('progress')
+        if progress:
+            logging.info(f"Resuming crawl {self.state['run']} of {self.cdp_name} documentation "
+                         f"({len(progress['done'])} pages done, {len(progress['frontier'])} queued)")
+            frontier = deque(tuple(item) for item in progress['frontier'])
+            queued = set(progress['queued'])
+            done = progress['done']  # url -> [sequence, status]
+            released = progress['released']
+            # Pages finished after the last page whose links were queued hold theirs back
+            pending_links = {sequence: self.state['pages'][url]['links'] if url in self.state['pages'] else []
+                             for url, (sequence, _) in done.items() if sequence >= released}
+        else:
+            self.state['run'] += 1
+            logging.info(f"Starting scrape {self.state['run']} of {self.cdp_name} documentation")
+            start_url = urldefrag(self.base_url).url
+            frontier = deque([(start_url, 0)])
+            queued = {start_url}
+            done = {}
+            released = 0  # Links of pages before this sequence number are queued
+            pending_links = {}
+        started = time.perf_counter()
         
-        to_visit = [self.base_url]
-        page_count = 0
+        in_flight = {}  # url -> sequence of pages being fetched
+        since_checkpoint = 0
+        wakeup = asyncio.Condition()
         
-        while to_visit and page_count < max_pages:
-            current_url = to_visit.pop(0)
-            new_links = self.scrape_page(current_url)
-            to_visit.extend(new_links)
-            page_count += 1
+        async def worker():
+            nonlocal since_checkpoint, released
+            while True:
+                async with wakeup:
+                    # Wait for work, or stop once nothing is queued or running
+                    await wakeup.wait_for(lambda: frontier or not in_flight)
+                    if not frontier:
+                        wakeup.notify_all()
+                        return
+                    url, sequence = frontier.popleft()
+                    in_flight[url] = sequence
+                
+                links, status = await self.scrape_page(client, limits, url, parse_pool)
+                
+                async with wakeup:
+                    pending_links[sequence] = links
+                    while released in pending_links:
+                        for link in pending_links.pop(released):
+                            if link not in queued and len(queued) < max_pages:
+                                frontier.append((link, len(queued)))
+                                queued.add(link)
+                        released += 1
+                    del in_flight[url]
+                    done[url] = [sequence, status]
+                    since_checkpoint += 1
+                    if since_checkpoint >= self.checkpoint_every:
+                        # Pages still in flight go back to the front of the frontier on resume
+                        self.save_state(list(in_flight.items()) + list(frontier), queued, done, released)
+                        since_checkpoint = 0
+                    wakeup.notify_all()
         
-        # Save all data in one file
-        with open(os.path.join(self.output_dir, 'all_docs.json'), 'w', encoding='utf-8') as f:
-            json.dump(self.doc_data, f, indent=2)
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        
+        self.doc_data = self.finish_run(done)
         
-        logging.info(f"Completed scraping {self.cdp_name}. Total pages: {len(self.doc_data)}")
+        elapsed = time.perf_counter() - started
+        logging.info(f"Completed scraping {self.cdp_name}. Total pages: {len(self.doc_data)} "
+                     f"({len(self.doc_data) / elapsed if elapsed else 0.0:.1f} pages/s)")
         return self.doc_data
+    
+    def finish_run(self, done):
+        """
+        Write all_docs.json and the changes manifest, drop pages the crawl no
+        longer reached, and mark the run complete. Returns the crawled pages.
+        """
+        # Pages finish out of order; keep the breadth-first discovery order
+        doc_data = []
+        kept_files = set()
+        for url, (sequence, status) in sorted(done.items(), key=lambda item: item[1][0]):
+            page = self.state['pages'].get(url)
+            if page is None:
+                continue
+            with open(self.page_path(page['file']), 'r', encoding='utf-8') as f:
+                doc_data.append(json.load(f))
+            kept_files.add(page['file'])
+        
+        # Pages this crawl didn't reach (gone, unlinked or past max_pages) are dropped
+        removed = sorted(url for url in self.state['pages'] if url not in done)
+        for url in removed:
+            del self.state['pages'][url]
+        # Also clears out numbered files left by crawls that predate the crawl state
+        for filename in os.listdir(self.output_dir):
+            match = PAGE_FILE_PATTERN.match(filename)
+            if match and int(match.group(1)) not in kept_files:
+                os.remove(os.path.join(self.output_dir, filename))
+        
+        # Save all data in one file
+        atomic_write_json(doc_data, os.path.join(self.output_dir, 'all_docs.json'))
+        
+        by_status = {status: sorted(url for url, (_, page_status) in done.items() if page_status == status)
+                     for status in ('added', 'changed', 'unchanged', 'failed')}
+        if by_status['added'] or by_status['changed'] or removed:
+            self.state['last_change_run'] = self.state['run']
+        changes = {
+            'cdp': self.cdp_name,
+            'run': self.state['run'],
+            'last_change_run': self.state['last_change_run'],
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'added': by_status['added'],
+            'changed': by_status['changed'],
+            'removed': removed,
+            'unchanged': len(by_status['unchanged']),
+            'failed': by_status['failed']
+        }
+        atomic_write_json(changes, os.path.join(self.output_dir, CHANGES_FILE))
+        self.save_state()
+        
+        logging.info(f"{self.cdp_name}: {len(changes['added'])} pages added, {len(changes['changed'])} changed, "
+                     f"{len(removed)} removed, {changes['unchanged']} unchanged, {len(changes['failed'])} failed")
+        return doc_data
+    
+    def scrape(self, max_pages=100, limits=None):
+        """Scrape documentation pages starting from the base URL"""
+        return asyncio.run(crawl_all([self], max_pages, limits))[0]
+
+def make_client(headers, concurrency):
+    """Pooled HTTP client that keeps connections to each docs host alive between requests"""
+    return httpx.AsyncClient(
+        headers=headers,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=httpx.Timeout(30.0),
+        follow_redirects=True
+    )
+
+async def crawl_all(scrapers, max_pages=100, limits=None, concurrency=8, parse_workers=0):
+    """
+    Crawl several doc sites at once through one connection pool and one set of
+    limits. Pages are parsed by parse_workers processes, or inline if it is 0.
+    """
+    limits = limits or CrawlLimits(concurrency=concurrency)
+    parse_pool = ProcessPoolExecutor(parse_workers) if parse_workers > 0 else None
+    try:
+        async with make_client(scrapers[0].headers, concurrency) as client:
+            return await asyncio.gather(*(
+                scraper.crawl(client, limits, max_pages, workers=limits.per_host_concurrency, parse_pool=parse_pool)
+                for scraper in scrapers
+            ))
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
 
 def main():
     # Define CDPs to scrape
@@ -147,11 +529,35 @@ def main():
         }
     ]
     
-    output_dir = 'data/scraped_docs'
+    parser = argparse.ArgumentParser(description="Crawl the CDP documentation sites")
+    parser.add_argument('--output-dir', default='data/scraped_docs')
+    parser.add_argument('--cdp', action='append', dest='cdps', choices=[cdp['name'] for cdp in cdps],
+                        help="CDP to crawl (repeatable); defaults to all of them")
+    parser.add_argument('--base-url', help="Crawl this URL instead of the CDP's docs site, e.g. a local test server")
+    parser.add_argument('--max-pages', type=int, default=50, help="Pages to fetch per CDP")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight across all hosts")
+    parser.add_argument('--per-host-concurrency', type=int, default=2, help="Requests in flight per host")
+    parser.add_argument('--rate', type=float, default=0.0, help="Requests per second across all hosts, 0 for unlimited")
+    parser.add_argument('--per-host-rate', type=float, default=2.0, help="Requests per second per host, 0 for unlimited")
+    parser.add_argument('--burst', type=int, default=1, help="Requests a rate limit lets through back to back")
+    parser.add_argument('--retries', type=int, default=3, help="Retries of a page after a transient failure")
+    parser.add_argument('--backoff', type=float, default=1.0, help="Seconds before the first retry, doubled for each further one")
+    parser.add_argument('--parse-workers', type=int, default=2, help="Processes parsing pages, 0 to parse on the event loop")
+    parser.add_argument('--save-html', metavar='DIR', help="Also keep each page's raw HTML under DIR, e.g. as benchmark fixtures")
+    args = parser.parse_args()
+    
+    selected = [cdp for cdp in cdps if not args.cdps or cdp['name'] in args.cdps]
+    scrapers = [
+        DocumentationScraper(args.base_url or cdp['url'], args.output_dir, cdp['name'], args.retries, args.backoff,
+                             html_dir=args.save_html)
+        for cdp in selected
+    ]
+    
+    async def run():
+        limits = CrawlLimits(args.concurrency, args.per_host_concurrency, args.rate, args.per_host_rate, args.burst)
+        return await crawl_all(scrapers, args.max_pages, limits, args.concurrency, args.parse_workers)
     
-    for cdp in cdps:
-        scraper = DocumentationScraper(cdp['url'], output_dir, cdp['name'])
-        scraper.scrape(max_pages=50)  # Limit to 50 pages per CDP for now
+    asyncio.run(run())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,100 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# background: bind first, then load the query engine in a startup task; preload: load while app.py is imported
+STARTUP_MODES = ['background', 'preload']
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc (Linux only)"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Fields after the parenthesized command name, starting at the state field
+            fields = f.read().rpartition(')')[2].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupProgress:
+    """
+    Tracks a cold start through its phases: how long each took, which one is
+    running, and whether the query engine is ready or failed to load. Time
+    spent before this object was created, starting the interpreter and
+    importing the web framework, is counted as the 'boot' phase.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases = {}  # Phase -> seconds, in the order they ran
+        age = process_age()
+        if age is not None:
+            self.phases['boot'] = age
+            self.started -= age
+        self.state = 'starting'  # starting, loading, ready or failed
+        self.current = None
+        self.ready_after = None
+        self.error = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    @property
+    def failed(self) -> bool:
+        return self.state == 'failed'
+
+    @contextmanager
+    def phase(self, name: str):
+        with self.lock:
+            self.state = 'loading'
+            self.current = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = elapsed
+                self.current = None
+            logging.info(f"Startup phase '{name}' took {elapsed:.2f}s")
+
+    def mark_ready(self) -> None:
+        with self.lock:
+            self.state = 'ready'
+            self.ready_after = time.perf_counter() - self.started
+        logging.info(f"Ready to serve {self.ready_after:.2f}s after process start")
+
+    def mark_failed(self, error: Exception) -> None:
+        with self.lock:
+            self.state = 'failed'
+            self.current = None
+            self.error = str(error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State, the phase running, and seconds per finished phase and since process start"""
+        with self.lock:
+            return {
+                'state': self.state,
+                'phase': self.current,
+                'elapsed_s': time.perf_counter() - self.started,
+                'ready_after_s': self.ready_after,
+                'phases_s': dict(self.phases),
+                'error': self.error
+            }
+
+    def samples(self) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        """Startup gauges for Metrics.render"""
+        snapshot = self.snapshot()
+        gauges = [('startup_phase_seconds', (('phase', name),), seconds) for name, seconds in snapshot['phases_s'].items()]
+        gauges.append(('startup_ready', (), int(self.ready)))
+        if snapshot['ready_after_s'] is not None:
+            gauges.append(('startup_ready_after_seconds', (), snapshot['ready_after_s']))
+        return gauges
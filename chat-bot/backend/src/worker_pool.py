@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class PoolSaturatedError(Exception):
+    """Raised when a request arrives while the pool already holds max_pending jobs"""
+
+class QueryWorkerPool:
+    """Bounded thread pool that keeps encoder and FAISS work off the event loop"""
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 32, timeout: float = 10.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-worker')
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+
+    def _release(self, _future) -> None:
+        # Runs when the job really finishes, so a timed-out job that is still
+        # executing keeps counting against max_pending until it is done
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: float = None) -> Any:
+        """Run func(*args) on the pool, enforcing the queue-depth limit and timeout"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolSaturatedError(f"{self.pending} requests already pending")
+            self.pending += 1
+
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            # Cancelling the wrapper also cancels jobs that are still queued
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.timed_out += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool occupancy and outcome counters"""
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and cancel anything still queued"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
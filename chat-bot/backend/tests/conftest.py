@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+# The backend modules import each other as top-level modules, as when run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from benchmark_suite import synthetic_corpus
+from indexer import DocumentIndexer
+from index_factory import make_index_config
+
+def build_hash_index(root: str, chunks: int = 200, index_config=None, incremental: bool = False,
+                     **indexer_options) -> str:
+    """Index a synthetic corpus under root with the hash encoder; returns the index path"""
+    docs_dir = os.path.join(root, 'docs')
+    index_path = os.path.join(root, 'index')
+    if not os.path.isdir(docs_dir):
+        synthetic_corpus(docs_dir, chunks)
+    indexer = DocumentIndexer(docs_dir, index_path, index_config or make_index_config(),
+                              encoder_config={'backend': 'hash'}, **indexer_options)
+    indexer.process(incremental)
+    return index_path
+
+@pytest.fixture
+def index_builder(tmp_path):
+    """Builds hash-encoder indexes in the test's temporary directory"""
+    def build(chunks: int = 200, index_config=None, incremental: bool = False, **indexer_options) -> str:
+        return build_hash_index(str(tmp_path), chunks, index_config, incremental, **indexer_options)
+    return build
+
+@pytest.fixture(scope='session')
+def hash_index(tmp_path_factory) -> str:
+    """A flat hash-encoder index of 200 synthetic chunks, shared by read-only tests"""
+    return build_hash_index(str(tmp_path_factory.mktemp('hash_index')))
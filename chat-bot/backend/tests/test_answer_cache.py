@@ -0,0 +1,81 @@
+import os
+import json
+from answer_cache import AnswerCache, ExactCache, SemanticCache
+from batcher import BatchScheduler
+from query_engine import QueryEngine
+
+QUERY = "How do I set up a source in Segment?"
+
+def cached_engine(index_path: str) -> QueryEngine:
+    engine = QueryEngine(index_path)
+    engine.answer_cache = AnswerCache(ExactCache(), SemanticCache(engine.index.d))
+    engine.answer_cache.set_generation(engine.generation.fingerprint)
+    return engine
+
+def replace_segment_docs(docs_dir: str, content: str):
+    with open(os.path.join(docs_dir, 'segment', 'all_docs.json'), 'w', encoding='utf-8') as f:
+        json.dump([{'title': 'Sources', 'url': 'https://docs.segment.example.com/sources', 'content': content}], f)
+
+def test_same_generation_keeps_entries():
+    cache = AnswerCache(ExactCache())
+    cache.set_generation((1, 1, 1))
+    cache.exact.put(QUERY, {'answer': 'cached'})
+
+    cache.set_generation((1, 1, 1))
+
+    assert cache.exact.get(' how do i SET UP a source in segment ') == {'answer': 'cached'}
+
+def test_queries_normalizing_alike_but_classified_apart_get_their_own_answers(hash_index):
+    uncached = QueryEngine(hash_index)
+    engine = cached_engine(hash_index)
+    queries = ["how can you configure segment", "How can you configure Segment?"]
+
+    expected = [uncached.answer_question(query)['query_type'] for query in queries]
+    actual = [engine.answer_question(query)['query_type'] for query in queries]
+
+    assert expected == ['invalid', 'how_to']
+    assert actual == expected
+
+def test_reloaded_index_clears_answers_of_the_old_one(index_builder, tmp_path):
+    index_path = index_builder()
+    engine = cached_engine(index_path)
+    first = engine.answer_question(QUERY)
+    assert engine.answer_question(QUERY) is first
+    assert engine.answer_cache.exact.stats()['hits'] == 1
+
+    replace_segment_docs(str(tmp_path / 'docs'), "To set up a source, open Connections and add a source.")
+    index_builder()
+    assert engine.reload_resources()
+
+    assert engine.answer_cache.exact.stats()['size'] == 0
+    assert engine.answer_cache.semantic.stats()['size'] == 0
+    second = engine.answer_question(QUERY)
+    assert second is not first
+    assert "open Connections and add a source" in second['answer']
+    assert engine.answer_question(QUERY) is second
+
+def test_answer_computed_across_a_swap_is_not_cached(hash_index):
+    engine = cached_engine(hash_index)
+    answer_from_search = engine._answer_from_search
+
+    def swap_during_search(analysis, query_embedding=None):
+        # Another thread swaps in a new index while this answer is being computed
+        engine.answer_cache.set_generation('next')
+        return answer_from_search(analysis, query_embedding)
+    engine._answer_from_search = swap_during_search
+
+    engine.answer_question(QUERY)
+
+    assert engine.answer_cache.exact.stats()['size'] == 0
+    assert engine.answer_cache.semantic.stats()['size'] == 0
+
+def test_semantic_lookup_embeds_the_query_through_the_batcher(hash_index):
+    engine = cached_engine(hash_index)
+    engine.batcher = BatchScheduler(engine, max_batch_size=8, max_wait_ms=1.0)
+
+    engine.answer_question(QUERY)
+
+    # One batch embedded the query for the semantic lookup, the next searched with that embedding
+    assert engine.batcher.stats()['queries'] == 2
+    semantic = engine.answer_cache.semantic.stats()
+    assert (semantic['size'], semantic['misses']) == (1, 1)
@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import importlib
+import threading
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def load_app(hash_index, tmp_path, monkeypatch):
+    """Import a fresh app module serving hash_index as data/index, with the given environment"""
+    os.makedirs(tmp_path / 'data')
+    os.symlink(hash_index, tmp_path / 'data' / 'index')
+    monkeypatch.chdir(tmp_path)
+
+    def load(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        sys.modules.pop('app', None)
+        return importlib.import_module('app')
+    yield load
+    sys.modules.pop('app', None)
+
+def wait_until_ready(client: TestClient, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get('/api/health/ready')
+        if response.status_code == 200:
+            return response.json()
+        time.sleep(0.01)
+    raise AssertionError(f"Not ready after {timeout}s: {response.json()}")
+
+def test_preload_defers_warm_up_to_worker_startup(load_app):
+    app = load_app(STARTUP_MODE='preload')
+
+    # Loaded at import, as in the gunicorn master, but not warmed up or ready
+    assert app.query_engine is not None
+    assert not app.startup.ready
+    assert 'warmup' not in app.startup.snapshot()['phases_s']
+
+    with TestClient(app.app) as client:
+        ready = wait_until_ready(client)
+        assert 'warmup' in ready['phases_s']
+        response = client.post('/api/query', json={'query': 'How do I set up a source in Segment?'})
+        assert response.status_code == 200
+
+def test_slow_query_times_out_and_keeps_its_pool_slot(load_app):
+    app = load_app(STARTUP_MODE='background', QUERY_WORKERS='1', QUERY_MAX_PENDING='1', QUERY_TIMEOUT='0.2')
+    released = threading.Event()
+
+    with TestClient(app.app) as client:
+        wait_until_ready(client)
+        answer_question = app.query_engine.answer_question
+
+        def slow_answer(query):
+            released.wait(10)
+            return answer_question(query)
+        app.query_engine.answer_question = slow_answer
+
+        query = {'query': 'How do I set up a source in Segment?'}
+        assert client.post('/api/query', json=query).status_code == 504
+        # The timed-out job still runs, so it still fills the only pending slot
+        response = client.post('/api/query', json=query)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert app.worker_pool.stats()['rejected'] == 1
+
+        released.set()
+        deadline = time.monotonic() + 10
+        while app.worker_pool.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.post('/api/query', json=query).status_code == 200
+        assert app.worker_pool.stats()['timed_out'] == 1
+
+def test_queries_are_refused_until_background_load_finishes(load_app):
+    app = load_app(STARTUP_MODE='background')
+    loaded = threading.Event()
+    load_query_engine = app.load_query_engine
+
+    def blocked_load():
+        loaded.wait(10)
+        return load_query_engine()
+    app.load_query_engine = blocked_load
+
+    with TestClient(app.app) as client:
+        # Up but not ready: the port answers, queries are told to come back
+        assert client.get('/api/health/live').status_code == 200
+        assert client.get('/api/health/ready').status_code == 503
+        response = client.post('/api/query', json={'query': 'How do I set up a source in Segment?'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+        loaded.set()
+        wait_until_ready(client)
+        response = client.post('/api/query', json={'query': 'How do I set up a source in Segment?'})
+        assert response.status_code == 200
+
+def test_failed_load_makes_process_unhealthy(load_app):
+    app = load_app(STARTUP_MODE='background')
+
+    def failing_load():
+        raise RuntimeError("index is corrupt")
+    app.load_query_engine = failing_load
+
+    with TestClient(app.app) as client:
+        deadline = time.monotonic() + 10
+        while client.get('/api/health/live').status_code != 503 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.get('/api/health/live').json()['status'] == 'unhealthy'
+        response = client.post('/api/query', json={'query': 'How do I set up a source in Segment?'})
+        assert response.status_code == 503
+        assert response.json()['detail'] == "The query engine failed to load"
+
+def test_lifespan_shuts_down_the_worker_pool(load_app):
+    app = load_app(STARTUP_MODE='background')
+
+    with TestClient(app.app) as client:
+        wait_until_ready(client)
+
+    with pytest.raises(RuntimeError):
+        app.worker_pool.executor.submit(sum, [1, 2])
+
+def test_batch_endpoint_answers_in_input_order(load_app):
+    # Without the answer cache, single queries can't just return what the batch cached
+    app = load_app(STARTUP_MODE='background', BATCH_QUERY_MAX_SIZE='4', ANSWER_CACHE_SIZE='0')
+    queries = ["How do I set up a source in Segment?", "Tell me about pricing",
+               "How does Lytics compare to Zeotap?", "How can I create an audience in mParticle?"]
+
+    with TestClient(app.app) as client:
+        wait_until_ready(client)
+        response = client.post('/api/query/batch', json={'queries': queries})
+        singles = [client.post('/api/query', json={'query': query}).json() for query in queries]
+        too_many = client.post('/api/query/batch', json={'queries': queries + queries[:1]})
+
+    assert response.status_code == 200
+    assert response.json()['results'] == singles
+    assert [result['query_type'] for result in singles] == ['how_to', 'invalid', 'comparison', 'how_to']
+    assert too_many.status_code == 413
+
+def parse_metrics(text: str):
+    """Sample name with labels -> value, and metric name -> type, from the Prometheus text format"""
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples, types
+
+def test_metrics_endpoint_exposes_stage_latencies_and_counters(load_app):
+    app = load_app(STARTUP_MODE='background')
+    query = {'query': 'How do I set up a source in Segment?'}
+
+    with TestClient(app.app) as client:
+        wait_until_ready(client)
+        timed = client.post('/api/query', json=dict(query, timings=True)).json()
+        client.post('/api/query', json=query)
+        client.post('/api/query', json={'query': 'Tell me about pricing'})
+        response = client.get('/api/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    samples, types = parse_metrics(response.text)
+    # Per-stage histograms, with the same stages the timed answer reported
+    assert types['cdp_stage_duration_seconds'] == 'histogram'
+    for stage in ('classify', 'encode', 'index_search', 'format'):
+        assert stage in timed['timings']
+        assert samples[f'cdp_stage_duration_seconds_count{{stage="{stage}"}}'] >= 1
+        assert samples[f'cdp_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}}'] == \
+            samples[f'cdp_stage_duration_seconds_count{{stage="{stage}"}}']
+    assert samples['cdp_http_request_duration_seconds_count{method="POST",route="/api/query",status="200"}'] == 3
+    # Counters: answers by type, and component stats that only grow
+    assert types['cdp_queries_total'] == 'counter'
+    assert samples['cdp_queries_total{query_type="how_to"}'] == 2
+    assert samples['cdp_queries_total{query_type="invalid"}'] == 1
+    assert samples['cdp_worker_pool_completed_total'] == 3
+    assert samples['cdp_answer_cache_exact_hits_total'] == 1
+    assert types['cdp_answer_cache_exact_hits_total'] == 'counter'
+    # Gauges describing the loaded index
+    assert types['cdp_index_vectors'] == 'gauge'
+    assert samples['cdp_index_vectors'] == samples['cdp_index_chunks'] == 200
+    assert samples['cdp_index_generation'] == app.query_engine.generation.number
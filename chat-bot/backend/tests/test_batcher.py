@@ -0,0 +1,85 @@
+import threading
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from benchmark_suite import synthetic_queries
+from batcher import BatchScheduler
+from query_engine import QueryEngine
+
+@pytest.fixture(scope='module')
+def engine(hash_index):
+    return QueryEngine(hash_index)
+
+def test_concurrent_searches_get_their_own_results(engine):
+    queries = synthetic_queries(48)
+    top_ks = [3 + row % 3 for row in range(len(queries))]
+    expected = [engine.search(query, top_k) for query, top_k in zip(queries, top_ks)]
+    batcher = BatchScheduler(engine, max_batch_size=8, max_wait_ms=20.0)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(batcher.submit, queries, top_ks))
+
+    assert results == expected
+    stats = batcher.stats()
+    assert stats['queries'] == len(queries)
+    # Searches were actually coalesced, never past the batch size
+    assert stats['batches'] < len(queries)
+    assert max(stats['batch_size_counts']) <= 8
+
+def test_embedding_callers_share_the_batch_encode_call(engine, monkeypatch):
+    queries = synthetic_queries(12)
+    expected = engine.encode_queries(queries)
+    encoded = []
+    encode_queries = engine.encode_queries
+
+    def recording_encode(texts):
+        encoded.append(len(texts))
+        return encode_queries(texts)
+    monkeypatch.setattr(engine, 'encode_queries', recording_encode)
+    batcher = BatchScheduler(engine, max_batch_size=12, max_wait_ms=200.0)
+    barrier = threading.Barrier(12)
+
+    def embed_or_search(row):
+        barrier.wait()
+        if row % 2:
+            return batcher.encode(queries[row])
+        return batcher.submit(queries[row], 3)
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(embed_or_search, range(12)))
+
+    # Searches and embedding-only callers went through one encoder call
+    assert sum(encoded) == 12 and len(encoded) == batcher.stats()['batches']
+    for row in range(1, 12, 2):
+        np.testing.assert_allclose(results[row], expected[row], atol=1e-6)
+    assert results[0] == engine.search(queries[0], 3)
+
+class FailingEngine:
+    def retrieval_route(self, query):
+        return 'dense'
+
+    def encode_queries(self, queries):
+        return np.zeros((len(queries), 4), dtype=np.float32)
+
+    def search_batch(self, queries, top_ks, query_embeddings, analyses):
+        raise RuntimeError("index unavailable")
+
+def test_failed_batch_raises_in_every_caller():
+    batcher = BatchScheduler(FailingEngine(), max_batch_size=4, max_wait_ms=20.0)
+    errors = []
+    barrier = threading.Barrier(4)
+
+    def submit(query):
+        barrier.wait()
+        try:
+            batcher.submit(query, 3)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=submit, args=(f"query {n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == ["index unavailable"] * 4
@@ -0,0 +1,33 @@
+import io
+import json
+import pytest
+from benchmark_suite import synthetic_queries
+from query_engine import QueryEngine
+from bulk_answer import answer_stream
+
+@pytest.fixture(scope='module')
+def engine(hash_index):
+    return QueryEngine(hash_index)
+
+def test_batched_answers_match_one_at_a_time(engine):
+    queries = synthetic_queries(40) + ["Tell me about pricing"]
+
+    assert engine.answer_questions(queries) == [engine.answer_question(query) for query in queries]
+
+def test_answer_stream_keeps_records_in_order_and_skips_bad_lines(engine):
+    queries = synthetic_queries(7)
+    lines = [json.dumps({'ticket': number, 'question': query}) for number, query in enumerate(queries)]
+    lines[3:3] = ['', 'not json', json.dumps({'ticket': 'no question'})]
+    sink = io.StringIO()
+
+    written = answer_stream(engine, io.StringIO('\n'.join(lines)), sink, query_field='question', chunk_size=3,
+                            include_context=False)
+
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert written == len(records) == 7
+    assert [record['ticket'] for record in records] == list(range(7))
+    for record, query in zip(records, queries):
+        expected = engine.answer_question(query)
+        assert (record['question'], record['answer'], record['query_type']) == \
+            (query, expected['answer'], expected['query_type'])
+        assert 'context' not in record
@@ -0,0 +1,53 @@
+from chunk_store import ChunkStore, ChunkStoreWriter, ListChunkStore, extract_steps, summary_snippet, SNIPPET_CHARS
+
+def chunk(chunk_id: int, text: str, cdp: str = 'segment', title: str = 'Sources', **fields):
+    return dict({'id': chunk_id, 'chunk_text': text, 'title': title, 'url': f"https://docs.{cdp}.example.com/{title}",
+                 'cdp': cdp}, **fields)
+
+def write_store(path: str, chunks):
+    with ChunkStoreWriter(path) as writer:
+        for item in chunks:
+            writer.append(item)
+        writer.commit()
+
+def test_answer_fields_round_trip_through_the_store(tmp_path):
+    long_text = "Intro über Quellen.\n1. Open Connections\n- Pick a source\n" + "détail " * 100
+    chunks = [
+        chunk(7, long_text, heading_path=['Setup', 'Sources'], steps=extract_steps(long_text),
+              snippet=summary_snippet(long_text)),
+        # Fields are stored as given, not recomputed from the text
+        chunk(3, "2. Only step", cdp='lytics', title='Audiences', heading_path=[], steps=['custom step'],
+              snippet="2. Only"),
+        chunk(12, "No steps here", heading_path=['Overview'], steps=[], snippet="No steps here")
+    ]
+    path = str(tmp_path / 'chunks.bin')
+    write_store(path, chunks)
+
+    store = ChunkStore(path)
+
+    assert len(store) == 3
+    assert [item['id'] for item in store] == [7, 3, 12]
+    for expected in chunks:
+        assert store.get(expected['id']) == expected
+    assert store.get(7)['steps'] == ['1. Open Connections', '- Pick a source']
+    assert len(store.get(7)['snippet']) == SNIPPET_CHARS
+    assert store.get(5) is None and store.get(99) is None and store.get(-1) is None
+
+def test_reopened_store_reads_the_same_chunks(tmp_path):
+    chunks = [chunk(chunk_id, f"- step {chunk_id}\ntext {chunk_id}", heading_path=['A', str(chunk_id)])
+              for chunk_id in range(50)]
+    path = str(tmp_path / 'chunks.bin')
+    write_store(path, chunks)
+    first = list(ChunkStore(path))
+
+    second = list(ChunkStore(path))
+
+    assert first == second
+    # Missing answer fields were precomputed by the writer
+    assert first[4]['steps'] == ['- step 4'] and first[4]['snippet'] == "- step 4\ntext 4"
+
+def test_legacy_chunks_get_answer_fields_on_load():
+    store = ListChunkStore([{'chunk_text': "1. First\n2. Second", 'title': 'T', 'url': 'u', 'cdp': 'zeotap'}])
+
+    assert store.get(0)['steps'] == ['1. First', '2. Second']
+    assert store.get(0)['heading_path'] == []
@@ -0,0 +1,47 @@
+import random
+import pytest
+from encoder import TokenCounter
+from chunker import Chunker, DuplicateFilter
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+def text(seed: int, words: int = 60) -> str:
+    return ' '.join(random.Random(seed).choices(WORDS, k=words))
+
+def test_chunks_fit_budget_and_keep_all_text():
+    document = '# Setup\n\n' + '\n\n'.join(text(seed, 20 + seed * 15) + '.' for seed in range(12))
+    chunker = Chunker(TokenCounter(), max_tokens=64)
+
+    chunks = chunker.chunk(document)
+
+    assert all(len(chunk.split()) <= 64 for chunk, _ in chunks)
+    assert ''.join(''.join(chunk.split()) for chunk, _ in chunks) == ''.join(document.split())
+    assert chunks[1][1] == ['Setup']
+
+def test_chunk_larger_than_encoder_input_is_rejected():
+    with pytest.raises(ValueError):
+        Chunker(TokenCounter(max_seq_length=32), max_tokens=64)
+
+def test_exact_and_near_duplicates_are_dropped_within_a_cdp():
+    duplicates = DuplicateFilter()
+    original = text(1)
+    near = original.replace(original.split()[30], 'changed')
+
+    assert not duplicates.is_duplicate('segment', original)
+    assert duplicates.is_duplicate('segment', '  ' + original.upper())
+    assert duplicates.is_duplicate('segment', near)
+    assert not duplicates.is_duplicate('segment', text(2))
+    # Other CDPs' docs are never deduplicated against each other
+    assert not duplicates.is_duplicate('lytics', original)
+    assert (duplicates.exact_dropped, duplicates.near_dropped) == (1, 1)
+
+def test_memory_is_bounded_by_window():
+    duplicates = DuplicateFilter(window=50)
+    for seed in range(500):
+        assert not duplicates.is_duplicate('segment', text(seed))
+
+    assert len(duplicates.exact) == 50
+    assert sum(len(buckets) for buckets in duplicates.buckets.values()) <= 50 * duplicates.bands
+    # Recent chunks are still caught, ones evicted from the window are not
+    assert duplicates.is_duplicate('segment', text(499))
+    assert not duplicates.is_duplicate('segment', text(0))
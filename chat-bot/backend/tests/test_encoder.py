@@ -0,0 +1,29 @@
+import json
+import pytest
+import numpy as np
+from encoder import make_encoder, encoder_for_index, encoder_info, load_encoder_info, HASH_DIMENSION
+
+def test_hash_encoder_is_deterministic_and_normalized():
+    encoder = make_encoder('hash')
+
+    embeddings = encoder.encode(["Set up a Segment source", "set up a segment SOURCE", ""])
+
+    assert embeddings.shape == (3, HASH_DIMENSION)
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-6)
+    np.testing.assert_array_equal(embeddings[0], embeddings[1])
+    np.testing.assert_array_equal(embeddings[0], make_encoder('hash').encode(["Set up a Segment source"])[0])
+
+def test_index_picks_the_encoder_that_built_it(hash_index):
+    assert load_encoder_info(hash_index)['space'] == f"hash-{HASH_DIMENSION}"
+    assert encoder_for_index(hash_index).backend == 'hash'
+
+def test_encoder_from_another_space_is_refused(tmp_path):
+    with open(tmp_path / 'encoder.json', 'w', encoding='utf-8') as f:
+        json.dump(encoder_info('torch', 'all-MiniLM-L6-v2', 384), f)
+
+    with pytest.raises(ValueError, match="rebuild the index or switch encoders"):
+        encoder_for_index(str(tmp_path), backend='hash')
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown encoder backend"):
+        make_encoder('tensorflow')
@@ -0,0 +1,29 @@
+import faiss
+import numpy as np
+from chunk_store import load_chunk_store
+from encoder import make_encoder
+from index_factory import make_index_config
+from evaluate_index import load_corpus_embeddings
+
+def test_load_corpus_embeddings_reads_vectors_inside_id_map(hash_index):
+    assert isinstance(faiss.read_index(f"{hash_index}/docs.index"), (faiss.IndexIDMap, faiss.IndexIDMap2))
+    chunks = list(load_chunk_store(hash_index))
+    encoder = make_encoder('hash')
+
+    embeddings = load_corpus_embeddings(hash_index, chunks, encoder)
+
+    assert embeddings.shape == (len(chunks), encoder.dimension)
+    expected = encoder.encode([chunk['chunk_text'] for chunk in chunks])
+    np.testing.assert_allclose(embeddings, expected, atol=1e-6)
+
+def test_load_corpus_embeddings_reads_vectors_inside_refine_wrapper(index_builder):
+    index_path = index_builder(index_config=make_index_config(storage='int8', rerank=4))
+    outer = faiss.read_index(f"{index_path}/docs.index")
+    assert isinstance(faiss.downcast_index(outer.index), faiss.IndexRefineFlat)
+    chunks = list(load_chunk_store(index_path))
+    encoder = make_encoder('hash')
+
+    embeddings = load_corpus_embeddings(index_path, chunks, encoder)
+
+    expected = encoder.encode([chunk['chunk_text'] for chunk in chunks])
+    np.testing.assert_allclose(embeddings, expected, atol=1e-6)
@@ -0,0 +1,74 @@
+import faiss
+import numpy as np
+import pytest
+from index_factory import (StreamingIndexBuilder, make_index_config, training_sample_size, save_index_config,
+                           load_index_config)
+
+DIMENSION = 32
+CDPS = 4
+
+def build(config, per_cdp: int, batch_size: int = 50, seed: int = 0):
+    """
+    Stream unit vectors around one random center per CDP into a builder, one
+    CDP after another like the indexer does. Returns the index and the centers.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(CDPS, DIMENSION)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    builder = StreamingIndexBuilder(config)
+    next_id = 0
+    for center in centers:
+        vectors = center + 0.05 * rng.normal(size=(per_cdp, DIMENSION)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for start in range(0, per_cdp, batch_size):
+            batch = vectors[start:start + batch_size]
+            builder.add(batch, np.arange(next_id, next_id + len(batch), dtype=np.int64))
+            next_id += len(batch)
+    return builder.finish(), centers
+
+def test_ivf_centroids_cover_every_cdp():
+    config = make_index_config(index_type='ivf_flat', nlist=8)
+    # Several times the training sample per CDP, so the first CDP alone could fill it
+    index, centers = build(config, per_cdp=2 * training_sample_size(config))
+
+    ivf = faiss.extract_index_ivf(index)
+    assert ivf.nlist == 8
+    centroids = ivf.quantizer.reconstruct_n(0, ivf.nlist)
+    # Every CDP's cluster has a centroid close to it, not only the CDP streamed first
+    assert (centers @ centroids.T).max(axis=1).min() > 0.9
+
+def test_spilled_vectors_are_all_added_with_their_ids():
+    config = make_index_config(index_type='ivf_flat', nlist=8)
+    per_cdp = training_sample_size(config)
+    index, _ = build(config, per_cdp=per_cdp)
+
+    assert index.ntotal == CDPS * per_cdp
+    ids = np.sort(faiss.vector_to_array(index.id_map))
+    np.testing.assert_array_equal(ids, np.arange(CDPS * per_cdp))
+
+def test_small_stream_shrinks_config_to_fit():
+    config = make_index_config(index_type='ivf_flat', nlist=100)
+    index, _ = build(config, per_cdp=20)
+
+    assert index.ntotal == CDPS * 20
+    assert faiss.extract_index_ivf(index).nlist == CDPS * 20 // 39
+
+def test_ivf_pq_sample_trains_every_pq_codebook(capfd):
+    # Each sub-quantizer is a k-means over 2 ** pq_nbits centroids, which FAISS wants 39 points each for
+    assert training_sample_size(make_index_config(index_type='ivf_pq', nlist=20)) == 256 * 39
+    config = make_index_config(index_type='ivf_pq', nlist=4, pq_m=4, pq_nbits=6)
+    assert training_sample_size(config) == 64 * 39
+
+    index, _ = build(config, per_cdp=training_sample_size(config) // CDPS + 100, batch_size=500)
+
+    assert index.ntotal == CDPS * (64 * 39 // CDPS + 100)
+    assert "please provide at least" not in capfd.readouterr().err
+
+def test_failed_config_write_leaves_the_saved_config_intact(tmp_path):
+    config = make_index_config(index_type='ivf_flat', nlist=8)
+    save_index_config(str(tmp_path), config)
+
+    with pytest.raises(TypeError):
+        save_index_config(str(tmp_path), dict(config, nlist=object()))
+
+    assert load_index_config(str(tmp_path)) == config
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import logging
+import threading
+import faiss
+import numpy as np
+from chunk_store import load_chunk_store
+from encoder import make_encoder
+from benchmark_suite import synthetic_corpus
+from indexer import DocumentIndexer
+from conftest import build_hash_index
+
+def load_manifest(index_path: str):
+    with open(f"{index_path}/manifest.json", 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def test_manifest_records_chunking_settings(index_builder):
+    index_path = index_builder(chunk_overlap=8)
+
+    assert load_manifest(index_path)['chunking'] == {'chunk_tokens': 128, 'chunk_overlap': 8, 'dedup_threshold': 0.9,
+                                                  'dedup_window': 100000}
+
+def test_changed_chunking_forces_full_build(index_builder, caplog):
+    index_path = index_builder()
+
+    with caplog.at_level(logging.INFO):
+        index_builder(chunk_tokens=64, incremental=True)
+
+    assert "Chunking settings changed since the last build, running a full build" in caplog.text
+    manifest = load_manifest(index_path)
+    assert manifest['chunking']['chunk_tokens'] == 64
+    chunks = list(load_chunk_store(index_path))
+    # Every chunk comes from the new chunking, none is left over from the old one
+    assert all(len(chunk['chunk_text'].split()) <= 64 for chunk in chunks)
+    assert faiss.read_index(f"{index_path}/docs.index").ntotal == len(chunks) == len(manifest['chunks'])
+
+def indexed_vectors(index_file: str):
+    """ID -> vector of a flat float32 index inside an IDMap"""
+    outer = faiss.read_index(index_file)
+    ids = faiss.vector_to_array(outer.id_map)
+    vectors = faiss.downcast_index(outer.index).reconstruct_n(0, outer.ntotal)
+    return dict(zip(ids.tolist(), vectors))
+
+def edit_corpus(docs_dir: str):
+    """Change one Segment page, drop one Lytics page and add an mParticle page"""
+    def rewrite(cdp, edit):
+        path = os.path.join(docs_dir, cdp, 'all_docs.json')
+        with open(path, 'r', encoding='utf-8') as f:
+            docs = json.load(f)
+        edit(docs)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(docs, f)
+    rewrite('segment', lambda docs: docs[0].update(content=docs[0]['content'] + '\n\nNew paragraph on replays.'))
+    rewrite('lytics', lambda docs: docs.pop())
+    rewrite('mparticle', lambda docs: docs.append({'title': 'Kits', 'url': 'https://docs.mparticle.example.com/kits',
+                                                   'content': 'Kits forward events to partner SDKs on the device.'}))
+
+def test_incremental_update_removes_stale_vectors_everywhere(tmp_path, caplog):
+    index_path = build_hash_index(str(tmp_path / 'incremental'))
+    before = load_manifest(index_path)
+    edit_corpus(str(tmp_path / 'incremental' / 'docs'))
+    shutil.copytree(tmp_path / 'incremental' / 'docs', tmp_path / 'full' / 'docs')
+
+    with caplog.at_level(logging.INFO):
+        build_hash_index(str(tmp_path / 'incremental'), incremental=True)
+    assert "Index updated incrementally" in caplog.text
+    full_path = build_hash_index(str(tmp_path / 'full'))
+
+    manifest = load_manifest(index_path)
+    chunks = {chunk['id']: chunk for chunk in load_chunk_store(index_path)}
+    vectors = indexed_vectors(f"{index_path}/docs.index")
+    # Global index, chunk store and manifest hold the same IDs, and unchanged chunks keep theirs
+    assert set(vectors) == set(chunks) == set(manifest['chunks'].values())
+    assert set(before['chunks'].values()) - set(vectors)
+    assert set(vectors) - set(before['chunks'].values())
+    kept = before['chunks'].keys() & manifest['chunks'].keys()
+    assert kept and all(before['chunks'][key] == manifest['chunks'][key] for key in kept)
+    # Each ID's vector is the embedding of that ID's chunk
+    encoder = make_encoder('hash')
+    ids = sorted(chunks)
+    expected = encoder.encode([chunks[chunk_id]['chunk_text'] for chunk_id in ids])
+    np.testing.assert_allclose(np.stack([vectors[chunk_id] for chunk_id in ids]), expected, atol=1e-6)
+    # Each CDP partition holds exactly that CDP's chunks
+    for cdp in ('segment', 'mparticle', 'lytics', 'zeotap'):
+        cdp_ids = set(indexed_vectors(f"{index_path}/docs_{cdp}.index"))
+        assert cdp_ids == {chunk_id for chunk_id, chunk in chunks.items() if chunk['cdp'] == cdp}
+    # Same chunks as a full build of the edited corpus
+    full_chunks = sorted((chunk['cdp'], chunk['chunk_text']) for chunk in load_chunk_store(full_path))
+    assert sorted((chunk['cdp'], chunk['chunk_text']) for chunk in chunks.values()) == full_chunks
+
+def index_files(index_path: str):
+    """Contents of every file a build writes, by name"""
+    files = {}
+    for name in sorted(os.listdir(index_path)):
+        with open(os.path.join(index_path, name), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+def test_parallel_build_is_identical_to_serial(tmp_path):
+    serial = build_hash_index(str(tmp_path / 'serial'), batch_size=32)
+    shutil.copytree(tmp_path / 'serial' / 'docs', tmp_path / 'parallel' / 'docs')
+
+    parallel = build_hash_index(str(tmp_path / 'parallel'), batch_size=32, workers=2)
+
+    serial_files = index_files(serial)
+    assert 'docs.index' in serial_files and 'chunks.bin' in serial_files
+    assert index_files(parallel) == serial_files
+
+def test_worker_failing_to_load_its_encoder_fails_the_build(tmp_path):
+    synthetic_corpus(str(tmp_path / 'docs'), 50)
+    # The parent never builds an encoder with workers; make_encoder rejects the option in each worker
+    indexer = DocumentIndexer(str(tmp_path / 'docs'), str(tmp_path / 'index'),
+                              encoder_config={'backend': 'hash', 'unknown_option': 1}, workers=2)
+    errors = []
+
+    def build():
+        try:
+            indexer.process()
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=build, daemon=True)
+    thread.start()
+    thread.join(120)
+
+    assert not thread.is_alive(), "build hung on a broken worker pool"
+    assert isinstance(errors[0], RuntimeError)
+    assert "Embedding worker failed" in str(errors[0])
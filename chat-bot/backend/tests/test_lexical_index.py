@@ -0,0 +1,86 @@
+import math
+import pytest
+from lexical_index import (LexicalIndex, build_lexical_index, load_lexical_index, reciprocal_rank_fusion, tokenize,
+                           K1, B)
+from query_engine import QueryEngine
+
+CHUNKS = [
+    {'id': 10, 'cdp': 'segment', 'title': 'Tracking events', 'chunk_text': 'Call analytics.track with an event name.'},
+    {'id': 11, 'cdp': 'segment', 'title': 'Identify', 'chunk_text': 'Call analytics.identify with a user_id and traits.'},
+    {'id': 20, 'cdp': 'mparticle', 'title': 'Events', 'chunk_text': 'Log an event, then track the event in batches.'},
+    {'id': 30, 'cdp': 'lytics', 'title': 'Profiles', 'chunk_text': 'Profiles merge on user_id and email.'},
+]
+
+def reference_bm25(chunks, query: str, cdp: str = None):
+    """(chunk ID, BM25 score) of every matching chunk, computed directly from the token lists"""
+    documents = [tokenize(chunk['title'] + '\n' + chunk['chunk_text']) for chunk in chunks]
+    average_length = sum(len(tokens) for tokens in documents) / len(documents)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in tokens for tokens in documents)
+        if not df:
+            continue
+        idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+        for chunk, tokens in zip(chunks, documents):
+            tf = tokens.count(term)
+            if tf and (cdp is None or chunk['cdp'] == cdp):
+                norm = K1 * (1 - B + B * len(tokens) / average_length)
+                scores[chunk['id']] = scores.get(chunk['id'], 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+@pytest.fixture
+def lexical(tmp_path) -> LexicalIndex:
+    path = str(tmp_path / 'lexical.bin')
+    build_lexical_index(CHUNKS, path)
+    return LexicalIndex(path)
+
+@pytest.mark.parametrize('query', ['track event', 'user_id', 'analytics.identify traits', 'email profiles'])
+def test_mapped_scores_match_in_memory_bm25(lexical, query):
+    results = lexical.search(query, top_k=10)
+
+    expected = reference_bm25(CHUNKS, query)
+    assert [chunk_id for chunk_id, _ in results] == [chunk_id for chunk_id, _ in expected]
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected], rel=1e-5)
+
+def test_cdp_filter_and_top_k(lexical):
+    assert [chunk_id for chunk_id, _ in lexical.search('user_id', top_k=10, cdp='lytics')] == [30]
+    assert lexical.search('user_id', top_k=10, cdp='zeotap') == []
+    assert lexical.search('the and of', top_k=10) == []
+    assert len(lexical.search('event', top_k=1)) == 1
+
+def test_reciprocal_rank_fusion_orders_by_summed_reciprocal_rank():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=60)
+
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+def test_hybrid_search_fuses_the_dense_and_lexical_rankings(hash_index):
+    query = "How do I batch events before sending them?"
+    dense = QueryEngine(hash_index, retrieval_mode='dense')
+    hybrid = QueryEngine(hash_index, retrieval_mode='hybrid')
+    chunk_ids = {chunk['chunk_text']: chunk_id for chunk_id, chunk in enumerate(hybrid.chunks)}
+
+    results = hybrid.search(query, top_k=5)
+
+    dense_ids = [chunk_ids[result['chunk_text']] for result in dense.search(query, top_k=hybrid.fusion_depth)]
+    lexical_ids = [chunk_id for chunk_id, _ in load_lexical_index(hash_index).search(query, hybrid.fusion_depth)]
+    expected = reciprocal_rank_fusion([dense_ids, lexical_ids])[:5]
+    assert [chunk_ids[result['chunk_text']] for result in results] == [chunk_id for chunk_id, _ in expected]
+    assert [result['score'] for result in results] == pytest.approx([score for _, score in expected])
+
+def test_auto_mode_answers_identifier_queries_without_the_encoder(hash_index, monkeypatch):
+    engine = QueryEngine(hash_index, retrieval_mode='auto')
+    def encode_queries(queries):
+        raise AssertionError(f"encoded {queries}")
+    monkeypatch.setattr(engine, 'encode_queries', encode_queries)
+    query = "What does analytics.track send in Segment?"
+
+    results = engine.search(query, top_k=3)
+
+    assert engine.retrieval_route(query) == 'lexical'
+    # The query names Segment, so the lexical search is limited to its chunks
+    expected = load_lexical_index(hash_index).search(query, 3, cdp='segment')
+    assert engine.analyze(query).cdp == 'segment'
+    assert {result['cdp'] for result in results} == {'segment'}
+    assert [result['score'] for result in results] == pytest.approx([score for _, score in expected])
+    assert engine.retrieval_route("How do I batch events?") == 'hybrid'
@@ -0,0 +1,36 @@
+from benchmark_analyzer import SAMPLE_QUERIES, linear_scan_analysis
+from benchmark_suite import synthetic_queries
+from query_analyzer import QueryAnalyzer
+
+# Keywords overlapping each other or CDP aliases, where a single scan could miss one
+OVERLAPPING_QUERIES = [
+    "segment.io vs segment.com",
+    "Segmentation versus audiences",
+    "howto guide for lytics.io",
+    "how do i compare mparticle.com and zeotap?",
+    "best vs better vs prefer",
+    "steps to and instructions for nothing",
+    "How is the zeotapsegment graph set up",
+    "What are the differences?",
+    "mparticlelytics",
+    "",
+    "   ?  "
+]
+
+def test_analyzer_agrees_with_linear_scan():
+    analyzer = QueryAnalyzer()
+
+    for query in SAMPLE_QUERIES + synthetic_queries(300) + OVERLAPPING_QUERIES:
+        analysis = analyzer.analyze(query)
+        actual = {'normalized': analysis.normalized, 'is_how_to': analysis.is_how_to,
+                  'is_comparison': analysis.is_comparison, 'cdps': analysis.cdps, 'cdp': analysis.cdp}
+        assert actual == linear_scan_analysis(query), query
+
+def test_keyword_that_prefixes_another_keeps_its_labels():
+    analyzer = QueryAnalyzer(cdp_patterns={'seg': ['seg'], 'segment': ['segment']},
+                             how_to_indicators=['how to'], comparison_keywords=['vs', 'vsx'])
+
+    analysis = analyzer.analyze("segment vsx")
+
+    assert analysis.cdps == ('seg', 'segment')
+    assert analysis.is_comparison
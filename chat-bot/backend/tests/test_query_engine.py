@@ -0,0 +1,43 @@
+import faiss
+import numpy as np
+from chunk_store import load_chunk_store
+from encoder import make_encoder
+from query_engine import QueryEngine
+
+def exact_top_k(index_path: str, query: str, top_k: int, cdp: str = None):
+    """(chunk text, score) of the best top_k chunks by brute force, optionally only from cdp"""
+    chunks = [chunk for chunk in load_chunk_store(index_path) if cdp is None or chunk['cdp'] == cdp]
+    encoder = make_encoder('hash')
+    scores = encoder.encode([chunk['chunk_text'] for chunk in chunks]) @ encoder.encode([query])[0]
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    return [(chunks[row]['chunk_text'], float(scores[row])) for row in order]
+
+def test_cdp_sub_indexes_partition_the_global_index(hash_index):
+    total = faiss.read_index(f"{hash_index}/docs.index").ntotal
+
+    sizes = {cdp: faiss.read_index(f"{hash_index}/docs_{cdp}.index").ntotal
+             for cdp in ('segment', 'mparticle', 'lytics', 'zeotap')}
+
+    assert sum(sizes.values()) == total
+    assert all(sizes.values())
+
+def test_cdp_filtered_search_returns_the_cdps_best_chunks(hash_index):
+    engine = QueryEngine(hash_index)
+    query = "How do I configure a destination in Zeotap?"
+
+    results = engine.search(query, top_k=10)
+
+    # A full top_k from the CDP, even where other CDPs' chunks score higher overall
+    assert len(results) == 10
+    assert {result['cdp'] for result in results} == {'zeotap'}
+    expected = exact_top_k(hash_index, query, 10, 'zeotap')
+    assert [result['chunk_text'] for result in results] == [text for text, _ in expected]
+    np.testing.assert_allclose([result['score'] for result in results], [score for _, score in expected], atol=1e-5)
+
+def test_query_without_a_cdp_searches_every_cdp(hash_index):
+    engine = QueryEngine(hash_index)
+    query = "How do I configure a destination?"
+
+    results = engine.search(query, top_k=10)
+
+    assert [result['chunk_text'] for result in results] == [text for text, _ in exact_top_k(hash_index, query, 10)]
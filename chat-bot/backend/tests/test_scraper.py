@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+import hashlib
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from scraper import DocumentationScraper, CrawlLimits, HTML_PARSER, parse_page
+from benchmark_extractor import legacy_parse_page
+
+LAST_MODIFIED = 'Mon, 05 Oct 2026 12:00:00 GMT'
+
+def page(title: str, *links: str) -> str:
+    anchors = ''.join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+    return f"<html><head><title>{title}</title></head><body><main><h1>{title}</h1>" \
+           f"<p>About {title}.</p><ul>{anchors}</ul></main></body></html>"
+
+class DocsSite:
+    """Pages served by the test server, the responses to fail them with first, and the requests seen"""
+
+    def __init__(self, pages):
+        self.pages = pages  # path -> html
+        self.failures = {}  # path -> [(status, headers)] served before the page
+        self.requests = []  # (path, monotonic time, If-None-Match)
+        self.lock = threading.Lock()
+
+    def paths(self):
+        return [path for path, _, _ in self.requests]
+
+    def times(self, path):
+        return [at for requested, at, _ in self.requests if requested == path]
+
+class DocsHandler(BaseHTTPRequestHandler):
+    site = None
+
+    def do_GET(self):
+        site = self.site
+        with site.lock:
+            site.requests.append((self.path, time.monotonic(), self.headers.get('If-None-Match')))
+            failures = site.failures.get(self.path)
+            failure = failures.pop(0) if failures else None
+            html = site.pages.get(self.path)
+
+        if failure is not None:
+            status, headers = failure
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if html is None:
+            self.send_error(404)
+            return
+
+        etag = '"' + hashlib.sha1(html.encode('utf-8')).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def docs_site():
+    """A local docs site whose index links every page, with pages linking each other and back"""
+    site = DocsSite({
+        '/docs/': page('Index', '/docs/sources', '/docs/destinations', '/docs/sources#setup', 'tracking'),
+        '/docs/sources': page('Sources', '/docs/', '/docs/destinations', '/docs/tracking', '/blog/'),
+        '/docs/destinations': page('Destinations', '/docs/sources', '/docs/sources#setup', '/docs/destinations'),
+        '/docs/tracking': page('Tracking', '/docs/', '/docs/sources', '/docs/tracking#events'),
+    })
+    handler = type('Handler', (DocsHandler,), {'site': site})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.base_url = f"http://127.0.0.1:{server.server_address[1]}/docs/"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+def make_scraper(site, tmp_path, **options) -> DocumentationScraper:
+    options.setdefault('backoff', 0.05)
+    return DocumentationScraper(site.base_url, str(tmp_path), 'segment', **options)
+
+def unlimited() -> CrawlLimits:
+    return CrawlLimits(per_host_concurrency=2, per_host_rate=0)
+
+def read_changes(tmp_path):
+    with open(tmp_path / 'segment' / 'changes.json', encoding='utf-8') as f:
+        return json.load(f)
+
+def test_each_page_is_fetched_once_however_often_it_is_linked(docs_site, tmp_path):
+    docs = make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+
+    # Fragments, self links and back links don't refetch a page; /blog/ is outside the docs
+    assert sorted(docs_site.paths()) == ['/docs/', '/docs/destinations', '/docs/sources', '/docs/tracking']
+    assert [doc['title'] for doc in docs] == ['Index', 'Sources', 'Destinations', 'Tracking']
+    assert sorted(read_changes(tmp_path)['added']) == sorted(docs_site.base_url + path for path in
+                                                             ('', 'sources', 'destinations', 'tracking'))
+
+def test_transient_failures_are_retried_with_backoff(docs_site, tmp_path):
+    docs_site.failures['/docs/sources'] = [(503, {}), (503, {})]
+    docs_site.failures['/docs/tracking'] = [(429, {'Retry-After': '1'})]
+
+    make_scraper(docs_site, tmp_path, max_retries=3, backoff=0.05).scrape(limits=unlimited())
+
+    # Backoff doubles per attempt with jitter of +-50%: 0.025-0.075s, then 0.05-0.15s
+    sources = docs_site.times('/docs/sources')
+    assert len(sources) == 3
+    assert sources[1] - sources[0] >= 0.025
+    assert sources[2] - sources[1] >= 0.05
+    # Retry-After overrides a shorter backoff
+    tracking = docs_site.times('/docs/tracking')
+    assert len(tracking) == 2
+    assert tracking[1] - tracking[0] >= 1.0
+    changes = read_changes(tmp_path)
+    assert changes['failed'] == []
+    assert len(changes['added']) == 4
+
+def test_page_failing_every_retry_is_reported(docs_site, tmp_path):
+    docs_site.failures['/docs/tracking'] = [(503, {})] * 3
+
+    docs = make_scraper(docs_site, tmp_path, max_retries=2, backoff=0.01).scrape(limits=unlimited())
+
+    assert len(docs_site.times('/docs/tracking')) == 3
+    assert read_changes(tmp_path)['failed'] == [docs_site.base_url + 'tracking']
+    assert len(docs) == 3
+
+def test_per_host_rate_spaces_requests(docs_site, tmp_path):
+    limits = CrawlLimits(per_host_concurrency=2, per_host_rate=10.0, burst=1)
+
+    make_scraper(docs_site, tmp_path).scrape(limits=limits)
+
+    # One token every 0.1s, and the first is available immediately; arrival adds some jitter
+    times = sorted(at for _, at, _ in docs_site.requests)
+    assert len(times) == 4
+    assert all(later - earlier >= 0.075 for earlier, later in zip(times, times[1:]))
+    assert times[-1] - times[0] >= 0.28
+
+def test_burst_lets_requests_through_back_to_back(docs_site, tmp_path):
+    limits = CrawlLimits(per_host_concurrency=2, per_host_rate=2.0, burst=4)
+
+    started = time.monotonic()
+    make_scraper(docs_site, tmp_path).scrape(limits=limits)
+
+    # A full bucket covers every page, so the 0.5s refill never comes into it
+    assert time.monotonic() - started < 0.5
+
+def test_recrawl_of_unchanged_site_gets_304s_and_no_changes(docs_site, tmp_path):
+    make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+    docs_site.requests.clear()
+
+    docs = make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+
+    # Every page is fetched conditionally and none is resent
+    assert len(docs_site.requests) == 4
+    assert all(etag is not None for _, _, etag in docs_site.requests)
+    changes = read_changes(tmp_path)
+    assert (changes['run'], changes['last_change_run']) == (2, 1)
+    assert (changes['added'], changes['changed'], changes['removed']) == ([], [], [])
+    assert changes['unchanged'] == 4
+    assert [doc['title'] for doc in docs] == ['Index', 'Sources', 'Destinations', 'Tracking']
+
+def test_recrawl_reports_changed_and_removed_pages(docs_site, tmp_path):
+    make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+    docs_site.pages['/docs/destinations'] = page('Destinations v2', '/docs/sources')
+    docs_site.pages['/docs/'] = page('Index', '/docs/sources', '/docs/destinations')
+    docs_site.pages['/docs/sources'] = page('Sources', '/docs/', '/docs/destinations')
+
+    make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+
+    changes = read_changes(tmp_path)
+    assert changes['changed'] == sorted(docs_site.base_url + path for path in ('', 'destinations', 'sources'))
+    assert changes['removed'] == [docs_site.base_url + 'tracking']
+    assert changes['last_change_run'] == 2
+    assert sorted(path.name for path in (tmp_path / 'segment').glob('[0-9]*.json')) == \
+        ['0001.json', '0002.json', '0003.json']
+
+class Interrupted(Exception):
+    pass
+
+def test_interrupted_crawl_resumes_without_refetching(docs_site, tmp_path, monkeypatch):
+    scraper = make_scraper(docs_site, tmp_path, checkpoint_every=1)
+    scrape_page = scraper.scrape_page
+    scraped = []
+
+    async def interrupt_third_page(*args):
+        if len(scraped) == 2:
+            raise Interrupted()
+        scraped.append(args[2])
+        return await scrape_page(*args)
+    monkeypatch.setattr(scraper, 'scrape_page', interrupt_third_page)
+    # One worker, so the crawl stops with nothing else in flight
+    with pytest.raises(Interrupted):
+        scraper.scrape(limits=CrawlLimits(per_host_concurrency=1, per_host_rate=0))
+    assert sorted(docs_site.paths()) == ['/docs/', '/docs/sources']
+
+    docs = make_scraper(docs_site, tmp_path).scrape(limits=unlimited())
+
+    assert sorted(docs_site.paths()) == ['/docs/', '/docs/destinations', '/docs/sources', '/docs/tracking']
+    assert [doc['title'] for doc in docs] == ['Index', 'Sources', 'Destinations', 'Tracking']
+    changes = read_changes(tmp_path)
+    assert changes['run'] == 1
+    assert len(changes['added']) == 4
+
+PAGE_URL = 'https://docs.example.com/docs/page'
+
+FLAT_PAGES = [
+    page('Sources', '/docs/', '/docs/destinations#setup', 'tracking'),
+    '<html><head><title>Chrome</title><script>var x = 1;</script></head><body><header><a href="/">Home</a></header>'
+    '<nav><a href="/docs/nav">Nav</a></nav><div class="sidebar"><p>Side</p></div><article><h2>Setup</h2>'
+    '<p>Connect a <a href="/docs/sources">source</a> first.</p><ol><li>Open settings</li><li>Save</li></ol>'
+    '<pre>npm install</pre></article><footer><p>Copyright</p></footer></body></html>',
+    '<html><body><h1>No main element</h1><p>The body is the content.</p><ul><li>One</li></ul></body></html>',
+]
+
+@pytest.mark.parametrize('html', FLAT_PAGES)
+def test_single_walk_extracts_pages_without_nested_blocks_like_the_old_extractor(html):
+    assert parse_page(html, PAGE_URL) == legacy_parse_page(html, PAGE_URL, HTML_PARSER)
+
+def test_nested_blocks_are_written_once():
+    html = ('<html><head><title>Nested</title></head><body><main><h2>Setup</h2>'
+            '<p>Call <code>analytics.track</code> from the <a href="/docs/sources#web">source</a>.</p>'
+            '<ul><li><p>Step 1</p><ul><li>Option a</li></ul></li></ul><pre><code>x = 1</code></pre></main></body></html>')
+
+    page_data, links = parse_page(html, PAGE_URL)
+
+    # The old extractor repeated the inline code, the outer item's text and the code block
+    assert page_data['content'] == '## Setup\nCallanalytics.trackfrom thesource.\n- Step 1\n- Option a\n\n```\nx = 1\n```'
+    legacy_data, legacy_links = legacy_parse_page(html, PAGE_URL, HTML_PARSER)
+    assert (page_data['title'], links) == (legacy_data['title'], legacy_links) == \
+        ('Nested', ['https://docs.example.com/docs/sources'])
+
+def test_deeply_nested_page_does_not_hit_the_recursion_limit():
+    html = f"<html><body>{'<div>' * 3000}<p>Deep</p>{'</div>' * 3000}</body></html>"
+
+    assert parse_page(html, PAGE_URL) == ({'title': 'No Title', 'content': 'Deep'}, [])
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import pytest
+from worker_pool import QueryWorkerPool, PoolSaturatedError
+
+def test_full_pool_rejects_until_a_job_finishes():
+    pool = QueryWorkerPool(max_workers=1, max_pending=2, timeout=5.0)
+    released = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(pool.run(released.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(sum, [1, 2])
+        released.set()
+        await asyncio.gather(*blocked)
+        return await pool.run(sum, [1, 2])
+
+    assert asyncio.run(scenario()) == 3
+    assert pool.stats() == {'max_workers': 1, 'max_pending': 2, 'pending': 0, 'completed': 3,
+                            'rejected': 1, 'timed_out': 0}
+    pool.shutdown()
+
+def test_timed_out_job_holds_its_slot_until_it_finishes():
+    pool = QueryWorkerPool(max_workers=1, max_pending=1, timeout=5.0)
+    released = threading.Event()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(released.wait, 5, timeout=0.05)
+        # Still running on the pool thread, so it still counts against max_pending
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(sum, [1, 2])
+        released.set()
+        while pool.stats()['pending']:
+            await asyncio.sleep(0.01)
+        return await pool.run(sum, [1, 2])
+
+    assert asyncio.run(scenario()) == 3
+    stats = pool.stats()
+    assert (stats['timed_out'], stats['rejected'], stats['completed']) == (1, 1, 2)
+    pool.shutdown()
+
+def test_queued_job_that_times_out_never_runs():
+    pool = QueryWorkerPool(max_workers=1, max_pending=4, timeout=5.0)
+    released = threading.Event()
+    ran = []
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(released.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(ran.append, 'queued', timeout=0.05)
+        released.set()
+        await running
+
+    asyncio.run(scenario())
+    assert ran == []
+    assert pool.stats()['pending'] == 0
+    pool.shutdown()